@@ -0,0 +1,434 @@
+#!/usr/bin/env python
+"""A lightweight stand-in for the SExtractor executable.
+
+The fake executable understands the subset of the SExtractor command line
+that SEW uses: the ``-dd``, ``-dp`` and ``-v`` probes, single, dual-image and
+multi-extension inputs, ``-KEY value`` configuration overrides, the
+ASCII_HEAD, FITS_1.0 and FITS_LDAC catalog types (written to a file or to
+STDOUT), and the BACKGROUND, BACKGROUND_RMS, -BACKGROUND, OBJECTS,
+SEGMENTATION and APERTURES check-images.
+
+Detection is a simple thresholded connected-component labeling, so the
+catalogs are plausible but are NOT meant to reproduce SExtractor's
+measurements. The point is to exercise the wrapper, not the science.
+
+Set FAKE_SEXTRACTOR_DELAY to a number of seconds to add a fixed run time,
+which is useful to emulate the cost of the real executable.
+
+Set FAKE_SEXTRACTOR_CANNED to a directory to emit canned outputs: the first
+run with a given catalog type, parameter file and check-image types stores
+its catalog and check-images there, and later runs only copy them. Canned
+runs import nothing but the standard library, so they measure the overhead
+of the wrapper alone (the outputs do not depend on the input image).
+
+Usage:
+    export SE_EXECUTABLE="python /path/to/fake_sextractor.py"
+"""
+import hashlib
+import importlib.util
+import io
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+
+VERSION = "2.25.0-fake"
+DEFAULT_CONFIG_PATH = (
+    Path(importlib.util.find_spec("sew").origin).parent / "input" / "default.config"
+)
+
+PARAM_DEFINITIONS = {
+    "NUMBER": ("J", "Running object number", ""),
+    "X_IMAGE": ("D", "Object position along x", "pixel"),
+    "Y_IMAGE": ("D", "Object position along y", "pixel"),
+    "XWIN_IMAGE": ("D", "Windowed position estimate along x", "pixel"),
+    "YWIN_IMAGE": ("D", "Windowed position estimate along y", "pixel"),
+    "XPEAK_IMAGE": ("J", "x-coordinate of the brightest pixel", "pixel"),
+    "YPEAK_IMAGE": ("J", "y-coordinate of the brightest pixel", "pixel"),
+    "XMIN_IMAGE": ("J", "Minimum x-coordinate among detected pixels", "pixel"),
+    "YMIN_IMAGE": ("J", "Minimum y-coordinate among detected pixels", "pixel"),
+    "XMAX_IMAGE": ("J", "Maximum x-coordinate among detected pixels", "pixel"),
+    "YMAX_IMAGE": ("J", "Maximum y-coordinate among detected pixels", "pixel"),
+    "FLUX_AUTO": ("E", "Flux within a Kron-like elliptical aperture", "count"),
+    "FLUXERR_AUTO": ("E", "RMS error for AUTO flux", "count"),
+    "MAG_AUTO": ("E", "Kron-like elliptical aperture magnitude", "mag"),
+    "FLUX_ISO": ("E", "Isophotal flux", "count"),
+    "FLUX_APER": ("E", "Flux vector within fixed circular aperture(s)", "count"),
+    "FLUX_RADIUS": ("E", "Fraction-of-light radii", "pixel"),
+    "FWHM_IMAGE": ("E", "FWHM assuming a gaussian core", "pixel"),
+    "A_IMAGE": ("E", "Profile RMS along major axis", "pixel"),
+    "B_IMAGE": ("E", "Profile RMS along minor axis", "pixel"),
+    "THETA_IMAGE": ("E", "Position angle (CCW/x)", "deg"),
+    "ELLIPTICITY": ("E", "1 - B_IMAGE/A_IMAGE", ""),
+    "ISOAREA_IMAGE": ("J", "Isophotal area above Analysis threshold", "pixel**2"),
+    "ISO0": ("J", "Isophotal area at level 0", "pixel**2"),
+    "ISO1": ("J", "Isophotal area at level 1", "pixel**2"),
+    "ISO2": ("J", "Isophotal area at level 2", "pixel**2"),
+    "ISO3": ("J", "Isophotal area at level 3", "pixel**2"),
+    "BACKGROUND": ("E", "Background at centroid position", "count"),
+    "CLASS_STAR": ("E", "S/G classifier output", ""),
+    "FLAGS": ("I", "Extraction flags", ""),
+}
+
+
+def _import_numerical_modules():
+    """Import numpy, astropy and scipy, which canned runs do not need."""
+    global np, fits, ndimage
+    import numpy as np
+    from astropy.io import fits
+    from scipy import ndimage
+
+
+def _config_lines():
+    lines = ["# Default configuration file for SExtractor " + VERSION]
+    for line in DEFAULT_CONFIG_PATH.read_text().splitlines():
+        if line.strip():
+            lines.append(line)
+    return lines
+
+
+def _parse_args(argv):
+    images = []
+    options = {}
+    config = None
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg == "-c":
+            config = argv[i + 1]
+            i += 2
+        elif arg.startswith("-") and len(arg) > 1 and not arg[1].isdigit():
+            values = []
+            i += 1
+            while i < len(argv) and not (
+                argv[i].startswith("-") and len(argv[i]) > 1 and argv[i][1].isalpha()
+            ):
+                values.append(argv[i])
+                i += 1
+            options[arg[1:].upper()] = " ".join(values)
+        else:
+            images.extend(arg.split(","))
+            i += 1
+    if config is not None:
+        for line in Path(config).read_text().splitlines():
+            line = line.split("#")[0].split()
+            if len(line) >= 2 and line[0] not in options:
+                options[line[0]] = " ".join(line[1:])
+    return images, options
+
+
+def _read_params(options):
+    params = []
+    for line in Path(options["PARAMETERS_NAME"]).read_text().splitlines():
+        line = line.split("#")[0].strip()
+        if not line:
+            continue
+        if "(" in line:
+            name, size = line[:-1].split("(")
+            params.append((name, int(size)))
+        else:
+            params.append((line, 1))
+    return params
+
+
+def _image_hdus(path):
+    hdul = fits.open(path)
+    return [
+        hdu
+        for hdu in hdul
+        if hdu.is_image and hdu.data is not None and hdu.data.ndim == 2
+    ]
+
+
+def _background(image, options):
+    back_type = options.get("BACK_TYPE", "AUTO").upper()
+    if back_type == "MANUAL":
+        back = np.full(
+            image.shape,
+            float(options.get("BACK_VALUE", "0").split(",")[0]),
+            dtype=np.float32,
+        )
+    else:
+        size = int(options.get("BACK_SIZE", "64").split(",")[0])
+        ny = max(1, image.shape[0] // size)
+        nx = max(1, image.shape[1] // size)
+        meshes = np.zeros((ny, nx))
+        for j in range(ny):
+            for i in range(nx):
+                meshes[j, i] = np.median(
+                    image[j * size : (j + 1) * size, i * size : (i + 1) * size]
+                )
+        zoom = (image.shape[0] / ny, image.shape[1] / nx)
+        back = ndimage.zoom(meshes, zoom, order=1, mode="nearest", grid_mode=True)[
+            : image.shape[0], : image.shape[1]
+        ]
+        back = back.astype(np.float32)
+    mad = np.median(np.abs(image - np.median(image)))
+    rms = np.full(image.shape, max(1.4826 * mad, 1e-6), dtype=np.float32)
+    return back, rms
+
+
+def _detect(image, options):
+    back, rms = _background(image, options)
+    sub = image - back
+    weight_type = options.get("WEIGHT_TYPE", "NONE").upper()
+    if weight_type == "MAP_RMS" and "WEIGHT_IMAGE" in options:
+        rms = fits.getdata(options["WEIGHT_IMAGE"].split(",")[0]).astype(np.float32)
+    thresh = float(options.get("DETECT_THRESH", "1.5").split(",")[0])
+    if options.get("THRESH_TYPE", "RELATIVE").upper() == "RELATIVE":
+        above = sub > thresh * rms
+    else:
+        above = sub > thresh
+    segmap, nobj = ndimage.label(above)
+    minarea = int(options.get("DETECT_MINAREA", "5"))
+    if nobj > 0:
+        areas = ndimage.sum_labels(
+            np.ones_like(segmap), segmap, index=np.arange(1, nobj + 1)
+        )
+        keep = np.flatnonzero(areas >= minarea) + 1
+        relabel = np.zeros(nobj + 1, dtype=np.int32)
+        relabel[keep] = np.arange(1, len(keep) + 1)
+        segmap = relabel[segmap]
+        nobj = len(keep)
+    return sub, back, rms, segmap, nobj
+
+
+def _measure(meas, segmap, nobj, params):
+    index = np.arange(1, nobj + 1)
+    yy, xx = np.indices(segmap.shape)
+    w = np.clip(meas, 0, None)
+    flux = ndimage.sum_labels(meas, segmap, index)
+    wsum = ndimage.sum_labels(w, segmap, index) + 1e-12
+    area = ndimage.sum_labels(np.ones_like(segmap), segmap, index)
+    x = ndimage.sum_labels(w * xx, segmap, index) / wsum
+    y = ndimage.sum_labels(w * yy, segmap, index) / wsum
+    x2 = ndimage.sum_labels(w * xx**2, segmap, index) / wsum - x**2
+    y2 = ndimage.sum_labels(w * yy**2, segmap, index) / wsum - y**2
+    xy = ndimage.sum_labels(w * xx * yy, segmap, index) / wsum - x * y
+    x2 = np.clip(x2, 1 / 12, None)
+    y2 = np.clip(y2, 1 / 12, None)
+    t1 = (x2 + y2) / 2
+    t2 = np.sqrt(((x2 - y2) / 2) ** 2 + xy**2)
+    a = np.sqrt(t1 + t2)
+    b = np.sqrt(np.clip(t1 - t2, 1e-6, None))
+    theta = np.degrees(0.5 * np.arctan2(2 * xy, x2 - y2))
+    slices = ndimage.find_objects(segmap, max_label=nobj) if nobj else []
+    values = {
+        "NUMBER": index,
+        "X_IMAGE": x + 1,
+        "Y_IMAGE": y + 1,
+        "XWIN_IMAGE": x + 1,
+        "YWIN_IMAGE": y + 1,
+        "XPEAK_IMAGE": np.round(x).astype(int) + 1,
+        "YPEAK_IMAGE": np.round(y).astype(int) + 1,
+        "XMIN_IMAGE": np.array([s[1].start + 1 for s in slices], dtype=int),
+        "YMIN_IMAGE": np.array([s[0].start + 1 for s in slices], dtype=int),
+        "XMAX_IMAGE": np.array([s[1].stop for s in slices], dtype=int),
+        "YMAX_IMAGE": np.array([s[0].stop for s in slices], dtype=int),
+        "FLUX_AUTO": flux,
+        "FLUX_ISO": flux,
+        "MAG_AUTO": -2.5 * np.log10(np.clip(flux, 1e-12, None)),
+        "FLUX_RADIUS": np.sqrt(area / np.pi),
+        "FWHM_IMAGE": 2.3548 * np.sqrt((a**2 + b**2) / 2),
+        "A_IMAGE": a,
+        "B_IMAGE": b,
+        "THETA_IMAGE": theta,
+        "ELLIPTICITY": 1 - b / a,
+        "ISOAREA_IMAGE": area,
+        "ISO0": area,
+    }
+    columns = []
+    for name, size in params:
+        fmt, descr, unit = PARAM_DEFINITIONS.get(name, ("E", "Fake parameter", ""))
+        data = np.asarray(values.get(name, np.zeros(nobj)))
+        if size > 1:
+            data = np.repeat(data[:, None], size, axis=1)
+            fmt = f"{size}{fmt}"
+        columns.append(
+            fits.Column(name=name, format=fmt, unit=unit or None, array=data)
+        )
+    return columns
+
+
+def _ascii_catalog(columns):
+    header = []
+    number = 1
+    for col in columns:
+        _, descr, unit = PARAM_DEFINITIONS.get(col.name, ("E", "Fake parameter", ""))
+        unit_str = f" [{unit}]" if unit else ""
+        header.append(f"#{number:4d} {col.name:22s} {descr}{unit_str}")
+        number += col.array.shape[1] if col.array.ndim > 1 else 1
+    nrows = len(columns[0].array) if columns else 0
+    body = []
+    for i in range(nrows):
+        row = []
+        for col in columns:
+            values = np.atleast_1d(col.array[i])
+            for v in values:
+                row.append(
+                    f"{v:d}" if np.issubdtype(values.dtype, np.integer) else f"{v:.7e}"
+                )
+        body.append(" ".join(row))
+    return ("\n".join(header + body) + "\n").encode()
+
+
+def _fits_catalog(tables, image_headers, catalog_type):
+    hdus = [fits.PrimaryHDU()]
+    for columns, image_header in zip(tables, image_headers):
+        if catalog_type == "FITS_LDAC":
+            text = image_header.tostring(sep="", endcard=True, padding=False)
+            imhead = fits.BinTableHDU.from_columns(
+                [
+                    fits.Column(
+                        name="Field Header Card",
+                        format=f"{len(text)}A",
+                        array=np.array([text]),
+                    )
+                ]
+            )
+            imhead.header["EXTNAME"] = "LDAC_IMHEAD"
+            hdus.append(imhead)
+            objects = fits.BinTableHDU.from_columns(columns)
+            objects.header["EXTNAME"] = "LDAC_OBJECTS"
+            hdus.append(objects)
+        else:
+            hdus.append(fits.BinTableHDU.from_columns(columns))
+    buffer = io.BytesIO()
+    fits.HDUList(hdus).writeto(buffer)
+    return buffer.getvalue()
+
+
+CHECKIMAGE_TYPES = [
+    "BACKGROUND",
+    "BACKGROUND_RMS",
+    "-BACKGROUND",
+    "OBJECTS",
+    "-OBJECTS",
+    "SEGMENTATION",
+    "APERTURES",
+    "FILTERED",
+]
+
+
+def _canned_key(options, check_types, images):
+    sha = hashlib.sha256()
+    sha.update(Path(options["PARAMETERS_NAME"]).read_bytes())
+    key = [options.get("CATALOG_TYPE", "ASCII_HEAD").upper(), str(len(images))]
+    sha.update(" ".join(key + check_types).encode())
+    return sha.hexdigest()[:16]
+
+
+def _extract(images, options, check_files, catalog_type):
+    """Detect and measure the sources, write the check-images, return the catalog."""
+    params = _read_params(options)
+    check_hdus = {name: [fits.PrimaryHDU()] for _, name in check_files}
+
+    tables = []
+    headers = []
+    det_hdus = _image_hdus(images[0])
+    meas_hdus = _image_hdus(images[-1])
+    for det_hdu, meas_hdu in zip(det_hdus, meas_hdus):
+        det = det_hdu.data.astype(np.float32)
+        meas = meas_hdu.data.astype(np.float32)
+        sub, back, rms, segmap, nobj = _detect(det, options)
+        meas_sub = meas - _background(meas, options)[0]
+        tables.append(_measure(meas_sub, segmap, nobj, params))
+        headers.append(meas_hdu.header)
+        products = {
+            "BACKGROUND": back,
+            "BACKGROUND_RMS": rms,
+            "-BACKGROUND": sub,
+            "OBJECTS": np.where(segmap > 0, sub, 0).astype(np.float32),
+            "-OBJECTS": np.where(segmap > 0, 0, sub).astype(np.float32),
+            "SEGMENTATION": segmap.astype(np.int32),
+            "APERTURES": sub,
+            "FILTERED": sub,
+        }
+        for check_type, check_name in check_files:
+            check_hdus[check_name].append(fits.ImageHDU(products[check_type]))
+
+    for _, check_name in check_files:
+        hdus = check_hdus[check_name]
+        if len(hdus) == 2:
+            hdus = [fits.PrimaryHDU(hdus[1].data)]
+        fits.HDUList(hdus).writeto(check_name, overwrite=True)
+
+    if catalog_type == "NONE":
+        return b""
+    if catalog_type.startswith("ASCII"):
+        return _ascii_catalog(tables[0]) if tables else b""
+    return _fits_catalog(tables, headers, catalog_type)
+
+
+def _write_catalog(content, catalog_type, options):
+    if catalog_type == "NONE":
+        return 0
+    catalog_name = options.get("CATALOG_NAME", "test.cat")
+    if catalog_name.upper() == "STDOUT":
+        sys.stdout.buffer.write(content)
+        sys.stdout.buffer.flush()
+    else:
+        Path(catalog_name).write_bytes(content)
+    return 0
+
+
+def main(argv):
+    if not argv:
+        sys.stderr.write(
+            "SYNTAX: fake_sextractor <image> [<image2>][-c <configuration_file>][-<keyword> <value>]\n"
+        )
+        return 1
+    if argv[0] == "-dd":
+        sys.stdout.write("\n".join(_config_lines()) + "\n")
+        return 0
+    if argv[0] == "-dp":
+        for name, (_, descr, unit) in PARAM_DEFINITIONS.items():
+            unit_str = f" [{unit}]" if unit else ""
+            sys.stdout.write(f"#{name:24s}{descr}{unit_str}\n")
+        return 0
+    if argv[0] in ("-v", "--version"):
+        sys.stdout.write(f"SExtractor version {VERSION} (2024-01-01)\n")
+        return 0
+
+    time.sleep(float(os.environ.get("FAKE_SEXTRACTOR_DELAY", 0)))
+    images, options = _parse_args(argv)
+    detection_path = images[0]
+    measurement_path = images[-1]
+    if not Path(detection_path).is_file() or not Path(measurement_path).is_file():
+        sys.stderr.write(
+            f"> \n*Error*: {detection_path} not found, No such file or directory\n"
+        )
+        return 1
+    check_types = [
+        t.strip().upper() for t in options.get("CHECKIMAGE_TYPE", "NONE").split(",")
+    ]
+    check_names = [
+        n.strip() for n in options.get("CHECKIMAGE_NAME", "check.fits").split(",")
+    ]
+    check_files = [
+        (t, n) for t, n in zip(check_types, check_names) if t in CHECKIMAGE_TYPES
+    ]
+    catalog_type = options.get("CATALOG_TYPE", "ASCII_HEAD").upper()
+
+    canned_path = os.environ.get("FAKE_SEXTRACTOR_CANNED")
+    if canned_path is not None:
+        canned_entry = Path(canned_path) / _canned_key(options, check_types, images)
+        if canned_entry.is_dir():
+            for i, (_, check_name) in enumerate(check_files):
+                shutil.copyfile(canned_entry / f"check_{i}.fits", check_name)
+            content = (canned_entry / "catalog").read_bytes()
+            return _write_catalog(content, catalog_type, options)
+
+    _import_numerical_modules()
+    content = _extract(images, options, check_files, catalog_type)
+    if canned_path is not None:
+        canned_entry.mkdir(parents=True, exist_ok=True)
+        for i, (_, check_name) in enumerate(check_files):
+            shutil.copyfile(check_name, canned_entry / f"check_{i}.fits")
+        (canned_entry / "catalog").write_bytes(content)
+    return _write_catalog(content, catalog_type, options)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+"""Time SEW on synthetic fields of several sizes and source densities.
+
+Each stage of sextractor.run (writing the temporary fits file, running the
+SExtractor subprocess, parsing the catalog, and cleaning up) is timed
+separately, as are the full run and the segmentation helpers. The median
+time of each stage is printed and can be saved to a json file, which can
+then be used as the baseline of a later benchmark to check for regressions.
+
+Use --fake to run with the fake SExtractor executable in this directory on
+machines without SExtractor. Add --canned to make the fake executable emit
+canned outputs, so that the timings measure the overhead of the wrapper.
+
+Examples:
+    python benchmarks/run_benchmarks.py --fake --canned --output baseline.json
+    python benchmarks/run_benchmarks.py --fake --canned --baseline baseline.json
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+BENCHMARK_PATH = Path(__file__).resolve().parent
+FAKE_SE_EXECUTABLE = f"{sys.executable} {BENCHMARK_PATH / 'fake_sextractor.py'}"
+
+# do not flag regressions of stages that take less than this many seconds
+MIN_REGRESSION_SECONDS = 0.005
+
+
+def _time_call(func: Callable, repeat: int) -> float:
+    """Return the median run time of func in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def time_run_stages(pixels, header, tmp_path: Path, repeat: int) -> Dict[str, float]:
+    """Time the stages of sextractor.run on an image using its run reports."""
+    import sew
+
+    stage_names = dict(
+        stage="write", sextractor="subprocess", parse="parse", cleanup="cleanup"
+    )
+    stages: Dict[str, List[float]] = {name: [] for name in stage_names.values()}
+    for _ in range(repeat):
+        report = sew.RunReport()
+        sew.run(pixels, header=header, tmp_path=tmp_path, report=report)
+        for stage, name in stage_names.items():
+            stages[name].append(report.stage_seconds[stage])
+    return {stage: statistics.median(times) for stage, times in stages.items()}
+
+
+def time_helpers(pixels, header, tmp_path: Path, repeat: int) -> Dict[str, float]:
+    """Time the full run and the segmentation helpers on an image."""
+    import sew
+    from sew import segmentation
+
+    mask = segmentation.create_sextractor_object_mask(
+        pixels, tmp_path=tmp_path, dilate_npix=0
+    )
+    return {
+        "run": _time_call(
+            lambda: sew.run(pixels, header=header, tmp_path=tmp_path), repeat
+        ),
+        "object_mask": _time_call(
+            lambda: segmentation.create_sextractor_object_mask(
+                pixels, tmp_path=tmp_path
+            ),
+            repeat,
+        ),
+        "sky_model": _time_call(
+            lambda: segmentation.create_sextractor_sky_model(pixels, tmp_path=tmp_path),
+            repeat,
+        ),
+        "products": _time_call(
+            lambda: segmentation.create_sextractor_products(pixels, tmp_path=tmp_path),
+            repeat,
+        ),
+        "dilate": _time_call(lambda: segmentation.dilate_object_mask(mask, 5), repeat),
+        "numpy_sky_model": _time_call(
+            lambda: sew.background.create_sky_model(pixels, mask=mask), repeat
+        ),
+    }
+
+
+def run_benchmarks(
+    sizes: List[int],
+    densities: List[float],
+    repeat: int,
+    tmp_path: Path,
+    canned: bool = False,
+) -> List[dict]:
+    """Run all benchmarks and return one result per field and stage."""
+    from synthetic import make_field
+
+    results = []
+    for size in sizes:
+        for density in densities:
+            pixels, header = make_field(size, density)
+            scratch_path = Path(tempfile.mkdtemp(prefix="sew_bench_", dir=tmp_path))
+            if canned:
+                # the canned outputs only fit images of this size
+                os.environ["FAKE_SEXTRACTOR_CANNED"] = str(scratch_path / "canned")
+            try:
+                timings = time_run_stages(pixels, header, scratch_path, repeat)
+                timings.update(time_helpers(pixels, header, scratch_path, repeat))
+            finally:
+                shutil.rmtree(scratch_path, ignore_errors=True)
+            for stage, seconds in timings.items():
+                results.append(
+                    dict(size=size, density=density, stage=stage, seconds=seconds)
+                )
+                print(f"{size:>6d} {density:>9.1e} {stage:>12s} {seconds:>10.4f} s")
+    return results
+
+
+def find_regressions(
+    results: List[dict], baseline: List[dict], tolerance: float
+) -> List[str]:
+    """Compare results with a baseline and describe the stages that got slower."""
+    baseline_seconds = {
+        (b["size"], b["density"], b["stage"]): b["seconds"] for b in baseline
+    }
+    regressions = []
+    for r in results:
+        key = (r["size"], r["density"], r["stage"])
+        if key not in baseline_seconds:
+            continue
+        old = baseline_seconds[key]
+        if r["seconds"] > old * (1 + tolerance) + MIN_REGRESSION_SECONDS:
+            regressions.append(
+                f"{r['stage']} (size={r['size']}, density={r['density']:.1e}): "
+                f"{old:.4f} s -> {r['seconds']:.4f} s"
+            )
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="512,1024,2048")
+    parser.add_argument("--densities", default="5e-4,2e-3")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--tmp-path", default="/tmp")
+    parser.add_argument(
+        "--fake", action="store_true", help="use the fake SExtractor executable"
+    )
+    parser.add_argument(
+        "--canned",
+        action="store_true",
+        help="make the fake executable emit canned outputs",
+    )
+    parser.add_argument("--output", help="save the results to this json file")
+    parser.add_argument("--baseline", help="json results to check for regressions")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="allowed fractional slowdown relative to the baseline",
+    )
+    args = parser.parse_args(argv)
+
+    if args.fake:
+        os.environ["SE_EXECUTABLE"] = FAKE_SE_EXECUTABLE
+    sys.path.insert(0, str(BENCHMARK_PATH))
+
+    results = run_benchmarks(
+        [int(s) for s in args.sizes.split(",")],
+        [float(d) for d in args.densities.split(",")],
+        args.repeat,
+        Path(args.tmp_path),
+        args.canned,
+    )
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if len(regressions) > 0:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
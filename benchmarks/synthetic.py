@@ -0,0 +1,90 @@
+"""Synthetic star and galaxy fields for benchmarking SEW."""
+from typing import Tuple
+
+import numpy as np
+from astropy.io import fits
+
+__all__ = ["make_field"]
+
+
+def _add_sources(
+    image: np.ndarray,
+    x: np.ndarray,
+    y: np.ndarray,
+    flux: np.ndarray,
+    sigma_x: np.ndarray,
+    sigma_y: np.ndarray,
+    theta: np.ndarray,
+):
+    """Add elliptical Gaussian sources to an image in place."""
+    ny, nx = image.shape
+    for i in range(len(x)):
+        half_size = int(np.ceil(5 * max(sigma_x[i], sigma_y[i])))
+        x0, x1 = max(int(x[i]) - half_size, 0), min(int(x[i]) + half_size + 1, nx)
+        y0, y1 = max(int(y[i]) - half_size, 0), min(int(y[i]) + half_size + 1, ny)
+        if x0 >= x1 or y0 >= y1:
+            continue
+        yy, xx = np.mgrid[y0:y1, x0:x1]
+        dx, dy = xx - x[i], yy - y[i]
+        cos, sin = np.cos(theta[i]), np.sin(theta[i])
+        u = (dx * cos + dy * sin) / sigma_x[i]
+        v = (dy * cos - dx * sin) / sigma_y[i]
+        norm = flux[i] / (2 * np.pi * sigma_x[i] * sigma_y[i])
+        image[y0:y1, x0:x1] += norm * np.exp(-0.5 * (u**2 + v**2))
+
+
+def make_field(
+    size: int = 1024,
+    density: float = 1e-3,
+    galaxy_fraction: float = 0.3,
+    sky: float = 100.0,
+    noise: float = 5.0,
+    seed: int = 0,
+) -> Tuple[np.ndarray, fits.Header]:
+    """Make a synthetic field of stars and galaxies.
+
+    Stars are round Gaussians with a 2.5 pixel FWHM and galaxies are elliptical
+    Gaussians with random sizes and orientations. Fluxes follow a power law, so
+    that there are many faint sources and a few bright ones.
+
+    Args:
+        size: Width and height of the image in pixels.
+        density: Number of sources per pixel.
+        galaxy_fraction: Fraction of the sources that are galaxies.
+        sky: Constant sky level.
+        noise: Standard deviation of the Gaussian noise.
+        seed: Seed of the random number generator.
+
+    Returns:
+        The image as a float32 numpy array and a header with a simple WCS.
+    """
+    rng = np.random.default_rng(seed)
+    num_sources = int(density * size * size)
+    num_galaxies = int(galaxy_fraction * num_sources)
+
+    x = rng.uniform(0, size, num_sources)
+    y = rng.uniform(0, size, num_sources)
+    flux = 50 * noise * (1 - rng.uniform(0, 1, num_sources)) ** (-1 / 1.5)
+    sigma_x = np.full(num_sources, 2.5 / 2.3548)
+    sigma_y = sigma_x.copy()
+    theta = np.zeros(num_sources)
+    sigma_x[:num_galaxies] = rng.uniform(1.5, 6.0, num_galaxies)
+    sigma_y[:num_galaxies] = sigma_x[:num_galaxies] * rng.uniform(
+        0.3, 1.0, num_galaxies
+    )
+    theta[:num_galaxies] = rng.uniform(0, np.pi, num_galaxies)
+
+    image = np.full((size, size), sky, dtype=np.float64)
+    _add_sources(image, x, y, flux, sigma_x, sigma_y, theta)
+    image += rng.normal(0, noise, image.shape)
+
+    header = fits.Header()
+    header["CTYPE1"] = "RA---TAN"
+    header["CTYPE2"] = "DEC--TAN"
+    header["CRPIX1"] = size / 2
+    header["CRPIX2"] = size / 2
+    header["CRVAL1"] = 150.0
+    header["CRVAL2"] = 2.0
+    header["CDELT1"] = -2.5 / 3600
+    header["CDELT2"] = 2.5 / 3600
+    return image.astype(np.float32), header
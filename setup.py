@@ -19,7 +19,11 @@ testing_deps = [
     "pytest>=7.1.2",
 ]
 
-extras_require = {"dev": linting_deps + testing_deps}
+extras_require = {
+    "dev": linting_deps + testing_deps,
+    "hdf5": ["h5py>=3.7.0"],
+    "parquet": ["pyarrow>=10.0.0"],
+}
 
 setup(
     name="SEW",
@@ -1,4 +1,48 @@
-from . import errors, segmentation, sextractor
+import importlib
+
+from . import (
+    batch,
+    cache,
+    catalog,
+    errors,
+    process,
+    report,
+    session,
+    sextractor,
+    sink,
+    store,
+)
+from .batch import *
 from .constants import *
 from .log import *
+from .report import *
+from .session import *
 from .sextractor import *
+
+# these submodules pull in scipy, asyncio, or multiprocessing, so they are only
+# imported when they are first used (e.g., sew.segmentation or sew.arun)
+_LAZY_SUBMODULES = {
+    "aio",
+    "background",
+    "jobs",
+    "mef",
+    "multiband",
+    "neighbors",
+    "segmentation",
+    "sweep",
+    "tiling",
+}
+_LAZY_ATTRIBUTES = {"arun": "aio"}
+
+
+def __getattr__(name: str):
+    if name in _LAZY_SUBMODULES:
+        return importlib.import_module(f".{name}", __name__)
+    if name in _LAZY_ATTRIBUTES:
+        module = importlib.import_module(f".{_LAZY_ATTRIBUTES[name]}", __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | _LAZY_SUBMODULES | set(_LAZY_ATTRIBUTES))
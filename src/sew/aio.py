@@ -0,0 +1,329 @@
+import asyncio
+import functools
+import os
+import shlex
+import shutil
+import tempfile
+import weakref
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+from astropy.io import fits
+from astropy.table import Table
+
+from . import errors, utils
+from .catalog import read_catalog
+from .log import load_logger, log_context
+from .process import get_default_timeout, kill_process_group
+from .report import RunReport, reported_run
+from .segmentation import dilate_object_mask
+from .sextractor import (
+    DEFAULT_CONFIG_PATH,
+    DEFAULT_PARAMS,
+    _build_command,
+    _build_options,
+    _build_params,
+)
+from .utils import PathLike, PathOrPixels, StagingModes, make_keys_uppercase
+
+__all__ = [
+    "acreate_sextractor_object_mask",
+    "acreate_sextractor_sky_model",
+    "arun",
+    "set_max_concurrency",
+]
+
+logger = load_logger()
+
+# maximum number of SExtractor runs that are done at once (per event loop)
+_max_concurrency = os.cpu_count() or 1
+_semaphores: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def set_max_concurrency(max_concurrency: int):
+    """Set the maximum number of SExtractor runs the async functions do at once.
+
+    Note:
+        A run holds its slot from the staging of the image to the cleanup of
+        its temporary files. The limit applies to each event loop and takes
+        effect for event loops that have not started an async SEW function yet.
+        Defaults to the number of CPUs.
+
+    Args:
+        max_concurrency: Maximum number of concurrent SExtractor runs.
+    """
+    global _max_concurrency
+    _max_concurrency = int(max_concurrency)
+    _semaphores.clear()
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    if loop not in _semaphores:
+        _semaphores[loop] = asyncio.Semaphore(_max_concurrency)
+    return _semaphores[loop]
+
+
+async def _in_thread(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+
+async def _stage_image(
+    path_or_pixels: PathOrPixels,
+    header: Optional[fits.Header],
+    tmp_path: PathLike,
+    staging: StagingModes,
+) -> Tuple[Path, bool]:
+    """Write the temporary fits file in the executor and return its path."""
+    return await _in_thread(
+        utils.create_temp_fits_file_if_necessary,
+        path_or_pixels,
+        header=header,
+        tmp_path=tmp_path,
+        staging=staging,
+    )
+
+
+async def _run_process(argv: List[str], timeout: Optional[float], report: RunReport):
+    """Run a command without blocking, killing it on cancellation or timeout."""
+    proc = await asyncio.create_subprocess_exec(
+        *argv,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        start_new_session=True,
+    )
+    assert proc.stdout is not None and proc.stderr is not None
+    # read the pipes in tasks, so the output of a killed run is kept
+    stdout_task = asyncio.ensure_future(proc.stdout.read())
+    stderr_task = asyncio.ensure_future(proc.stderr.read())
+    try:
+        await asyncio.wait_for(proc.wait(), timeout)
+    except (asyncio.CancelledError, asyncio.TimeoutError) as e:
+        logger.debug("Killing SExtractor process %s -> %s", proc.pid, type(e).__name__)
+        kill_process_group(proc.pid)
+        await proc.wait()
+        stdout, stderr = await asyncio.gather(stdout_task, stderr_task)
+        report.returncode = proc.returncode
+        report.stderr = stderr.decode(errors="replace")
+        if isinstance(e, asyncio.CancelledError):
+            raise
+        raise errors.SourceExtractorTimeoutError(
+            f"SExtractor timed out after {timeout} s -> stderr: "
+            f"{report.stderr.strip()}",
+            proc.returncode,
+            report.stderr,
+        )
+    stdout, stderr = await asyncio.gather(stdout_task, stderr_task)
+    report.returncode = proc.returncode
+    report.stderr = stderr.decode(errors="replace")
+    if stdout.strip() != b"":
+        logger.debug("SExtractor stdout: %s", stdout.decode(errors="replace").strip())
+    if report.stderr.strip() != "":
+        logger.debug("SExtractor stderr: %s", report.stderr.strip())
+    if proc.returncode != 0:
+        raise errors.SourceExtractorRunError(
+            f"SExtractor exited with code {proc.returncode} -> stderr: "
+            f"{report.stderr.strip()}",
+            proc.returncode,
+            report.stderr,
+        )
+
+
+async def _run_sextractor(
+    argv: List[str], report: RunReport, timeout: Optional[float], retries: int
+):
+    """Run SExtractor without blocking, retrying if it fails or times out."""
+    if timeout is None:
+        timeout = get_default_timeout()
+    with log_context(run_label=report.run_label):
+        report.command = shlex.join(argv)
+        logger.debug(">> %s", report.command)
+        for attempt in range(retries + 1):
+            try:
+                return await _run_process(argv, timeout, report)
+            except errors.SourceExtractorRunError as e:
+                if attempt == retries:
+                    raise
+                logger.warning("%s -> retrying (%s/%s)", e, attempt + 1, retries)
+
+
+async def arun(
+    path_or_pixels: PathOrPixels,
+    header: Optional[fits.Header] = None,
+    extra_params: Optional[Union[str, List[str]]] = None,
+    config_file_path: Optional[PathLike] = DEFAULT_CONFIG_PATH,
+    catalog_file_path: Optional[PathLike] = None,
+    tmp_path: PathLike = "/tmp",
+    staging: StagingModes = "disk",
+    report: Optional[RunReport] = None,
+    timeout: Optional[float] = None,
+    retries: int = 0,
+    **sextractor_options,
+) -> Table:
+    """Run Source Extractor without blocking the event loop.
+
+    Note:
+        This is the async counterpart of sextractor.run. SExtractor is started as
+        an asyncio subprocess, and the fits staging and catalog parsing run in the
+        event loop's default executor. Each call uses its own scratch directory,
+        so no run_label is needed. If the task is cancelled or times out, the
+        SExtractor process group is killed and the temporary files are deleted. The number of
+        concurrent runs, including the staging of their images, is limited (see
+        set_max_concurrency).
+
+    Args:
+        path_or_pixels: Path to fits file or its pixels in a numpy array.
+        header: Astropy fits header object. If not None, this header will take precedent.
+        extra_params: Extra measurement parameters to include beyond the defaults.
+        config_file_path: Custom SExtractor config file.
+        catalog_file_path: Custom file name + location for the output SExtractor catalog.
+        tmp_path: Parent directory of the scratch directory for temporary files.
+        staging: Where to write the temporary fits file (see sextractor.run).
+        report: Optional empty RunReport to fill (see sextractor.run). The resource
+            usage of the SExtractor process is not measured by the async functions.
+        timeout: Timeout of the SExtractor run in seconds (see sextractor.run).
+        retries: Number of times to rerun SExtractor if it fails (see sextractor.run).
+        **sextractor_options: Any SExtractor configuration option passed as a keyword.
+
+    Returns:
+        The SExtractor catalog in an Astropy table object.
+
+    Example:
+        catalogs = await asyncio.gather(*[sew.arun(image) for image in images])
+    """
+    if report is None:
+        report = RunReport()
+    with reported_run(report):
+        # validating the options may probe SExtractor the first time
+        with report.stage("setup"):
+            final_options = await _in_thread(_build_options, sextractor_options)
+            params = await _in_thread(_build_params, extra_params)
+        # the limit covers the staging too, so that the staged images of waiting
+        # runs do not fill the staging directory
+        async with _get_semaphore():
+            scratch_path = Path(tempfile.mkdtemp(prefix="sew_", dir=tmp_path))
+            staging_task: Optional[asyncio.Future] = None
+            try:
+                with report.stage("stage"):
+                    if len(params) > len(DEFAULT_PARAMS):
+                        param_file_name = scratch_path / "params.se"
+                        param_file_name.write_text("\n".join(params))
+                        final_options["PARAMETERS_NAME"] = param_file_name
+
+                    # the staging is shielded, so that its file is known (and deleted
+                    # below) even if this task is cancelled while it is written
+                    staging_task = asyncio.ensure_future(
+                        _stage_image(path_or_pixels, header, scratch_path, staging)
+                    )
+                    image_path, created_tmp = await asyncio.shield(staging_task)
+                if catalog_file_path is None:
+                    cat_name = scratch_path / "se.cat"
+                else:
+                    cat_name = Path(catalog_file_path)
+
+                argv = _build_command(
+                    image_path, cat_name, config_file_path, final_options
+                )
+                with report.stage("sextractor"):
+                    await _run_sextractor(argv, report, timeout, retries)
+                report.record_written_files(
+                    image_path if created_tmp else None,
+                    cat_name,
+                    *utils.checkimage_file_names(final_options),
+                )
+                with report.stage("parse"):
+                    catalog = await _in_thread(
+                        read_catalog, cat_name, final_options["CATALOG_TYPE"]
+                    )
+                report.num_rows = len(catalog)
+            finally:
+                with report.stage("cleanup"):
+                    if staging_task is not None:
+                        # the executor keeps writing the file after a cancellation
+                        await asyncio.wait([staging_task])
+                        if (
+                            not staging_task.cancelled()
+                            and staging_task.exception() is None
+                        ):
+                            image_path, created_tmp = staging_task.result()
+                            if created_tmp and image_path.is_file():
+                                os.remove(image_path)
+                    shutil.rmtree(scratch_path, ignore_errors=True)
+
+    return catalog
+
+
+async def _acreate_checkimage(
+    path_or_pixels: PathOrPixels,
+    check_type: str,
+    check_file_name: Optional[PathLike],
+    tmp_path: PathLike,
+    sextractor_options: dict,
+) -> np.ndarray:
+    scratch_path = Path(tempfile.mkdtemp(prefix="sew_", dir=tmp_path))
+    try:
+        if check_file_name is None:
+            check_file_name = scratch_path / "check.fits"
+        cfg = dict(
+            CHECKIMAGE_TYPE=check_type,
+            CHECKIMAGE_NAME=check_file_name,
+            tmp_path=scratch_path,
+            **make_keys_uppercase(sextractor_options),
+        )
+        await arun(path_or_pixels, **cfg)
+        data = await _in_thread(fits.getdata, check_file_name, memmap=False)
+    finally:
+        shutil.rmtree(scratch_path, ignore_errors=True)
+    return data
+
+
+async def acreate_sextractor_object_mask(
+    path_or_pixels: PathOrPixels,
+    tmp_path: PathLike = "/tmp",
+    mask_file_name: Optional[PathLike] = None,
+    dilate_npix: int = 5,
+    **sextractor_options,
+) -> np.ndarray:
+    """Async counterpart of segmentation.create_sextractor_object_mask.
+
+    Args:
+        path_or_pixels: Path to fits file or its pixels in a numpy array.
+        tmp_path: Parent directory of the scratch directory for temporary files.
+        mask_file_name: Name of OBJECTS CHECKIMAGE file written by SExtractor. If None,
+            a temporary file is used.
+        dilate_npix: Apply grey dilation with structuring element of dimension
+            (dilate_npix, dilate_npix).
+        **sextractor_options: Any SExtractor configuration option passed as a keyword.
+
+    Returns:
+        The dilated object mask as a numpy array.
+    """
+    mask = await _acreate_checkimage(
+        path_or_pixels, "OBJECTS", mask_file_name, tmp_path, sextractor_options
+    )
+    return await _in_thread(dilate_object_mask, mask, dilate_npix)
+
+
+async def acreate_sextractor_sky_model(
+    path_or_pixels: PathOrPixels,
+    tmp_path: PathLike = "/tmp",
+    sky_file_name: Optional[PathLike] = None,
+    **sextractor_options,
+) -> np.ndarray:
+    """Async counterpart of segmentation.create_sextractor_sky_model.
+
+    Args:
+        path_or_pixels: Path to fits file or its pixels in a numpy array.
+        tmp_path: Parent directory of the scratch directory for temporary files.
+        sky_file_name: Name of BACKGROUND CHECKIMAGE file written by SExtractor. If None,
+            a temporary file is used.
+        **sextractor_options: Any SExtractor configuration option passed as a keyword.
+
+    Returns:
+        The sky model as a numpy array.
+    """
+    return await _acreate_checkimage(
+        path_or_pixels, "BACKGROUND", sky_file_name, tmp_path, sextractor_options
+    )
@@ -0,0 +1,152 @@
+import contextvars
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Sequence, Union
+
+import numpy as np
+from astropy.table import Table
+
+from . import errors, sextractor
+from .log import load_logger, log_context
+from .sink import CatalogSink
+from .utils import PathLike, PathOrPixels
+
+__all__ = ["map_batch", "run_many"]
+
+logger = load_logger()
+
+
+def _call_in_scratch(
+    func: Callable,
+    index: int,
+    path_or_pixels: PathOrPixels,
+    tmp_path: PathLike,
+    kwargs: dict,
+    sink: Optional[CatalogSink] = None,
+) -> Any:
+    # tag the records logged by this item with its index
+    with log_context(run_label=str(index)):
+        scratch_path = tempfile.mkdtemp(prefix="sew_", dir=tmp_path)
+        try:
+            result = func(path_or_pixels, tmp_path=scratch_path, **kwargs)
+            if sink is None:
+                return result
+            if isinstance(path_or_pixels, np.ndarray):
+                source = f"pixels[{index}]"
+            else:
+                source = str(path_or_pixels)
+            sink.write(result, source=source, run_label=str(index))
+            return len(result)
+        except Exception as e:
+            logger.error("Batch item %s failed -> %s: %s", index, type(e).__name__, e)
+            return e
+        finally:
+            shutil.rmtree(scratch_path, ignore_errors=True)
+
+
+def map_batch(
+    func: Callable,
+    paths_or_arrays: Sequence[Any],
+    max_workers: Optional[int] = None,
+    tmp_path: PathLike = "/tmp",
+    sink: Optional[CatalogSink] = None,
+    **kwargs,
+) -> List[Any]:
+    """Apply a SEW function to many images using a pool of workers.
+
+    Note:
+        Each call gets its own scratch directory inside tmp_path, so the
+        temporary files of concurrent calls never collide and no run_label
+        is needed. The scratch directories are deleted when the calls finish.
+        The records logged by each call are tagged with its index as run_label.
+
+    Args:
+        func: Function that accepts path_or_pixels as its first argument and
+            a tmp_path keyword (e.g., sextractor.run or the segmentation helpers).
+        paths_or_arrays: Paths to fits files and/or their pixels in numpy arrays
+            (or any other items that func accepts as its first argument).
+        max_workers: Maximum number of concurrent calls. Defaults to the number of CPUs.
+        tmp_path: Parent directory of the per-call scratch directories.
+        sink: Optional catalog sink (see sink.open_sink). If given, func must return
+            a catalog, which is appended to the sink as soon as the call finishes
+            (with the image and the item index as its SOURCE_IMAGE and RUN_LABEL)
+            instead of being kept in memory.
+        **kwargs: Keyword arguments passed to every call of func.
+
+    Returns:
+        The results in input order (the number of rows written to the sink if a
+        sink is given). If a call raised an exception, the exception is returned
+        in its place and the rest of the batch keeps running.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    logger.debug(
+        "Running batch of %s items with %s workers", len(paths_or_arrays), max_workers
+    )
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # run each call in a copy of the caller's log context (see log.capture_logs)
+        futures = [
+            executor.submit(
+                contextvars.copy_context().run,
+                _call_in_scratch,
+                func,
+                i,
+                item,
+                tmp_path,
+                kwargs,
+                sink,
+            )
+            for i, item in enumerate(paths_or_arrays)
+        ]
+        results = [f.result() for f in futures]
+    num_failed = sum(isinstance(r, Exception) for r in results)
+    if num_failed > 0:
+        logger.warning("%s of %s batch items failed", num_failed, len(results))
+    return results
+
+
+def run_many(
+    paths_or_arrays: Sequence[PathOrPixels],
+    max_workers: Optional[int] = None,
+    tmp_path: PathLike = "/tmp",
+    sink: Optional[CatalogSink] = None,
+    **run_kwargs,
+) -> List[Union[Table, int, Exception]]:
+    """Run Source Extractor on many images in parallel.
+
+    Args:
+        paths_or_arrays: Paths to fits files and/or their pixels in numpy arrays.
+        max_workers: Maximum number of concurrent SExtractor processes. Defaults
+            to the number of CPUs.
+        tmp_path: Parent directory of the per-call scratch directories.
+        sink: Optional catalog sink. If given, each catalog is appended to the sink
+            as soon as it is ready, so memory use does not grow with the number of
+            images, and the number of rows written is returned in its place.
+        **run_kwargs: Arguments passed to sextractor.run (e.g., extra_params
+            or any SExtractor configuration option).
+
+    Returns:
+        The SExtractor catalogs in input order. Items that failed are returned
+        as the exception that was raised instead of a catalog.
+
+    Example:
+        cats = sew.run_many(list_of_file_names, max_workers=8, DETECT_THRESH=3)
+        failed = [i for i, cat in enumerate(cats) if isinstance(cat, Exception)]
+
+        # stream the catalogs of a large survey to a parquet file
+        with sew.sink.open_sink("survey.parquet") as sink:
+            sew.run_many(list_of_file_names, max_workers=8, sink=sink)
+    """
+    if run_kwargs.get("catalog_file_path") is not None:
+        raise errors.SEWError(
+            "catalog_file_path cannot be shared by all items of a batch"
+        )
+    return map_batch(
+        sextractor.run,
+        paths_or_arrays,
+        max_workers=max_workers,
+        tmp_path=tmp_path,
+        sink=sink,
+        **run_kwargs,
+    )
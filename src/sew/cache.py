@@ -0,0 +1,267 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from astropy.io import fits
+from astropy.table import Table
+
+from .capabilities import get_capabilities
+from .catalog import read_catalog
+from .constants import CACHE_PATH
+from .log import load_logger
+from .utils import PathLike, PathOrPixels, checkimage_file_names
+
+__all__ = ["hash_file", "hash_option_value", "ResultCache"]
+
+logger = load_logger()
+
+# config options that name output files, which do not affect the results
+OUTPUT_OPTIONS = ["CATALOG_NAME", "CHECKIMAGE_NAME", "XML_NAME"]
+
+# file content hashes, keyed by (path, mtime, size)
+_file_hashes: Dict[Tuple[str, int, int], str] = {}
+
+
+def hash_file(path: PathLike) -> str:
+    """Return the SHA-256 hash of a file's contents.
+
+    Note:
+        The hashes are memoized by the real path, modification time, and size
+        of the files, so an unchanged file is only read once per process.
+
+    Args:
+        path: Path to the file.
+
+    Returns:
+        The content hash as a hex string.
+    """
+    stat = os.stat(path)
+    memo_key = (os.path.realpath(path), stat.st_mtime_ns, stat.st_size)
+    if memo_key not in _file_hashes:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha.update(chunk)
+        _file_hashes[memo_key] = sha.hexdigest()
+    return _file_hashes[memo_key]
+
+
+def hash_option_value(value: Any) -> str:
+    """Hash an option value, using the file contents for values that are files.
+
+    Args:
+        value: The option value. Comma-separated values are hashed one by one
+            (e.g., the weight maps of a dual-image run).
+
+    Returns:
+        The value with every existing file replaced by its content hash.
+    """
+    parts = []
+    for part in str(value).split(","):
+        part = part.strip()
+        if part != "" and os.path.isfile(part):
+            parts.append(hash_file(part))
+        else:
+            parts.append(part)
+    return ",".join(parts)
+
+
+def _directory_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.iterdir() if f.is_file())
+
+
+def evict_least_recently_used(
+    path: PathLike, max_bytes: int, min_age: float = 0, use_atime: bool = False
+) -> List[Path]:
+    """Delete the least recently used entries of a directory until it fits in max_bytes.
+
+    Note:
+        Each file or subdirectory of path is an entry, and its modification time
+        is its last use (touch an entry to mark it as used). With use_atime=True,
+        its access time is used instead, so that marking an entry as used does
+        not change its modification time.
+
+    Args:
+        path: Directory with the entries.
+        max_bytes: Maximum total size of the entries in bytes.
+        min_age: Entries used less than this many seconds ago are never deleted.
+        use_atime: If True, the access time of an entry is its last use.
+
+    Returns:
+        The paths of the deleted entries.
+    """
+    entries = []
+    for entry in Path(path).iterdir():
+        if entry.name.startswith("."):
+            continue
+        try:
+            size = _directory_size(entry) if entry.is_dir() else entry.stat().st_size
+            stat = entry.stat()
+            entries.append((stat.st_atime if use_atime else stat.st_mtime, size, entry))
+        except FileNotFoundError:
+            continue
+    total = sum(e[1] for e in entries)
+    evicted = []
+    now = time.time()
+    for last_use, size, entry in sorted(entries, key=lambda e: e[0]):
+        if total <= max_bytes:
+            break
+        if now - last_use < min_age:
+            continue
+        logger.debug("Evicting %s", entry)
+        if entry.is_dir():
+            shutil.rmtree(entry, ignore_errors=True)
+        else:
+            entry.unlink(missing_ok=True)
+        total -= size
+        evicted.append(entry)
+    return evicted
+
+
+class ResultCache:
+    """Content-addressed on-disk cache of SExtractor results.
+
+    Each entry stores the catalog file and check images written by one run of
+    SExtractor. Entries are keyed on a hash of the input pixels (or file contents)
+    and header, the final config options, the measurement parameters, the SExtractor
+    version, and the contents of the config file and of every file named by an
+    option (e.g., FILTER_NAME or WEIGHT_IMAGE). The least recently used entries are
+    evicted when the total size exceeds max_bytes.
+
+    Args:
+        path: Directory of the cache. Defaults to CACHE_PATH / "results".
+        max_bytes: Maximum total size of the cache in bytes. Defaults to 10 GB.
+
+    Example:
+        cache = ResultCache(max_bytes=50e9)
+        cat = sew.run(image, cache=cache)  # runs SExtractor
+        cat = sew.run(image, cache=cache)  # returns the cached catalog
+    """
+
+    def __init__(self, path: Optional[PathLike] = None, max_bytes: float = 10e9):
+        self.path = Path(CACHE_PATH / "results" if path is None else path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(max_bytes)
+
+    def make_key(
+        self,
+        path_or_pixels: PathOrPixels,
+        header: Optional[fits.Header],
+        final_options: dict,
+        params: List[str],
+        config_file_path: Optional[PathLike],
+    ) -> str:
+        """Build the cache key of a SExtractor run.
+
+        Args:
+            path_or_pixels: Path to fits file or its pixels in a numpy array.
+            header: Astropy fits header object given with the image.
+            final_options: The final SExtractor config options.
+            params: The measurement parameters.
+            config_file_path: The SExtractor config file.
+
+        Returns:
+            The cache key as a hex string.
+        """
+        sha = hashlib.sha256()
+        if isinstance(path_or_pixels, np.ndarray):
+            pixels = np.ascontiguousarray(path_or_pixels)
+            sha.update(f"{pixels.dtype.str}{pixels.shape}".encode())
+            sha.update(pixels.reshape(-1).view(np.uint8).data)
+        else:
+            sha.update(hash_file(str(path_or_pixels)).encode())
+        if header is not None:
+            sha.update(header.tostring().encode())
+        options = {
+            k: hash_option_value(v)
+            for k, v in sorted(final_options.items())
+            if k not in OUTPUT_OPTIONS
+        }
+        sha.update(json.dumps(options).encode())
+        sha.update("\n".join(params).encode())
+        if config_file_path is not None:
+            sha.update(hash_file(config_file_path).encode())
+        sha.update(get_capabilities()["version"].encode())
+        return sha.hexdigest()
+
+    def get(
+        self,
+        key: str,
+        final_options: dict,
+        catalog_file_path: Optional[PathLike] = None,
+    ) -> Optional[Table]:
+        """Return a cached catalog and restore its check images.
+
+        Args:
+            key: The cache key.
+            final_options: The final SExtractor config options. The cached check
+                images are copied to the CHECKIMAGE_NAME files.
+            catalog_file_path: If not None, the cached catalog file is copied here.
+
+        Returns:
+            The SExtractor catalog, or None if the key is not in the cache.
+        """
+        entry = self.path / key
+        if not entry.is_dir():
+            return None
+        logger.debug("Loading cached SExtractor results from %s", entry)
+        try:
+            os.utime(entry)
+            with open(entry / "entry.json") as f:
+                info = json.load(f)
+            for i, fn in enumerate(checkimage_file_names(final_options)):
+                shutil.copyfile(entry / f"check_{i}.fits", fn)
+            if catalog_file_path is not None:
+                shutil.copyfile(entry / "catalog", catalog_file_path)
+            catalog = read_catalog(entry / "catalog", info["catalog_type"])
+        except FileNotFoundError:
+            # the entry was evicted or is incomplete
+            return None
+        return catalog
+
+    def put(self, key: str, cat_name: PathLike, final_options: dict):
+        """Store the catalog and check images of a SExtractor run.
+
+        Args:
+            key: The cache key.
+            cat_name: The catalog file written by SExtractor.
+            final_options: The final SExtractor config options.
+        """
+        entry = self.path / key
+        if entry.is_dir():
+            return
+        tmp_entry = Path(tempfile.mkdtemp(prefix=".", dir=self.path))
+        shutil.copyfile(cat_name, tmp_entry / "catalog")
+        check_names = checkimage_file_names(final_options)
+        for i, fn in enumerate(check_names):
+            shutil.copyfile(fn, tmp_entry / f"check_{i}.fits")
+        with open(tmp_entry / "entry.json", "w") as f:
+            json.dump(dict(catalog_type=final_options["CATALOG_TYPE"]), f)
+        try:
+            os.rename(tmp_entry, entry)
+            logger.debug("Cached SExtractor results in %s", entry)
+        except OSError:
+            # another process cached the same run first
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+        evict_least_recently_used(self.path, self.max_bytes)
+
+    def invalidate(self, key: str):
+        """Remove a single entry from the cache."""
+        shutil.rmtree(self.path / key, ignore_errors=True)
+
+    def clear(self):
+        """Remove all entries from the cache."""
+        for entry in self.path.iterdir():
+            if entry.is_dir():
+                shutil.rmtree(entry, ignore_errors=True)
+
+    @property
+    def size(self) -> int:
+        """Total size of the cache in bytes."""
+        return sum(_directory_size(e) for e in self.path.iterdir() if e.is_dir())
@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import re
+import shlex
+import shutil
+import tempfile
+from collections.abc import Sequence
+from pathlib import Path
+from subprocess import CalledProcessError, check_output
+from typing import Callable, Dict, List, Optional
+
+from . import errors
+from .constants import CACHE_PATH
+from .log import load_logger
+
+__all__ = [
+    "clear_capabilities_cache",
+    "get_capabilities",
+    "get_se_executable",
+    "LazyNameList",
+]
+
+logger = load_logger()
+
+# capabilities loaded in this process, keyed by the executable cache key
+_capabilities: Dict[str, dict] = {}
+
+
+def get_se_executable() -> str:
+    """Return the SExtractor executable given by the SE_EXECUTABLE env variable."""
+    executable = os.getenv("SE_EXECUTABLE")
+    if executable is None:
+        raise errors.SourceExtractorExecutableError(
+            "SE_EXECUTABLE env variable not set -> set this env variable to your local SExtractor executable"
+        )
+    return executable
+
+
+def _cache_key(executable: str) -> str:
+    """Build a cache key from the executable command and the files it runs."""
+    key = [executable]
+    for i, token in enumerate(shlex.split(executable)):
+        path = shutil.which(token) if i == 0 else token
+        if path is not None and os.path.isfile(path):
+            stat = os.stat(path)
+            key.append(f"{os.path.realpath(path)}:{stat.st_mtime_ns}:{stat.st_size}")
+    return hashlib.sha1("\n".join(key).encode()).hexdigest()
+
+
+def _probe(executable: str) -> dict:
+    """Run SExtractor to get its version, config options and measurement parameters."""
+    logger.debug("Probing SExtractor capabilities of %s", executable)
+    argv = shlex.split(executable)
+    try:
+        lines_bytes = check_output([*argv, "-dd"])
+    except (CalledProcessError, OSError):
+        raise errors.SourceExtractorExecutableError(
+            "SE_EXECUTABLE is not working correctly -> verify this env variable runs SExtractor as expected"
+        )
+
+    # get list of all config options
+    lines = lines_bytes.decode("utf-8").split("\n")
+    cleaned = filter(
+        lambda line: line.strip()[0] != "#", filter(lambda line: len(line) > 1, lines)
+    )
+    option_names = [line.split()[0] for line in cleaned]
+
+    # get list of all SExtractor measurement parameters
+    try:
+        lines_bytes = check_output([*argv, "-dp"])
+    except (CalledProcessError, OSError):
+        raise errors.SourceExtractorExecutableError(
+            "SE_EXECUTABLE is not working correctly -> verify this env variable runs SExtractor as expected"
+        )
+    lines = lines_bytes.decode("utf-8").split("\n")
+    cleaned = filter(lambda line: len(line) > 1, lines)
+    param_names = [line.split()[0][1:] for line in cleaned]
+
+    # get the version string
+    try:
+        version_output = check_output([*argv, "-v"]).decode("utf-8")
+        match = re.search(r"version\s+(\S+)", version_output)
+        version = match.group(1) if match else version_output.strip()
+    except (CalledProcessError, OSError):
+        version = "unknown"
+
+    return dict(
+        executable=executable,
+        version=version,
+        option_names=option_names,
+        param_names=param_names,
+    )
+
+
+def get_capabilities(use_cache: bool = True) -> dict:
+    """Get the version, config options, and measurement parameters of SExtractor.
+
+    Note:
+        Probing SExtractor requires running it several times, so the results are
+        cached on disk (in CACHE_PATH) keyed by the SE_EXECUTABLE command and the
+        path, modification time, and size of the files it runs. The probe is
+        only repeated when the executable changes.
+
+    Args:
+        use_cache: If False, ignore the on-disk cache and probe SExtractor again.
+
+    Returns:
+        Dictionary with the executable, version, option_names, and param_names.
+    """
+    executable = get_se_executable()
+    key = _cache_key(executable)
+    if use_cache and key in _capabilities:
+        return _capabilities[key]
+
+    cache_file = CACHE_PATH / f"capabilities-{key}.json"
+    capabilities = None
+    if use_cache and cache_file.is_file():
+        try:
+            with open(cache_file) as f:
+                capabilities = json.load(f)
+            logger.debug("Loaded SExtractor capabilities from %s", cache_file)
+        except (OSError, ValueError):
+            logger.debug("Ignoring unreadable capabilities cache %s", cache_file)
+
+    if capabilities is None:
+        capabilities = _probe(executable)
+        try:
+            CACHE_PATH.mkdir(parents=True, exist_ok=True)
+            fd, tmp_name = tempfile.mkstemp(dir=CACHE_PATH, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(capabilities, f)
+            os.replace(tmp_name, cache_file)
+        except OSError as e:
+            logger.debug("Unable to write capabilities cache %s -> %s", cache_file, e)
+
+    _capabilities[key] = capabilities
+    return capabilities
+
+
+def clear_capabilities_cache():
+    """Delete all cached SExtractor capabilities from memory and disk."""
+    _capabilities.clear()
+    for cache_file in Path(CACHE_PATH).glob("capabilities-*.json"):
+        os.remove(cache_file)
+
+
+class LazyNameList(Sequence):
+    """A read-only list of names that is only loaded the first time it is used.
+
+    Args:
+        loader: Function that returns the list of names.
+    """
+
+    def __init__(self, loader: Callable[[], List[str]]):
+        self._loader = loader
+        self._names: Optional[List[str]] = None
+
+    @property
+    def names(self) -> List[str]:
+        if self._names is None:
+            self._names = list(self._loader())
+        return self._names
+
+    def __getitem__(self, index):
+        return self.names[index]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name) -> bool:
+        return name in self.names
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, (list, tuple, Sequence)):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def __repr__(self) -> str:
+        if self._names is None:
+            return f"{self.__class__.__name__}(<not loaded>)"
+        return repr(self._names)
@@ -0,0 +1,355 @@
+from typing import Callable, List, Optional
+
+import numpy as np
+from astropy.io import ascii, fits
+from astropy.table import Column, Table, vstack
+
+from . import errors
+from .log import load_logger
+from .utils import PathLike
+
+__all__ = [
+    "CATALOG_TYPES",
+    "CatalogStreamParser",
+    "fits_table_to_catalog",
+    "read_catalog",
+    "read_catalog_extensions",
+]
+
+logger = load_logger()
+
+# catalog types that can be converted into an astropy table
+CATALOG_TYPES = ["ASCII_HEAD", "FITS_1.0", "FITS_LDAC"]
+
+# default number of rows per batch when parsing a catalog stream
+DEFAULT_BATCH_ROWS = 10_000
+
+_FITS_BLOCK_SIZE = 2880
+_FITS_CARD_SIZE = 80
+
+
+def fits_table_to_catalog(hdu: fits.BinTableHDU) -> Table:
+    """Convert a SExtractor binary table HDU into an astropy table.
+
+    Note:
+        The returned table has the same columns and dtypes as the table
+        produced by reading an ASCII_HEAD catalog with astropy.io.ascii:
+        integer columns are int64, floating point columns are float64, and
+        vector parameters (e.g., FLUX_APER(3)) are split into the columns
+        FLUX_APER, FLUX_APER_1, FLUX_APER_2.
+
+    Args:
+        hdu: Binary table HDU containing the SExtractor measurements.
+
+    Returns:
+        The SExtractor catalog in an Astropy table object.
+    """
+    catalog = Table()
+    for i, fits_col in enumerate(hdu.columns):
+        data = hdu.data[fits_col.name]
+        dtype: np.dtype
+        if data.dtype.kind in "iu":
+            dtype = np.dtype(np.int64)
+        elif data.dtype.kind == "f":
+            dtype = np.dtype(np.float64)
+        else:
+            dtype = data.dtype.newbyteorder("=")
+        data = np.array(data, dtype=dtype)
+        descr = hdu.header.comments[f"TTYPE{i + 1}"] or None
+        if data.ndim == 1:
+            names = [fits_col.name]
+            data = data[:, np.newaxis]
+        else:
+            names = [fits_col.name] + [
+                f"{fits_col.name}_{n}" for n in range(1, data.shape[1])
+            ]
+        for n, name in enumerate(names):
+            catalog[name] = Column(
+                data[:, n], unit=fits_col.unit or None, description=descr
+            )
+    return catalog
+
+
+def _find_table_hdus(hdul: fits.HDUList, catalog_type: str) -> List[fits.BinTableHDU]:
+    if catalog_type == "FITS_LDAC":
+        hdus = [hdu for hdu in hdul if hdu.name == "LDAC_OBJECTS"]
+    else:
+        hdus = [hdu for hdu in hdul[1:] if isinstance(hdu, fits.BinTableHDU)]
+    if len(hdus) == 0:
+        raise errors.SEWError(f"no {catalog_type} object table found in catalog")
+    return hdus
+
+
+def read_catalog(
+    cat_name: PathLike, catalog_type: str = "FITS_LDAC", memmap: bool = True
+) -> Table:
+    """Read a catalog written by SExtractor into an astropy table.
+
+    Note:
+        Binary catalogs (FITS_1.0 and FITS_LDAC) are read directly from the
+        binary table HDU, which is much faster than parsing an ASCII catalog.
+        The returned columns and dtypes are identical for all catalog types.
+
+    Args:
+        cat_name: Path to the SExtractor catalog.
+        catalog_type: The SExtractor CATALOG_TYPE used to write the catalog.
+        memmap: If True, memory-map binary catalogs rather than reading the
+            whole file into memory.
+
+    Returns:
+        The SExtractor catalog in an Astropy table object.
+    """
+    catalog_type = str(catalog_type).upper()
+    if catalog_type == "ASCII_HEAD":
+        catalog = ascii.read(cat_name, format="sextractor")
+    elif catalog_type in ["FITS_1.0", "FITS_LDAC"]:
+        logger.debug("Reading %s catalog %s", catalog_type, cat_name)
+        with fits.open(cat_name, memmap=memmap) as hdul:
+            catalog = fits_table_to_catalog(_find_table_hdus(hdul, catalog_type)[0])
+    else:
+        raise errors.SEWError(f"{catalog_type} is an invalid CATALOG_TYPE")
+    return catalog
+
+
+def read_catalog_extensions(
+    cat_name: PathLike, catalog_type: str = "FITS_LDAC", memmap: bool = True
+) -> List[Table]:
+    """Read the per-extension tables of a catalog written for a multi-extension image.
+
+    Note:
+        For multi-extension images, SExtractor writes one object table per
+        image extension (in file order) to FITS_1.0 and FITS_LDAC catalogs.
+        ASCII catalogs mix the objects of all extensions, so they cannot be
+        split here.
+
+    Args:
+        cat_name: Path to the SExtractor catalog.
+        catalog_type: The SExtractor CATALOG_TYPE used to write the catalog.
+        memmap: If True, memory-map the catalog rather than reading the whole
+            file into memory.
+
+    Returns:
+        One SExtractor catalog per image extension.
+    """
+    catalog_type = str(catalog_type).upper()
+    if catalog_type not in ["FITS_1.0", "FITS_LDAC"]:
+        raise errors.SEWError(
+            f"{catalog_type} catalogs cannot be split by extension "
+            "-> use FITS_1.0 or FITS_LDAC"
+        )
+    logger.debug("Reading %s catalog %s by extension", catalog_type, cat_name)
+    with fits.open(cat_name, memmap=memmap) as hdul:
+        return [
+            fits_table_to_catalog(hdu) for hdu in _find_table_hdus(hdul, catalog_type)
+        ]
+
+
+def _fits_data_size(header: fits.Header) -> int:
+    """Return the size in bytes of the data of a fits HDU (without padding)."""
+    num_axes = header.get("NAXIS", 0)
+    if num_axes == 0:
+        return 0
+    num_values = int(np.prod([header[f"NAXIS{i}"] for i in range(1, num_axes + 1)]))
+    return (
+        abs(header["BITPIX"])
+        // 8
+        * header.get("GCOUNT", 1)
+        * (header.get("PCOUNT", 0) + num_values)
+    )
+
+
+class CatalogStreamParser:
+    """Parse a catalog incrementally as SExtractor writes it (e.g., to a pipe).
+
+    Feed the bytes of the catalog as they arrive. The object table is converted
+    into astropy tables of batch_rows rows as soon as enough rows are available,
+    so that parsing overlaps with the extraction. The tables have the same
+    columns and dtypes as those returned by read_catalog.
+
+    For binary catalogs (FITS_1.0 and FITS_LDAC), the fits headers are parsed
+    block by block and the rows of the object table are sliced from the raw
+    bytes. The other tables (e.g., the image header of FITS_LDAC catalogs) are
+    skipped. For ASCII_HEAD catalogs, complete lines are parsed in batches.
+
+    Args:
+        catalog_type: The SExtractor CATALOG_TYPE of the catalog.
+        on_batch: Optional function that is called with every batch, in row order.
+            The batches are then not kept, so that catalogs of very crowded fields
+            never have to fit in memory.
+        batch_rows: Number of rows per batch.
+
+    Example:
+        parser = CatalogStreamParser("FITS_LDAC")
+        for chunk in iter(lambda: pipe.read(65536), b""):
+            parser.feed(chunk)
+        catalog = parser.finish()
+    """
+
+    def __init__(
+        self,
+        catalog_type: str = "FITS_LDAC",
+        on_batch: Optional[Callable[[Table], None]] = None,
+        batch_rows: int = DEFAULT_BATCH_ROWS,
+    ):
+        self.catalog_type = str(catalog_type).upper()
+        if self.catalog_type not in CATALOG_TYPES:
+            raise errors.SEWError(f"{self.catalog_type} is an invalid CATALOG_TYPE")
+        if batch_rows < 1:
+            raise errors.SEWError(f"batch_rows must be positive, not {batch_rows}")
+        self.on_batch = on_batch
+        self.batch_rows = int(batch_rows)
+        self.reset()
+
+    def reset(self):
+        """Discard all parsed data (e.g., before SExtractor is run again)."""
+        self.num_rows = 0
+        self._buffer = bytearray()
+        self._batches: List[Table] = []
+        self._empty: Optional[Table] = None
+        # fits state: header of the object table, its rows left to read, and
+        # the bytes left to skip (data of other tables and padding)
+        self._table_header: Optional[fits.Header] = None
+        self._rows_left = 0
+        self._table_padding = 0
+        self._skip_bytes = 0
+        self._table_done = False
+        # ascii state: header lines and data lines that are not parsed yet
+        self._header_lines: List[str] = []
+        self._data_lines: List[str] = []
+
+    def feed(self, data: bytes):
+        """Parse the next bytes of the catalog."""
+        self._buffer += data
+        if self.catalog_type == "ASCII_HEAD":
+            self._parse_ascii(final=False)
+        else:
+            self._parse_fits()
+
+    def finish(self) -> Table:
+        """Parse the rest of the catalog once it has been completely fed.
+
+        Returns:
+            The catalog, or a table with its columns but no rows if the batches
+            were passed to on_batch.
+        """
+        if self.catalog_type == "ASCII_HEAD":
+            self._parse_ascii(final=True)
+        elif self._table_header is None or self._rows_left > 0:
+            raise errors.SEWError(
+                f"{self.catalog_type} catalog stream ended before its object table"
+            )
+        if self.on_batch is not None or len(self._batches) == 0:
+            assert self._empty is not None
+            return self._empty
+        if len(self._batches) == 1:
+            return self._batches[0]
+        return vstack(self._batches, metadata_conflicts="silent")
+
+    def _emit(self, batch: Table):
+        if self._empty is None:
+            self._empty = batch[:0]
+        if len(batch) == 0:
+            return
+        self.num_rows += len(batch)
+        if self.on_batch is not None:
+            self.on_batch(batch)
+        else:
+            self._batches.append(batch)
+
+    def _is_object_table(self, header: fits.Header) -> bool:
+        if header.get("XTENSION") != "BINTABLE" or self._table_done:
+            return False
+        return self.catalog_type != "FITS_LDAC" or header.get("EXTNAME") == (
+            "LDAC_OBJECTS"
+        )
+
+    def _parse_fits(self):
+        while True:
+            if self._skip_bytes > 0:
+                num_bytes = min(self._skip_bytes, len(self._buffer))
+                del self._buffer[:num_bytes]
+                self._skip_bytes -= num_bytes
+                if self._skip_bytes > 0:
+                    return
+            if self._rows_left > 0:
+                if not self._parse_rows():
+                    return
+                continue
+            header_size = self._find_header_end()
+            if header_size is None:
+                return
+            header = fits.Header.fromstring(bytes(self._buffer[:header_size]))
+            del self._buffer[:header_size]
+            data_size = _fits_data_size(header)
+            padding = -data_size % _FITS_BLOCK_SIZE
+            if self._is_object_table(header):
+                self._table_header = header
+                self._rows_left = header["NAXIS2"]
+                # the heap and padding follow the rows
+                self._table_padding = header.get("PCOUNT", 0) + padding
+                if self._rows_left == 0:
+                    self._skip_bytes = self._table_padding
+                self._table_done = True
+                logger.debug("Parsing %s rows from catalog stream", self._rows_left)
+                self._emit(self._rows_to_catalog(b"", 0))
+            else:
+                self._skip_bytes = data_size + padding
+
+    def _find_header_end(self) -> Optional[int]:
+        """Return the size of the header at the start of the buffer (if complete)."""
+        for start in range(0, len(self._buffer), _FITS_CARD_SIZE):
+            if len(self._buffer) < start + _FITS_CARD_SIZE:
+                return None
+            if self._buffer[start : start + 8] == b"END     ":
+                end = start + _FITS_CARD_SIZE
+                header_size = end + (-end % _FITS_BLOCK_SIZE)
+                return header_size if len(self._buffer) >= header_size else None
+        return None
+
+    def _parse_rows(self) -> bool:
+        """Convert the complete rows in the buffer, returning False if more are needed."""
+        assert self._table_header is not None
+        row_size = self._table_header["NAXIS1"]
+        num_rows = min(len(self._buffer) // row_size, self._rows_left)
+        if num_rows < min(self.batch_rows, self._rows_left):
+            return False
+        num_rows = min(num_rows, self.batch_rows)
+        self._emit(
+            self._rows_to_catalog(bytes(self._buffer[: num_rows * row_size]), num_rows)
+        )
+        del self._buffer[: num_rows * row_size]
+        self._rows_left -= num_rows
+        if self._rows_left == 0:
+            self._skip_bytes = self._table_padding
+        return True
+
+    def _rows_to_catalog(self, rows: bytes, num_rows: int) -> Table:
+        assert self._table_header is not None
+        header = self._table_header.copy()
+        header["NAXIS2"] = num_rows
+        header["PCOUNT"] = 0
+        hdu = fits.BinTableHDU.fromstring(header.tostring().encode() + rows)
+        return fits_table_to_catalog(hdu)
+
+    def _parse_ascii(self, final: bool):
+        end = len(self._buffer) if final else self._buffer.rfind(b"\n") + 1
+        lines = self._buffer[:end].decode().splitlines()
+        del self._buffer[:end]
+        for line in lines:
+            if line.startswith("#"):
+                self._header_lines.append(line)
+            elif line.strip() != "":
+                self._data_lines.append(line)
+        while len(self._data_lines) >= self.batch_rows or (
+            final and len(self._data_lines) > 0
+        ):
+            batch_lines = self._data_lines[: self.batch_rows]
+            del self._data_lines[: self.batch_rows]
+            self._emit(self._lines_to_catalog(batch_lines))
+        if final and self._empty is None:
+            self._emit(self._lines_to_catalog([]))
+
+    def _lines_to_catalog(self, lines: List[str]) -> Table:
+        if len(self._header_lines) == 0:
+            raise errors.SEWError("ASCII_HEAD catalog stream has no header")
+        return ascii.read(self._header_lines + lines, format="sextractor")
@@ -1,20 +1,27 @@
 import os
+import tempfile
 from pathlib import Path
 
-from .errors import SourceExtractorExecutableError
-
 __all__ = [
+    "CACHE_PATH",
     "PACKAGE_PATH",
+    "RAM_STAGING_PATH",
     "REPO_PATH",
     "SE_EXECUTABLE",
+    "STAGING_PATH",
 ]
 
 
 PACKAGE_PATH = Path(__file__).parent
 REPO_PATH = PACKAGE_PATH.parent.parent
 SE_EXECUTABLE = os.getenv("SE_EXECUTABLE")
-
-if SE_EXECUTABLE is None:
-    raise SourceExtractorExecutableError(
-        "SE_EXECUTABLE env variable not set -> set this env variable to your local SExtractor executable"
+CACHE_PATH = Path(
+    os.getenv(
+        "SEW_CACHE_DIR",
+        Path(os.getenv("XDG_CACHE_HOME", Path.home() / ".cache")) / "sew",
     )
+)
+RAM_STAGING_PATH = Path(os.getenv("SEW_RAM_PATH", "/dev/shm"))
+STAGING_PATH = Path(
+    os.getenv("SEW_STAGING_DIR", Path(tempfile.gettempdir()) / "sew_staging")
+)
@@ -1,3 +1,6 @@
+from typing import Optional
+
+
 class SEWError(Exception):
     """Base class for SEW exceptions."""
 
@@ -8,3 +11,18 @@ class InvalidPathOrPixels(SEWError):
 
 class SourceExtractorExecutableError(SEWError):
     """Throw this exception when there is an error finding/running SExtractor."""
+
+
+class SourceExtractorRunError(SEWError):
+    """Throw this exception when a SExtractor run fails (e.g., non-zero exit code)."""
+
+    def __init__(
+        self, message: str, returncode: Optional[int] = None, stderr: str = ""
+    ):
+        super().__init__(message)
+        self.returncode = returncode
+        self.stderr = stderr
+
+
+class SourceExtractorTimeoutError(SourceExtractorRunError):
+    """Throw this exception when a SExtractor run is killed after a timeout."""
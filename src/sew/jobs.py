@@ -0,0 +1,369 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from astropy.io import fits
+from astropy.table import Table
+
+from . import errors
+from .cache import hash_file, hash_option_value
+from .log import forward_worker_logs, init_worker_logging, load_logger, log_context
+from .segmentation import create_sextractor_products
+from .utils import PathLike, list_of_strings, make_keys_uppercase
+
+__all__ = [
+    "JobManifest",
+    "JobResult",
+    "load_checkpoint",
+    "read_job_output",
+    "run_job",
+]
+
+logger = load_logger()
+
+CHECKPOINT_FILE_NAME = "checkpoint.jsonl"
+
+
+@dataclass
+class JobManifest:
+    """Inputs and options of a job (see run_job).
+
+    Attributes:
+        inputs: Paths to the fits files to process.
+        products: Products to create for every input (see
+            segmentation.create_sextractor_products). Defaults to the catalog.
+        extra_params: Extra measurement parameters to include in the catalogs.
+        options: SExtractor configuration options shared by all inputs.
+
+    Example:
+        manifest = JobManifest(inputs, products="catalog,OBJECTS", options=dict(DETECT_THRESH=3))
+        manifest.to_file("nightly.json")
+    """
+
+    inputs: List[str]
+    products: Union[str, List[str]] = "catalog"
+    extra_params: Optional[Union[str, List[str]]] = None
+    options: dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.inputs = [str(p) for p in self.inputs]
+        self.products = list_of_strings(self.products)
+        self.options = make_keys_uppercase(self.options)
+
+    @classmethod
+    def from_file(cls, file_name: PathLike) -> "JobManifest":
+        """Load a manifest from a json file or a text file with one input per line.
+
+        Args:
+            file_name: A json file with the manifest attributes as keys, or a text
+                file with one input path per line (blank lines and lines that
+                start with # are ignored).
+
+        Returns:
+            The job manifest.
+        """
+        text = Path(file_name).read_text()
+        if Path(file_name).suffix.lower() == ".json":
+            return cls(**json.loads(text))
+        lines = [line.strip() for line in text.splitlines()]
+        return cls([line for line in lines if line != "" and not line.startswith("#")])
+
+    def to_file(self, file_name: PathLike):
+        """Write the manifest to a json file."""
+        Path(file_name).write_text(json.dumps(asdict(self), indent=2, default=str))
+
+    def item_key(self, input_path: PathLike) -> str:
+        """Return the hash of an input file's contents and the job options.
+
+        Note:
+            Options that name files (e.g., FILTER_NAME or WEIGHT_IMAGE) are
+            hashed by the contents of the files, so editing them reprocesses
+            the inputs.
+
+        Args:
+            input_path: Path to one of the inputs.
+
+        Returns:
+            The content hash of the work item.
+        """
+        sha = hashlib.sha256(hash_file(input_path).encode())
+        settings = dict(
+            products=self.products,
+            extra_params=(
+                None
+                if self.extra_params is None
+                else list_of_strings(self.extra_params)
+            ),
+            options={k: hash_option_value(v) for k, v in self.options.items()},
+        )
+        sha.update(json.dumps(settings, sort_keys=True, default=str).encode())
+        return sha.hexdigest()
+
+
+@dataclass
+class JobResult:
+    """Outcome of a job.
+
+    Attributes:
+        outputs: Output file of every completed input (including skipped ones).
+        skipped: Inputs that were already done in the checkpoint file.
+        failed: Error message of every failed input.
+    """
+
+    outputs: Dict[str, Path] = field(default_factory=dict)
+    skipped: List[str] = field(default_factory=list)
+    failed: Dict[str, str] = field(default_factory=dict)
+
+
+def _write_atomically(hdul: fits.HDUList, file_name: Path) -> str:
+    """Write a fits file under a temporary name and rename it, returning its hash."""
+    file_name.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(
+        prefix=".", suffix=".fits.part", dir=file_name.parent
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            hdul.writeto(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, file_name)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+    return hash_file(file_name)
+
+
+def _process_item(
+    input_path: str,
+    output_file: Path,
+    manifest: JobManifest,
+    run_label: str,
+    tmp_path: PathLike,
+) -> Tuple[str, int]:
+    """Create the products of one input and write them to one fits file."""
+    scratch_path = tempfile.mkdtemp(prefix="sew_job_", dir=tmp_path)
+    try:
+        with log_context(run_label=run_label):
+            products = create_sextractor_products(
+                input_path,
+                products=manifest.products,
+                tmp_path=scratch_path,
+                extra_params=manifest.extra_params,
+                **manifest.options,
+            )
+    finally:
+        shutil.rmtree(scratch_path, ignore_errors=True)
+
+    hdul = fits.HDUList([fits.PrimaryHDU()])
+    hdul[0].header["SEWINPUT"] = os.path.basename(input_path)
+    num_rows = 0
+    for name, product in products.items():
+        if isinstance(product, Table):
+            hdu = fits.table_to_hdu(product)
+            num_rows = len(product)
+        else:
+            data = product.astype(np.uint8) if product.dtype == bool else product
+            hdu = fits.ImageHDU(data)
+        hdu.name = name.upper()
+        hdul.append(hdu)
+    return _write_atomically(hdul, output_file), num_rows
+
+
+def load_checkpoint(checkpoint_file: PathLike) -> Dict[str, dict]:
+    """Load the latest checkpoint entry of every input.
+
+    Note:
+        The checkpoint file is append-only, with one json entry per line, so a
+        crash can at most leave a partial last line, which is ignored.
+
+    Args:
+        checkpoint_file: Path to the checkpoint file.
+
+    Returns:
+        Dictionary that maps the inputs to their latest entries.
+    """
+    entries: Dict[str, dict] = {}
+    if not os.path.isfile(checkpoint_file):
+        return entries
+    with open(checkpoint_file) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning("Ignoring corrupt checkpoint entry: %s", line.strip())
+                continue
+            entries[entry["input"]] = entry
+    return entries
+
+
+def _is_done(entry: Optional[dict], key: str, verify: bool) -> bool:
+    if entry is None or entry["status"] != "done" or entry["key"] != key:
+        return False
+    if not os.path.isfile(entry["output"]):
+        return False
+    return not verify or hash_file(entry["output"]) == entry["output_sha256"]
+
+
+def run_job(
+    manifest: Union[JobManifest, PathLike],
+    output_path: PathLike,
+    max_workers: Optional[int] = None,
+    checkpoint_file: Optional[PathLike] = None,
+    tmp_path: PathLike = "/tmp",
+    verify: bool = True,
+) -> JobResult:
+    """Run SExtractor on every input of a manifest, resuming where a previous run stopped.
+
+    Note:
+        Every input is processed by create_sextractor_products in a pool of
+        processes, and its products are written to one fits file (an extension
+        per product, with boolean masks as uint8). Output files are written
+        under a temporary name and renamed when complete, so a partial output
+        is never read. They are sharded into subdirectories of output_path by
+        the first two characters of the item key of their input (see
+        JobManifest.item_key).
+
+        When an input is done, an entry with the content hash of the input and
+        the options, the output file, and the output's hash is appended to the
+        checkpoint file. Inputs with a matching entry are skipped when the job
+        is run again, so a crashed or killed job resumes where it stopped.
+        Changing an input file or the options reprocesses it, and failed inputs
+        are retried.
+
+        To time out hung SExtractor runs, set the SEW_TIMEOUT env variable. With
+        production logging on (see log.enable_production_logging), the records
+        of the workers are forwarded to its handler, tagged with the index of
+        their input as run_label.
+
+    Args:
+        manifest: The job manifest, or the path to a manifest file (see
+            JobManifest.from_file).
+        output_path: Directory of the output files.
+        max_workers: Maximum number of worker processes. Defaults to the number of CPUs.
+        checkpoint_file: Path to the checkpoint file. Defaults to checkpoint.jsonl
+            in output_path.
+        tmp_path: Parent directory of the scratch directories of the workers.
+        verify: If True, check the hash of the output file of every done input
+            before skipping it.
+
+    Returns:
+        The output file of every done input and the error of every failed input.
+
+    Example:
+        result = sew.jobs.run_job("nightly.json", "/data/nightly", max_workers=16)
+        products = sew.jobs.read_job_output(result.outputs[input_path])
+    """
+    if not isinstance(manifest, JobManifest):
+        manifest = JobManifest.from_file(manifest)
+    if len(set(manifest.inputs)) != len(manifest.inputs):
+        raise errors.SEWError("the inputs of a job manifest must be unique")
+    output_path = Path(output_path)
+    output_path.mkdir(parents=True, exist_ok=True)
+    if checkpoint_file is None:
+        checkpoint_file = output_path / CHECKPOINT_FILE_NAME
+    checkpoint = load_checkpoint(checkpoint_file)
+
+    result = JobResult()
+    todo: Dict[str, str] = {}
+    for input_path in manifest.inputs:
+        try:
+            key = manifest.item_key(input_path)
+        except OSError as e:
+            result.failed[input_path] = f"{type(e).__name__}: {e}"
+            continue
+        entry = checkpoint.get(input_path)
+        if _is_done(entry, key, verify):
+            assert entry is not None
+            result.skipped.append(input_path)
+            result.outputs[input_path] = Path(entry["output"])
+        else:
+            todo[input_path] = key
+    logger.info(
+        "Running job on %s inputs (%s already done)", len(todo), len(result.skipped)
+    )
+
+    # start a new line if a crash left a partial entry at the end of the file
+    if os.path.isfile(checkpoint_file) and os.path.getsize(checkpoint_file) > 0:
+        with open(checkpoint_file, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+    max_workers = max_workers or os.cpu_count() or 1
+    # the pool is shut down before the records of its workers stop being forwarded
+    with forward_worker_logs() as log_queue, open(
+        checkpoint_file, "a"
+    ) as checkpoint_log, ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=init_worker_logging,
+        initargs=(log_queue, logger.level),
+    ) as executor:
+
+        def _append_entry(**entry):
+            checkpoint_log.write(json.dumps(dict(entry, time=time.time())) + "\n")
+            checkpoint_log.flush()
+            os.fsync(checkpoint_log.fileno())
+
+        futures = {}
+        for index, (input_path, key) in enumerate(todo.items()):
+            output_file = (
+                output_path / key[:2] / f"{Path(input_path).stem}_{key[:16]}.fits"
+            )
+            future = executor.submit(
+                _process_item, input_path, output_file, manifest, str(index), tmp_path
+            )
+            futures[future] = (input_path, key, output_file)
+
+        for future in as_completed(futures):
+            input_path, key, output_file = futures[future]
+            try:
+                output_sha256, num_rows = future.result()
+            except Exception as e:
+                message = f"{type(e).__name__}: {e}"
+                logger.error("Job input %s failed -> %s", input_path, message)
+                result.failed[input_path] = message
+                _append_entry(input=input_path, key=key, status="failed", error=message)
+                continue
+            result.outputs[input_path] = output_file
+            _append_entry(
+                input=input_path,
+                key=key,
+                status="done",
+                output=str(output_file),
+                output_sha256=output_sha256,
+                num_rows=num_rows,
+            )
+
+    if len(result.failed) > 0:
+        logger.warning(
+            "%s of %s job inputs failed", len(result.failed), len(manifest.inputs)
+        )
+    return result
+
+
+def read_job_output(file_name: PathLike) -> Dict[str, Union[Table, np.ndarray]]:
+    """Read the products of one input from a job output file.
+
+    Args:
+        file_name: Path to the output file.
+
+    Returns:
+        Dictionary with the products as keys (CATALOG for the catalog) and the
+        catalog (as an Astropy table) and check images (as numpy arrays) as values.
+    """
+    products: Dict[str, Union[Table, np.ndarray]] = {}
+    with fits.open(file_name, memmap=False) as hdul:
+        for hdu in hdul[1:]:
+            if isinstance(hdu, fits.BinTableHDU):
+                products[hdu.name] = Table.read(hdu)
+            else:
+                products[hdu.name] = hdu.data
+    return products
@@ -1,16 +1,61 @@
+import atexit
+import copy
+import json
 import logging
+import multiprocessing
+import queue
 import sys
-from typing import Literal
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Iterator, List, Literal, Optional
 
 from astropy.logger import AstropyLogger
 from astropy.utils.console import color_print
 
-__all__ = ["load_logger", "set_log_level"]
+__all__ = [
+    "capture_logs",
+    "disable_production_logging",
+    "enable_production_logging",
+    "forward_worker_logs",
+    "init_worker_logging",
+    "JSONFormatter",
+    "load_logger",
+    "log_context",
+    "set_log_level",
+]
 
 LoggerLevels = Literal[
     "DEBUG", "INFO", "WARNING", "ERROR", "debug", "info", "warning", "error"
 ]
 
+# fields (e.g., run_label) added to the records logged in the current context
+_log_context: ContextVar[dict] = ContextVar("sew_log_context", default={})
+# list that collects the records logged in the current context (see capture_logs)
+_captured_records: ContextVar[Optional[list]] = ContextVar(
+    "sew_captured_records", default=None
+)
+# listener thread of the production mode (None if it is off)
+_listener: Optional[QueueListener] = None
+
+
+class ContextFilter(logging.Filter):
+    """Add the fields of the current log context to records and capture them.
+
+    Logger filters run in the thread that logs the record, so the context of
+    the run that logged it is used even when the record is handled by another
+    thread (e.g., the queue listener of the production mode).
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _log_context.get()
+        record.run_label = context.get("run_label")
+        record.sew_context = context
+        captured = _captured_records.get()
+        if captured is not None:
+            captured.append(record)
+        return True
+
 
 class SEWLogger(AstropyLogger):
     def _set_defaults(self, level="INFO"):
@@ -20,6 +65,8 @@ class SEWLogger(AstropyLogger):
         # Remove all previous handlers
         for handler in self.handlers[:]:
             self.removeHandler(handler)
+        for log_filter in self.filters[:]:
+            self.removeFilter(log_filter)
 
         # Set levels
         self.setLevel(level)
@@ -27,6 +74,7 @@ class SEWLogger(AstropyLogger):
         # Set up the stdout handlers
         self.sh = StreamHandler()
         self.addHandler(self.sh)
+        self.addFilter(ContextFilter())
         self.propagate = False
 
 
@@ -55,23 +103,82 @@ class StreamHandler(logging.StreamHandler):
         else:
             color_print(record.levelname, "red", end="", file=stream)
 
-        msg = f" [{record.filename}:{record.lineno}] {record.msg}"
+        msg = f" [{record.filename}:{record.lineno}] {record.getMessage()}"
         print(msg, file=stream)
 
 
-def load_logger(log_level: LoggerLevels = "INFO") -> logging.Logger:
+class JSONFormatter(logging.Formatter):
+    """Format log records as single-line json objects.
+
+    Each record has the keys time, level, message, module, line, and run_label,
+    plus the other fields of its log context and the traceback of exceptions.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = dict(
+            time=record.created,
+            level=record.levelname,
+            message=record.getMessage(),
+            module=record.module,
+            line=record.lineno,
+            run_label=getattr(record, "run_label", None),
+        )
+        entry.update(getattr(record, "sew_context", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # the traceback of a record sent by a worker process
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _RecordQueueHandler(QueueHandler):
+    """Put records in a queue without formatting them.
+
+    QueueHandler.prepare formats the message in the logging thread and drops
+    the exception info. Here, only the message arguments are merged into the
+    message (so later changes to them are not logged), and the record keeps
+    its exception info, so the handler of the listener formats the whole
+    record (e.g., the traceback of JSONFormatter). Records sent to another
+    process (picklable=True) keep the formatted traceback as exc_text instead,
+    because tracebacks cannot be pickled.
+    """
+
+    def __init__(self, log_queue, picklable: bool = False):
+        super().__init__(log_queue)
+        self.picklable = picklable
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if self.picklable and record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def load_logger(log_level: Optional[LoggerLevels] = None) -> logging.Logger:
     """Load the SEW logger.
 
+    Note:
+        The handlers are set up the first time the logger is loaded, so loading
+        it again (e.g., when a module is imported) keeps the handlers and level.
+
     Args:
-        log_level: Desired logging level. Defaults to "INFO".
+        log_level: Desired logging level. Defaults to "INFO" the first time the
+            logger is loaded and to the current level after that.
 
     Returns:
         Logger object that inherits from the Astropy logger.
     """
     logging.setLoggerClass(SEWLogger)
     logger = logging.getLogger("SEWLogger")
-    logger._set_defaults()  # type: ignore
-    logger.setLevel(log_level.upper())
+    if not getattr(logger, "_sew_configured", False):
+        logger._set_defaults()  # type: ignore
+        logger._sew_configured = True  # type: ignore
+    if log_level is not None:
+        logger.setLevel(log_level.upper())
     return logger
 
 
@@ -86,3 +193,164 @@ def set_log_level(log_level: LoggerLevels) -> logging.Logger:
     """
     logger = load_logger(log_level)
     return logger
+
+
+@contextmanager
+def log_context(**fields) -> Iterator[None]:
+    """Add fields (e.g., run_label) to the records logged in a block of code.
+
+    Note:
+        The context is local to the current thread or asyncio task. Fields that
+        are None are ignored, so nested contexts do not erase outer fields.
+
+    Args:
+        **fields: The fields to add to the records.
+
+    Example:
+        with sew.log_context(run_label="frame_042"):
+            sew.run(image)
+    """
+    fields = {k: v for k, v in fields.items() if v is not None}
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+@contextmanager
+def capture_logs() -> Iterator[List[logging.LogRecord]]:
+    """Collect the records logged by SEW in a block of code (in this thread or task).
+
+    Note:
+        Only records at or above the level of the logger are collected. They
+        are also handled as usual.
+
+    Yields:
+        The list that the log records are appended to.
+
+    Example:
+        with sew.capture_logs() as records:
+            sew.run(image, run_label="frame_042")
+        messages = [r.getMessage() for r in records]
+    """
+    records: List[logging.LogRecord] = []
+    token = _captured_records.set(records)
+    try:
+        yield records
+    finally:
+        _captured_records.reset(token)
+
+
+def enable_production_logging(
+    handler: Optional[logging.Handler] = None, json_format: bool = True
+) -> QueueListener:
+    """Log through a queue, so that logging never blocks the threads running SEW.
+
+    Note:
+        Records are put in a queue by the logging thread (see
+        _RecordQueueHandler) and formatted and written by a listener thread,
+        which is stopped (and the queue flushed) at exit or by
+        disable_production_logging.
+
+    Args:
+        handler: Handler that writes the records (e.g., a logging.FileHandler).
+            Defaults to a stream handler that writes to stderr.
+        json_format: If True, write the records as json objects (see JSONFormatter).
+
+    Returns:
+        The queue listener.
+
+    Example:
+        sew.enable_production_logging(logging.FileHandler("sew.jsonl"))
+    """
+    global _listener
+    disable_production_logging()
+    logger = load_logger()
+    if handler is None:
+        handler = logging.StreamHandler(sys.stderr)
+    if json_format:
+        handler.setFormatter(JSONFormatter())
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    for old_handler in logger.handlers[:]:
+        logger.removeHandler(old_handler)
+    logger.addHandler(_RecordQueueHandler(log_queue))
+    _listener.start()
+    return _listener
+
+
+def disable_production_logging():
+    """Stop the queue listener and go back to logging to the terminal."""
+    global _listener
+    if _listener is None:
+        return
+    logger = load_logger()
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.flush()
+    _listener = None
+    for old_handler in logger.handlers[:]:
+        logger.removeHandler(old_handler)
+    logger.addHandler(logger.sh)  # type: ignore
+
+
+@contextmanager
+def forward_worker_logs() -> Iterator[Optional[queue.Queue]]:
+    """Forward the records of worker processes to the production logging handler.
+
+    Note:
+        Worker processes cannot log through the queue of the production mode,
+        because its listener thread only runs in the main process. Inside this
+        context, a queue that can be shared with other processes is drained by
+        a second listener in this process, and the workers log to it after
+        calling init_worker_logging (e.g., as the initializer of a process pool).
+        If the production mode is off, workers log to the terminal as usual and
+        no queue is created.
+
+    Yields:
+        The queue to pass to init_worker_logging, or None if the production mode
+        is off.
+
+    Example:
+        with sew.forward_worker_logs() as log_queue, ProcessPoolExecutor(
+            initializer=sew.init_worker_logging, initargs=(log_queue,)
+        ) as executor:
+            ...
+    """
+    if _listener is None:
+        yield None
+        return
+    logger = load_logger()
+    with multiprocessing.Manager() as manager:
+        log_queue = manager.Queue()
+        forwarder = QueueListener(log_queue, *logger.handlers)
+        forwarder.start()
+        try:
+            yield log_queue
+        finally:
+            forwarder.stop()
+
+
+def init_worker_logging(log_queue: Optional[queue.Queue], level: int = logging.INFO):
+    """Send the records of a worker process to the queue of forward_worker_logs.
+
+    Args:
+        log_queue: The queue yielded by forward_worker_logs. If None, the logging
+            setup of the worker is not changed.
+        level: Logging level of the worker (e.g., the level of the logger in the
+            main process, which a spawned worker does not inherit).
+    """
+    global _listener
+    if log_queue is None:
+        return
+    # a forked worker inherits the listener, but not its thread
+    _listener = None
+    logger = load_logger()
+    logger.setLevel(level)
+    for old_handler in logger.handlers[:]:
+        logger.removeHandler(old_handler)
+    logger.addHandler(_RecordQueueHandler(log_queue, picklable=True))
+
+
+atexit.register(disable_production_logging)
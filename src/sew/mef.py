@@ -0,0 +1,149 @@
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Union
+
+from astropy.io import fits
+from astropy.table import Table
+
+from . import errors, utils
+from .catalog import read_catalog_extensions
+from .log import load_logger
+from .report import RunReport, emit_report
+from .sextractor import (
+    DEFAULT_CONFIG_PATH,
+    DEFAULT_PARAMS,
+    _build_options,
+    _build_params,
+    _run_sextractor,
+)
+from .utils import MEFPathOrPixels, PathLike, StagingModes
+
+__all__ = ["run_mef"]
+
+logger = load_logger()
+
+
+def run_mef(
+    path_or_pixels: MEFPathOrPixels,
+    headers: Optional[Sequence[Optional[fits.Header]]] = None,
+    run_label: Optional[str] = None,
+    extra_params: Optional[Union[str, List[str]]] = None,
+    config_file_path: Optional[PathLike] = DEFAULT_CONFIG_PATH,
+    catalog_file_path: Optional[PathLike] = None,
+    tmp_path: PathLike = "/tmp",
+    staging: StagingModes = "disk",
+    report: Optional[RunReport] = None,
+    timeout: Optional[float] = None,
+    retries: int = 0,
+    **sextractor_options,
+) -> Dict[str, Table]:
+    """Run Source Extractor once on all extensions of a multi-extension image.
+
+    Note:
+        SExtractor processes every image extension of a multi-extension fits
+        (MEF) file in a single run, which avoids splitting the file and paying
+        the start-up cost of SExtractor once per extension. The catalog is split
+        into one table per extension, keyed by EXTNAME (or by HDU index for
+        extensions without one).
+
+        The catalog must be FITS_LDAC (the default) or FITS_1.0, because ASCII
+        catalogs cannot be split by extension.
+
+    Args:
+        path_or_pixels: Path to a MEF file, a 3-D numpy array, or a list of 2-D
+            numpy arrays. Pixels are staged as a single MEF file.
+        headers: Astropy fits header objects, one per plane (pixels only). Set
+            EXTNAME in the headers to name the catalogs; otherwise, the catalogs
+            are keyed by the HDU index of their extension ("1", "2", ...).
+        run_label: Unique file label for this function call (useful when running in parallel).
+        extra_params: Extra measurement parameters to include beyond the defaults.
+        config_file_path: Custom SExtractor config file.
+        catalog_file_path: Custom file name + location for the output SExtractor catalog.
+        tmp_path: Parent directory of the scratch directory for temporary files.
+        staging: Where to write the temporary fits file (see sextractor.run).
+        report: Optional empty RunReport (see sextractor.run).
+        timeout: Timeout of each SExtractor run in seconds (see sextractor.run).
+        retries: Number of times to rerun SExtractor if it fails (see sextractor.run).
+        **sextractor_options: Any SExtractor configuration option passed as a keyword.
+
+    Returns:
+        Dictionary of SExtractor catalogs keyed by extension name, in file order.
+
+    Example:
+        catalogs = sew.mef.run_mef("camera_frame.fits", DETECT_THRESH=3)
+        ccd_3 = catalogs["CCD3"]
+    """
+    if report is None:
+        report = RunReport()
+    report.run_label = run_label
+    with report.stage("setup"):
+        final_options = _build_options(sextractor_options)
+        params = _build_params(extra_params)
+        if final_options["CATALOG_TYPE"] not in ["FITS_1.0", "FITS_LDAC"]:
+            raise errors.SEWError(
+                "multi-extension runs need a FITS_1.0 or FITS_LDAC catalog"
+            )
+
+    scratch_path = Path(tempfile.mkdtemp(prefix="sew_mef_", dir=tmp_path))
+    image_path: Optional[Path] = None
+    created_tmp = False
+    try:
+        with report.stage("stage"):
+            image_path, created_tmp = utils.create_temp_mef_file_if_necessary(
+                path_or_pixels,
+                headers=headers,
+                run_label=run_label,
+                tmp_path=scratch_path,
+                staging=staging,
+            )
+            extnames = utils.image_extension_names(image_path)
+            if len(extnames) == 0:
+                raise errors.SEWError(f"{image_path} has no image extensions")
+            cat_name = Path(catalog_file_path or scratch_path / "se.cat")
+            param_file_name = None
+            if len(params) > len(DEFAULT_PARAMS):
+                param_file_name = scratch_path / "params.se"
+                with open(param_file_name, "w") as f:
+                    f.write("\n".join(params))
+                final_options["PARAMETERS_NAME"] = param_file_name
+
+        logger.debug(
+            "Running SExtractor on %s extensions of %s", len(extnames), image_path
+        )
+        with report.stage("sextractor"):
+            _run_sextractor(
+                image_path,
+                cat_name,
+                config_file_path,
+                final_options,
+                report,
+                timeout=timeout,
+                retries=retries,
+            )
+        report.record_written_files(
+            image_path if created_tmp else None,
+            param_file_name,
+            cat_name,
+            *utils.checkimage_file_names(final_options),
+        )
+
+        with report.stage("parse"):
+            tables = read_catalog_extensions(cat_name, final_options["CATALOG_TYPE"])
+        if len(tables) != len(extnames):
+            raise errors.SEWError(
+                f"SExtractor wrote {len(tables)} tables for {len(extnames)} "
+                f"image extensions of {image_path}"
+            )
+    finally:
+        with report.stage("cleanup"):
+            # files staged with staging="memory" are outside the scratch directory
+            if created_tmp and image_path is not None and image_path.is_file():
+                os.remove(image_path)
+            shutil.rmtree(scratch_path, ignore_errors=True)
+
+    catalogs = dict(zip(extnames, tables))
+    report.num_rows = sum(len(cat) for cat in tables)
+    emit_report(report)
+    return catalogs
@@ -0,0 +1,164 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Sequence, Union
+
+import numpy as np
+from astropy.io import fits
+from astropy.table import Table
+
+from . import errors, utils
+from .catalog import read_catalog
+from .log import load_logger
+from .report import RunReport, emit_report
+from .sextractor import (
+    DEFAULT_CONFIG_PATH,
+    DEFAULT_PARAMS,
+    _build_options,
+    _build_params,
+    _run_sextractor,
+)
+from .utils import PathLike, PathOrPixels, StagingModes
+
+__all__ = ["run_dual_image"]
+
+logger = load_logger()
+
+
+def run_dual_image(
+    detection_path_or_pixels: PathOrPixels,
+    measurement_paths_or_pixels: Sequence[PathOrPixels],
+    detection_header: Optional[fits.Header] = None,
+    measurement_headers: Optional[Sequence[Optional[fits.Header]]] = None,
+    extra_params: Optional[Union[str, List[str]]] = None,
+    config_file_path: Optional[PathLike] = DEFAULT_CONFIG_PATH,
+    max_workers: Optional[int] = None,
+    tmp_path: PathLike = "/tmp",
+    staging: StagingModes = "disk",
+    timeout: Optional[float] = None,
+    retries: int = 0,
+    **sextractor_options,
+) -> List[Table]:
+    """Run Source Extractor in dual-image mode on several measurement images.
+
+    Note:
+        Sources are detected on the detection image and measured on each of the
+        measurement images (e.g., detect on g+r and measure on g and r). The
+        detection image and the options are staged once, and the measurement
+        passes run concurrently. Because every pass uses the same detection image
+        and options, row i of every returned catalog is the same source.
+
+        CHECKIMAGE files are shared by all passes, so do not request them here.
+
+    Args:
+        detection_path_or_pixels: Path to the detection fits file or its pixels.
+        measurement_paths_or_pixels: Paths to the measurement fits files and/or their
+            pixels. All images must have the same shape as the detection image.
+        detection_header: Astropy fits header object for the detection image.
+        measurement_headers: Astropy fits header objects for the measurement images.
+        extra_params: Extra measurement parameters to include beyond the defaults.
+        config_file_path: Custom SExtractor config file.
+        max_workers: Maximum number of concurrent SExtractor processes. Defaults
+            to the number of CPUs.
+        tmp_path: Parent directory of the scratch directory for temporary files.
+        staging: Where to write temporary fits files (see sextractor.run).
+        timeout: Timeout of each SExtractor run in seconds (see sextractor.run).
+        retries: Number of times to rerun SExtractor if it fails (see sextractor.run).
+        **sextractor_options: Any SExtractor configuration option passed as a keyword.
+
+    Returns:
+        One SExtractor catalog per measurement image, aligned row by row.
+
+    Example:
+        cat_g, cat_r = sew.multiband.run_dual_image(image_gr, [image_g, image_r])
+    """
+    if measurement_headers is None:
+        measurement_headers = [None] * len(measurement_paths_or_pixels)
+    if len(measurement_headers) != len(measurement_paths_or_pixels):
+        raise errors.SEWError(
+            "there must be one measurement header per measurement image"
+        )
+    shapes = set(
+        p.shape
+        for p in [detection_path_or_pixels, *measurement_paths_or_pixels]
+        if isinstance(p, np.ndarray)
+    )
+    if len(shapes) > 1:
+        raise errors.SEWError(
+            f"detection and measurement images have different shapes: {shapes}"
+        )
+
+    final_options = _build_options(sextractor_options)
+    params = _build_params(extra_params)
+    scratch_path = Path(tempfile.mkdtemp(prefix="sew_dual_", dir=tmp_path))
+    created_tmp_files: List[Path] = []
+    try:
+        if len(params) > len(DEFAULT_PARAMS):
+            param_file_name = scratch_path / "params.se"
+            with open(param_file_name, "w") as f:
+                f.write("\n".join(params))
+            final_options["PARAMETERS_NAME"] = param_file_name
+
+        detection_path, created_tmp = utils.create_temp_fits_file_if_necessary(
+            detection_path_or_pixels,
+            header=detection_header,
+            run_label="detection",
+            tmp_path=scratch_path,
+            staging=staging,
+        )
+        if created_tmp:
+            created_tmp_files.append(detection_path)
+
+        def _measure(i: int) -> Table:
+            report = RunReport(run_label=f"measurement_{i}")
+            with report.stage("stage"):
+                staged = utils.create_temp_fits_file_if_necessary(
+                    measurement_paths_or_pixels[i],
+                    header=measurement_headers[i],  # type: ignore
+                    run_label=f"measurement_{i}",
+                    tmp_path=scratch_path,
+                    staging=staging,
+                )
+            measurement_path, created_tmp = staged
+            if created_tmp:
+                created_tmp_files.append(measurement_path)
+            cat_name = scratch_path / f"se_{i}.cat"
+            with report.stage("sextractor"):
+                _run_sextractor(
+                    f"{detection_path},{measurement_path}",
+                    cat_name,
+                    config_file_path,
+                    final_options,
+                    report,
+                    timeout=timeout,
+                    retries=retries,
+                )
+            report.record_written_files(
+                measurement_path if created_tmp else None, cat_name
+            )
+            with report.stage("parse"):
+                catalog = read_catalog(cat_name, final_options["CATALOG_TYPE"])
+            report.num_rows = len(catalog)
+            emit_report(report)
+            return catalog
+
+        max_workers = max_workers or os.cpu_count() or 1
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            catalogs = list(
+                executor.map(_measure, range(len(measurement_paths_or_pixels)))
+            )
+    finally:
+        # files staged with staging="memory" are outside the scratch directory
+        for fn in created_tmp_files:
+            if fn.is_file():
+                os.remove(fn)
+        shutil.rmtree(scratch_path, ignore_errors=True)
+
+    num_rows = set(len(cat) for cat in catalogs)
+    if len(num_rows) > 1:
+        raise errors.SEWError(
+            f"dual-image catalogs are not aligned (number of rows: {num_rows})"
+        )
+    return catalogs
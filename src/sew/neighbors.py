@@ -0,0 +1,171 @@
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from astropy.table import Table
+from scipy import sparse
+from scipy.sparse import csgraph
+from scipy.spatial import cKDTree
+
+from . import errors
+from .log import load_logger
+from .segmentation import DEFAULT_XY_FLUX_NAMES, select_brightest
+
+__all__ = ["find_close_pairs", "find_groups"]
+
+logger = load_logger()
+
+
+def _pairs_within_radius(
+    catalog: Table,
+    radius: float,
+    max_num_sources: int,
+    xy_flux_column_names: Optional[Dict[str, str]],
+    min_flux_ratio: float,
+    max_flux_ratio: float,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Return the selected sources and the close pairs that pass the flux cuts.
+
+    The pairs (catalog indices of the brighter and fainter source, separations,
+    and flux ratios) are sorted by the flux of the brighter source.
+    """
+    if radius <= 0:
+        raise errors.SEWError(f"the radius must be positive, not {radius}")
+    if xy_flux_column_names is None:
+        xy_flux_column_names = DEFAULT_XY_FLUX_NAMES
+    flux = np.asarray(catalog[xy_flux_column_names["flux"]], dtype=float)
+    selected = select_brightest(flux, max_num_sources)
+    xy = np.column_stack(
+        [
+            np.asarray(catalog[xy_flux_column_names["x"]], dtype=float)[selected],
+            np.asarray(catalog[xy_flux_column_names["y"]], dtype=float)[selected],
+        ]
+    )
+    pairs = cKDTree(xy).query_pairs(radius, output_type="ndarray")
+    # selected is sorted by decreasing flux, so the first source is the brighter one
+    pairs.sort(axis=1)
+    separation = np.hypot(*(xy[pairs[:, 0]] - xy[pairs[:, 1]]).T)
+    bright = selected[pairs[:, 0]]
+    faint = selected[pairs[:, 1]]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        flux_ratio = flux[faint] / flux[bright]
+    keep = (flux_ratio >= min_flux_ratio) & (flux_ratio <= max_flux_ratio)
+    logger.debug(
+        "Found %s pairs within %s pixels among %s sources (%s pass the flux cuts)",
+        len(pairs),
+        radius,
+        len(selected),
+        keep.sum(),
+    )
+    pairs, separation, flux_ratio = pairs[keep], separation[keep], flux_ratio[keep]
+    order = np.lexsort((separation, pairs[:, 0]))
+    return (
+        selected,
+        selected[pairs[order, 0]],
+        selected[pairs[order, 1]],
+        separation[order],
+        flux_ratio[order],
+    )
+
+
+def find_close_pairs(
+    catalog: Table,
+    radius: float,
+    max_num_sources: int = 100_000,
+    xy_flux_column_names: Optional[Dict[str, str]] = None,
+    min_flux_ratio: float = 0.0,
+    max_flux_ratio: float = 1.0,
+) -> Table:
+    """Find the pairs of sources closer than a radius (e.g., to detect double stars).
+
+    Note:
+        The pairs are found with a KD-tree of the source positions, so the cost
+        scales with the number of sources rather than the number of pixels (as
+        when searching a source map made by create_source_map).
+
+    Args:
+        catalog: Catalog of sources with their image positions and fluxes.
+        radius: Maximum separation of the pairs in pixels.
+        max_num_sources: Maximum number of sources to search. Sources will be
+            sorted by flux and fainter sources will be dropped first.
+        xy_flux_column_names: Names of the columns in the catalog. Must be a dictionary
+            with values for keys = 'x', 'y', and 'flux'. For example:
+            {'x': 'x_col', 'y': y_col', 'flux': 'flux_col'}.
+        min_flux_ratio: Minimum ratio of the fainter to the brighter flux of a pair.
+        max_flux_ratio: Maximum ratio of the fainter to the brighter flux of a pair.
+
+    Returns:
+        Table with one row per pair, sorted by the flux of the brighter source, with
+        the catalog row indices of the brighter (INDEX_1) and fainter (INDEX_2) source,
+        their SEPARATION in pixels, and their FLUX_RATIO (fainter / brighter).
+
+    Example:
+        # similar pairs of stars closer than 5 pixels
+        pairs = find_close_pairs(catalog, 5, min_flux_ratio=0.5)
+        primaries = catalog[pairs["INDEX_1"]]
+    """
+    _, bright, faint, separation, flux_ratio = _pairs_within_radius(
+        catalog,
+        radius,
+        max_num_sources,
+        xy_flux_column_names,
+        min_flux_ratio,
+        max_flux_ratio,
+    )
+    return Table(
+        [bright, faint, separation, flux_ratio],
+        names=["INDEX_1", "INDEX_2", "SEPARATION", "FLUX_RATIO"],
+    )
+
+
+def find_groups(
+    catalog: Table,
+    radius: float,
+    max_num_sources: int = 100_000,
+    xy_flux_column_names: Optional[Dict[str, str]] = None,
+    min_flux_ratio: float = 0.0,
+    max_flux_ratio: float = 1.0,
+) -> np.ndarray:
+    """Group sources that are linked by chains of close pairs (friends-of-friends).
+
+    Note:
+        Two sources are in the same group if they are closer than radius (and
+        pass the flux-ratio cuts), or are both linked to a third source in the
+        group, and so on. The pairs are found as in find_close_pairs.
+
+    Args:
+        catalog: Catalog of sources with their image positions and fluxes.
+        radius: Linking length in pixels.
+        max_num_sources: Maximum number of sources to group. Sources will be
+            sorted by flux and fainter sources will be dropped first.
+        xy_flux_column_names: Names of the x, y, and flux columns (see find_close_pairs).
+        min_flux_ratio: Minimum ratio of the fainter to the brighter flux of a link.
+        max_flux_ratio: Maximum ratio of the fainter to the brighter flux of a link.
+
+    Returns:
+        Group number of every source in the catalog (-1 for the dropped sources).
+        Isolated sources are groups of one.
+
+    Example:
+        groups = find_groups(catalog, 10)
+        catalog["GROUP"] = groups
+        sizes = np.bincount(groups[groups >= 0])
+        blended = catalog[(groups >= 0) & (sizes[groups] > 1)]
+    """
+    selected, bright, faint, _, _ = _pairs_within_radius(
+        catalog,
+        radius,
+        max_num_sources,
+        xy_flux_column_names,
+        min_flux_ratio,
+        max_flux_ratio,
+    )
+    num_sources = len(catalog)
+    graph = sparse.coo_matrix(
+        (np.ones(len(bright), dtype=np.uint8), (bright, faint)),
+        shape=(num_sources, num_sources),
+    )
+    _, labels = csgraph.connected_components(graph, directed=False)
+    # number the groups of the selected sources consecutively
+    groups = np.full(num_sources, -1, dtype=np.int64)
+    _, groups[selected] = np.unique(labels[selected], return_inverse=True)
+    return groups
@@ -0,0 +1,199 @@
+import contextvars
+import os
+import signal
+import subprocess
+import sys
+import threading
+from typing import Callable, List, NamedTuple, Optional, Sequence
+
+from .log import load_logger
+
+__all__ = [
+    "get_default_timeout",
+    "kill_process_group",
+    "ProcessResult",
+    "run_process",
+    "set_default_timeout",
+]
+
+logger = load_logger()
+
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+_MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+# timeout of every process in seconds, unless one is given per call
+_default_timeout: Optional[float] = (
+    float(os.environ["SEW_TIMEOUT"]) if os.getenv("SEW_TIMEOUT") else None
+)
+
+
+class ProcessResult(NamedTuple):
+    """Exit status and resource usage of a finished child process."""
+
+    returncode: int
+    stderr: str
+    user_seconds: Optional[float] = None
+    system_seconds: Optional[float] = None
+    max_rss_bytes: Optional[int] = None
+    timed_out: bool = False
+    stdout: str = ""
+
+
+def set_default_timeout(timeout: Optional[float]):
+    """Set the timeout of every SExtractor run that is not given its own timeout.
+
+    Note:
+        The default timeout can also be set with the SEW_TIMEOUT env variable.
+
+    Args:
+        timeout: Timeout in seconds, or None for no timeout.
+    """
+    global _default_timeout
+    _default_timeout = None if timeout is None else float(timeout)
+
+
+def get_default_timeout() -> Optional[float]:
+    """Return the default timeout in seconds (None if there is none)."""
+    return _default_timeout
+
+
+def kill_process_group(pid: int):
+    """Kill the process group led by pid (i.e., a process and all of its children)."""
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def _exit_code(status: int) -> int:
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def _wait_without_reaping(proc: subprocess.Popen):
+    """Wait for a process to exit but leave it a zombie, so its pid is not reused."""
+    if hasattr(os, "waitid"):
+        os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOWAIT)
+    else:
+        proc.wait()
+
+
+def run_process(
+    argv: Sequence[str],
+    timeout: Optional[float] = None,
+    stdout_callback: Optional[Callable[[bytes], None]] = None,
+) -> ProcessResult:
+    """Run a command without a shell, capturing its output and resource usage.
+
+    Note:
+        The command runs in a new process group. If it times out, or if the
+        calling thread is interrupted (e.g., by KeyboardInterrupt), the whole
+        group is killed, so that no orphaned children keep running.
+
+        The child's CPU time and peak resident memory come from os.wait4, which
+        is not available on every platform (they are None there).
+
+    Args:
+        argv: The command and its arguments.
+        timeout: Kill the command after this many seconds. Defaults to the
+            default timeout (see set_default_timeout).
+        stdout_callback: Optional function that is called with every chunk of the
+            stdout output as it arrives (in another thread, while the command
+            runs), instead of capturing it. If it raises an exception, the rest
+            of the output is discarded and the exception is raised once the
+            command has finished.
+
+    Returns:
+        The exit code, the stderr and stdout output, and the resource usage of
+        the command.
+    """
+    if timeout is None:
+        timeout = _default_timeout
+    proc = subprocess.Popen(
+        list(argv),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=True,
+    )
+    lock = threading.Lock()
+    finished = threading.Event()
+    timed_out = threading.Event()
+
+    def _kill(reason: str, flag: Optional[threading.Event] = None):
+        with lock:
+            if finished.is_set():
+                return
+            finished.set()
+            if flag is not None:
+                flag.set()
+            logger.warning("Killing process group %s -> %s", proc.pid, reason)
+            kill_process_group(proc.pid)
+
+    timer = None
+    if timeout is not None:
+        timer = threading.Timer(
+            timeout, _kill, args=(f"timed out after {timeout} s", timed_out)
+        )
+        timer.daemon = True
+        timer.start()
+    # read stdout in another thread, so that neither pipe can fill up and block
+    stdout_chunks: List[bytes] = []
+    callback_errors: List[BaseException] = []
+
+    def _read_stdout():
+        assert proc.stdout is not None
+        with proc.stdout:
+            if stdout_callback is None:
+                stdout_chunks.append(proc.stdout.read())
+                return
+            for chunk in iter(lambda: os.read(proc.stdout.fileno(), 1 << 16), b""):
+                if len(callback_errors) > 0:
+                    continue
+                try:
+                    stdout_callback(chunk)
+                except BaseException as e:
+                    callback_errors.append(e)
+
+    # in the caller's context, so the callback logs with its run_label
+    stdout_reader = threading.Thread(
+        target=contextvars.copy_context().run, args=(_read_stdout,), daemon=True
+    )
+    stdout_reader.start()
+    try:
+        assert proc.stderr is not None
+        with proc.stderr:
+            stderr = proc.stderr.read().decode(errors="replace")
+        stdout_reader.join()
+        _wait_without_reaping(proc)
+    except BaseException as e:
+        _kill(f"interrupted by {type(e).__name__}")
+        proc.wait()
+        raise
+    finally:
+        if timer is not None:
+            timer.cancel()
+    with lock:
+        finished.set()
+    if len(callback_errors) > 0:
+        proc.wait()
+        raise callback_errors[0]
+    stdout = b"".join(stdout_chunks).decode(errors="replace")
+
+    if proc.returncode is not None or not hasattr(os, "wait4"):
+        return ProcessResult(
+            proc.wait(), stderr, timed_out=timed_out.is_set(), stdout=stdout
+        )
+
+    _, status, rusage = os.wait4(proc.pid, 0)
+    # tell Popen the child has been reaped
+    proc.returncode = _exit_code(status)
+    return ProcessResult(
+        proc.returncode,
+        stderr,
+        rusage.ru_utime,
+        rusage.ru_stime,
+        rusage.ru_maxrss * _MAXRSS_UNIT,
+        timed_out.is_set(),
+        stdout,
+    )
@@ -0,0 +1,157 @@
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+from .log import load_logger
+from .process import ProcessResult
+from .utils import PathLike
+
+__all__ = ["add_report_hook", "remove_report_hook", "RunReport"]
+
+logger = load_logger()
+
+ReportHook = Callable[["RunReport"], None]
+_report_hooks: List[ReportHook] = []
+
+
+@dataclass
+class RunReport:
+    """Timing and resource report of a SExtractor run.
+
+    Pass an empty report to sextractor.run (or to one of the segmentation
+    helpers) to have it filled in, or register a hook with add_report_hook to
+    receive the report of every run.
+
+    Attributes:
+        run_label: The run label of the run (if any).
+        command: The SExtractor command line.
+        stage_seconds: Wall time of each stage in seconds. The stages are "setup"
+            (option validation), "cache" (result cache lookup), "stage" (writing
+            the temporary fits file), "sextractor" (the subprocess), "parse"
+            (reading the catalog), "cleanup", and "checkimage" (reading check
+            images in the segmentation helpers). With pipe_catalog, the catalog
+            is mostly parsed during the "sextractor" stage.
+        child_user_seconds: User CPU time of the SExtractor process.
+        child_system_seconds: System CPU time of the SExtractor process.
+        child_max_rss_bytes: Peak resident memory of the SExtractor process.
+        scratch_bytes_written: Bytes written to temporary and output files
+            (fits image, parameter file, catalog, and check images).
+        returncode: Exit code of the SExtractor process.
+        stderr: Everything SExtractor wrote to stderr.
+        num_rows: Number of rows in the catalog.
+        cache_hit: True if the catalog was loaded from the result cache.
+        error: Type and message of the exception that made the run fail (None
+            if it succeeded). The reports of failed runs are also passed to the
+            hooks.
+    """
+
+    run_label: Optional[str] = None
+    command: Optional[str] = None
+    stage_seconds: Dict[str, float] = field(default_factory=dict)
+    child_user_seconds: Optional[float] = None
+    child_system_seconds: Optional[float] = None
+    child_max_rss_bytes: Optional[int] = None
+    scratch_bytes_written: int = 0
+    returncode: Optional[int] = None
+    stderr: str = ""
+    num_rows: Optional[int] = None
+    cache_hit: bool = False
+    error: Optional[str] = None
+
+    @property
+    def total_seconds(self) -> float:
+        """Total wall time of all stages in seconds."""
+        return sum(self.stage_seconds.values())
+
+    @property
+    def failed(self) -> bool:
+        """True if the run raised an exception."""
+        return self.error is not None
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Add the wall time of a block of code to a stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + elapsed
+
+    def record_process(self, result: ProcessResult):
+        """Store the exit status and resource usage of the SExtractor process."""
+        self.returncode = result.returncode
+        self.stderr = result.stderr
+        self.child_user_seconds = result.user_seconds
+        self.child_system_seconds = result.system_seconds
+        self.child_max_rss_bytes = result.max_rss_bytes
+
+    def record_written_files(self, *file_names: Optional[PathLike]):
+        """Add the sizes of files written during the run (missing files are skipped)."""
+        for fn in file_names:
+            if fn is not None and Path(fn).is_file():
+                self.scratch_bytes_written += Path(fn).stat().st_size
+
+    def record_error(self, error: BaseException):
+        """Mark the run as failed with the exception it raised."""
+        self.error = f"{type(error).__name__}: {error}"
+
+    def to_dict(self) -> dict:
+        """Return the report as a dictionary (e.g., for json serialization)."""
+        report = asdict(self)
+        report["total_seconds"] = self.total_seconds
+        return report
+
+
+def add_report_hook(hook: ReportHook):
+    """Register a function that is called with the report of every SExtractor run.
+
+    Note:
+        Hooks are called from the thread that ran SExtractor, so they must be
+        thread-safe when runs are done in parallel. Exceptions raised by a hook
+        are logged and ignored.
+
+    Args:
+        hook: Function that takes a RunReport.
+
+    Example:
+        sew.add_report_hook(lambda report: metrics.send(report.to_dict()))
+    """
+    if hook not in _report_hooks:
+        _report_hooks.append(hook)
+
+
+def remove_report_hook(hook: ReportHook):
+    """Unregister a function added with add_report_hook."""
+    if hook in _report_hooks:
+        _report_hooks.remove(hook)
+
+
+def emit_report(report: RunReport):
+    """Call the registered hooks with a report."""
+    logger.debug(
+        "SExtractor run %s after %.3f s (stages: %s)",
+        "failed" if report.failed else "finished",
+        report.total_seconds,
+        report.stage_seconds,
+    )
+    for hook in list(_report_hooks):
+        try:
+            hook(report)
+        except Exception as e:
+            logger.warning("Report hook %s failed -> %s", hook, e)
+
+
+@contextmanager
+def reported_run(report: RunReport, emit: bool = True) -> Iterator[RunReport]:
+    """Emit the report of the enclosed run, marked as failed if it raises."""
+    try:
+        yield report
+    except BaseException as e:
+        report.record_error(e)
+        raise
+    finally:
+        if emit:
+            emit_report(report)
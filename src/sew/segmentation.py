@@ -1,24 +1,207 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Callable, Dict, List, Literal, Optional, Tuple, Union
 
 import numpy as np
-from astropy.io import fits
 from astropy.table import Table
-from scipy import ndimage
+from scipy import ndimage, sparse
 
-from . import sextractor
+from . import errors, sextractor, utils
 from .log import load_logger
-from .utils import ListLike, PathLike, PathOrPixels, make_keys_uppercase
+from .report import RunReport, reported_run
+from .utils import (
+    ListLike,
+    PathLike,
+    PathOrPixels,
+    list_of_strings,
+    make_keys_uppercase,
+)
 
 __all__ = [
     "create_sextractor_object_mask",
+    "create_sextractor_products",
     "create_sextractor_sky_model",
     "create_source_map",
+    "dilate_object_mask",
+    "dilate_segmentation_by_size",
+    "DilationMethods",
+    "rasterize_ellipses",
+    "select_brightest",
+    "SourceMapFormats",
 ]
 
 logger = load_logger()
 DEFAULT_XY_FLUX_NAMES = dict(x="X_IMAGE", y="Y_IMAGE", flux="FLUX_AUTO")
+DEFAULT_SHAPE_NAMES = dict(a="A_IMAGE", b="B_IMAGE", theta="THETA_IMAGE")
+DilationMethods = Literal["square", "disk"]
+SourceMapFormats = Literal["float", "bool", "uint8", "packed", "coo"]
+
+
+def _map_row_bands(
+    func: Callable[[int, int], np.ndarray],
+    image_shape: Tuple[int, int],
+    max_workers: Optional[int] = None,
+    out: Optional[np.ndarray] = None,
+    min_band_rows: int = 256,
+) -> np.ndarray:
+    """Build a boolean image by calling func(y_start, y_stop) on row bands in parallel."""
+    ny = image_shape[0]
+    max_workers = max_workers or os.cpu_count() or 1
+    num_bands = max(1, min(max_workers, ny // min_band_rows))
+    edges = np.linspace(0, ny, num_bands + 1).astype(int)
+    if out is None:
+        out = np.empty(image_shape, dtype=bool)
+    elif out.shape != tuple(image_shape):
+        raise errors.SEWError(f"out has shape {out.shape} instead of {image_shape}")
+
+    def _process(i: int):
+        out[edges[i] : edges[i + 1]] = func(edges[i], edges[i + 1])
+
+    if num_bands == 1:
+        _process(0)
+    else:
+        with ThreadPoolExecutor(max_workers=num_bands) as executor:
+            list(executor.map(_process, range(num_bands)))
+    return out
+
+
+def dilate_object_mask(
+    mask: np.ndarray,
+    dilate_npix: int = 5,
+    method: DilationMethods = "square",
+    max_workers: Optional[int] = None,
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Dilate a SExtractor OBJECTS CHECKIMAGE and convert it into a boolean mask.
+
+    Note:
+        The mask is thresholded before it is dilated, and the dilation is done
+        in parallel on row bands of the boolean mask. The "square" method gives
+        the same result as grey dilation of the OBJECTS image with a square
+        structuring element, using two 1D maximum filters, and the "disk" method
+        dilates with a disk of diameter dilate_npix using a distance transform.
+        Both scale linearly with the image size.
+
+    Args:
+        mask: The OBJECTS CHECKIMAGE (or any image that is nonzero on objects).
+        dilate_npix: Apply grey dilation with structuring element of dimension
+            (dilate_npix, dilate_npix).
+        method: Shape of the structuring element ("square" or "disk").
+        max_workers: Maximum number of threads. Defaults to the number of CPUs.
+        out: Optional boolean array to write the mask into.
+
+    Returns:
+        The dilated object mask as a boolean numpy array.
+    """
+    if method not in ["square", "disk"]:
+        raise errors.SEWError(f"{method} is not a valid dilation method")
+    mask = np.greater(mask, 0, out=out)
+    # a structuring element of one pixel (or less) leaves the mask unchanged
+    if dilate_npix <= 1:
+        return mask
+    logger.debug("Dilating object mask with dilate_npix = %s (%s)", dilate_npix, method)
+    halo = dilate_npix // 2 + 1
+    # grey_dilation centers even-sized structuring elements one pixel up and left
+    origin = 0 if dilate_npix % 2 == 1 else -1
+    radius = (dilate_npix - 1) / 2
+
+    def _dilate_band(y_start: int, y_stop: int) -> np.ndarray:
+        pad_start = max(y_start - halo, 0)
+        band = mask[pad_start : min(y_stop + halo, mask.shape[0])]
+        if method == "square":
+            band = ndimage.maximum_filter1d(band, dilate_npix, axis=1, origin=origin)
+            band = ndimage.maximum_filter1d(band, dilate_npix, axis=0, origin=origin)
+        elif band.any():
+            band = ndimage.distance_transform_edt(~band) <= radius
+        return band[y_start - pad_start : y_stop - pad_start]
+
+    if out is not None:
+        # the bands are dilated from a copy because they overlap
+        mask = mask.copy()
+    return _map_row_bands(_dilate_band, mask.shape, max_workers, out)
+
+
+def dilate_segmentation_by_size(
+    segmentation: np.ndarray,
+    catalog: Table,
+    scale: float = 1.0,
+    size_column: str = "A_IMAGE",
+    min_npix: float = 0,
+    max_npix: float = 100,
+    max_workers: Optional[int] = None,
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Dilate each object of a SEGMENTATION CHECKIMAGE by a radius set by its size.
+
+    Note:
+        Object i is dilated with a disk of radius scale * size_column (clipped
+        to [min_npix, max_npix]), so bright stars get larger masks than faint
+        sources. Each object is dilated with a distance transform of its own
+        cutout, so the cost scales with the masked area rather than with the
+        number of objects times the image size. Row bands are processed in
+        parallel.
+
+    Args:
+        segmentation: The SEGMENTATION CHECKIMAGE, where the value of each object
+            pixel is the object's NUMBER.
+        catalog: The SExtractor catalog of the same run. If it has no NUMBER
+            column, row i is taken to be object i + 1.
+        scale: Dilation radius in units of the size column.
+        size_column: Catalog column with the size of each source in pixels
+            (e.g., A_IMAGE, FLUX_RADIUS, or KRON_RADIUS).
+        min_npix: Minimum dilation radius in pixels.
+        max_npix: Maximum dilation radius in pixels.
+        max_workers: Maximum number of threads. Defaults to the number of CPUs.
+        out: Optional boolean array to write the mask into.
+
+    Returns:
+        The dilated object mask as a boolean numpy array.
+    """
+    segmentation = np.asarray(segmentation)
+    if "NUMBER" in catalog.colnames:
+        numbers = np.asarray(catalog["NUMBER"], dtype=int)
+    else:
+        numbers = np.arange(1, len(catalog) + 1)
+    object_slices = ndimage.find_objects(segmentation.astype(np.int64, copy=False))
+    radii = np.full(len(object_slices) + 1, float(min_npix))
+    in_range = numbers <= len(object_slices)
+    radii[numbers[in_range]] = np.clip(
+        scale * np.asarray(catalog[size_column], dtype=float)[in_range],
+        min_npix,
+        max_npix,
+    )
+
+    ny, nx = segmentation.shape
+    labels = np.array([i + 1 for i, sl in enumerate(object_slices) if sl is not None])
+    if len(labels) == 0:
+        if out is None:
+            return np.zeros(segmentation.shape, dtype=bool)
+        out[:] = False
+        return out
+    halos = np.ceil(radii[labels]).astype(int)
+    bounds = np.array([[sl.start for sl in object_slices[i - 1]] for i in labels])
+    stops = np.array([[sl.stop for sl in object_slices[i - 1]] for i in labels])
+    y_starts = np.maximum(bounds[:, 0] - halos, 0)
+    y_stops = np.minimum(stops[:, 0] + halos, ny)
+    x_starts = np.maximum(bounds[:, 1] - halos, 0)
+    x_stops = np.minimum(stops[:, 1] + halos, nx)
+
+    def _dilate_band(y_start: int, y_stop: int) -> np.ndarray:
+        band = np.zeros((y_stop - y_start, nx), dtype=bool)
+        for i in np.flatnonzero((y_starts < y_stop) & (y_stops > y_start)):
+            cutout = (
+                segmentation[y_starts[i] : y_stops[i], x_starts[i] : x_stops[i]]
+                == labels[i]
+            )
+            if radii[labels[i]] >= 1:
+                cutout = ndimage.distance_transform_edt(~cutout) <= radii[labels[i]]
+            rows = slice(max(y_start - y_starts[i], 0), y_stop - y_starts[i])
+            band_rows = slice(max(y_starts[i] - y_start, 0), y_stops[i] - y_start)
+            band[band_rows, x_starts[i] : x_stops[i]] |= cutout[rows]
+        return band
+
+    return _map_row_bands(_dilate_band, segmentation.shape, max_workers, out)
 
 
 def create_sextractor_object_mask(
@@ -27,10 +210,22 @@ def create_sextractor_object_mask(
     run_label: Optional[str] = None,
     mask_file_name: Optional[PathLike] = None,
     dilate_npix: int = 5,
+    dilate_method: DilationMethods = "square",
+    dilate_scale: Optional[float] = None,
+    size_column: str = "A_IMAGE",
+    max_workers: Optional[int] = None,
+    out: Optional[np.ndarray] = None,
+    report: Optional[RunReport] = None,
     **sextractor_options,
 ) -> np.ndarray:
     """Create an object mask using SExtractor's OBJECTS CHECKIMAGE.
 
+    Note:
+        If dilate_scale is not None, the SEGMENTATION CHECKIMAGE is used instead,
+        and each object is dilated with a disk of radius dilate_scale times its
+        size_column value in the catalog (but at least (dilate_npix - 1) / 2),
+        so that bright stars get larger masks (see dilate_segmentation_by_size).
+
     Args:
         path_or_pixels: Path to fits file or its pixels in a numpy array.
         tmp_path: Temporary path for files created by SExtractor.
@@ -39,6 +234,14 @@ def create_sextractor_object_mask(
             a generic name (plus the optional run label) will be used.
         dilate_npix: Apply grey dilation with structuring element of dimension
             (dilate_npix, dilate_npix).
+        dilate_method: Shape of the structuring element ("square" or "disk").
+        dilate_scale: If not None, dilate each object by this factor times its size.
+        size_column: Catalog column with the size of each source in pixels.
+        max_workers: Maximum number of threads used for the dilation.
+        out: Optional boolean array to write the mask into (e.g., to reuse one
+            buffer for a stack of frames with the same shape).
+        report: Optional empty RunReport to fill (see sextractor.run). The time spent
+            reading and dilating the mask is added to its "checkimage" stage.
         **sextractor_options: Any SExtractor configuration option passed as a keyword.
 
     Returns:
@@ -53,24 +256,52 @@ def create_sextractor_object_mask(
         created_tmp = True
 
     cfg = dict(
-        CHECKIMAGE_TYPE="OBJECTS",
+        CHECKIMAGE_TYPE="OBJECTS" if dilate_scale is None else "SEGMENTATION",
         CHECKIMAGE_NAME=mask_file_name,
         tmp_path=tmp_path,
         run_label=run_label,
         **make_keys_uppercase(sextractor_options),
     )
-    sextractor.run(path_or_pixels, **cfg)
-    mask = fits.getdata(mask_file_name)
-
-    if dilate_npix > 0:
-        logger.debug(f"Dilating object mask with dilate_npix = {dilate_npix}")
-        size = (dilate_npix, dilate_npix)
-        mask = ndimage.morphology.grey_dilation(mask, size)
-
-    mask = (mask > 0).astype(bool)
-
-    if created_tmp:
-        os.remove(mask_file_name)
+    report = RunReport() if report is None else report
+    with reported_run(report):
+        try:
+            if dilate_scale is None:
+                sextractor.run(path_or_pixels, report=report, _emit_report=False, **cfg)
+                with report.stage("checkimage"):
+                    mask = dilate_object_mask(
+                        utils.read_checkimage(mask_file_name, memmap=True),
+                        dilate_npix,
+                        dilate_method,
+                        max_workers,
+                        out,
+                    )
+            else:
+                extra_params = [
+                    p
+                    for p in ["NUMBER", size_column]
+                    if p not in sextractor.DEFAULT_PARAMS
+                ]
+                catalog = sextractor.run(
+                    path_or_pixels,
+                    extra_params=extra_params,
+                    report=report,
+                    _emit_report=False,
+                    **cfg,
+                )
+                with report.stage("checkimage"):
+                    mask = dilate_segmentation_by_size(
+                        utils.read_checkimage(mask_file_name, memmap=True),
+                        catalog,
+                        scale=dilate_scale,
+                        size_column=size_column,
+                        min_npix=max((dilate_npix - 1) / 2, 0),
+                        max_workers=max_workers,
+                        out=out,
+                    )
+        finally:
+            # remove the temporary check image (also when SExtractor failed)
+            if created_tmp and os.path.isfile(mask_file_name):
+                os.remove(mask_file_name)
 
     return mask
 
@@ -80,21 +311,36 @@ def create_sextractor_sky_model(
     run_label: Optional[str] = None,
     tmp_path: PathLike = "/tmp",
     sky_file_name: Optional[PathLike] = None,
+    memmap: bool = False,
+    out: Optional[np.ndarray] = None,
+    report: Optional[RunReport] = None,
     **sextractor_options,
 ) -> np.ndarray:
     """Create a model of the sky using SExtractor's BACKGROUND CHECKIMAGE.
 
+    Note:
+        With memmap=True, the sky model is a memory map of sky_file_name, so no
+        copy of the image is made in memory. The file must then be given and kept
+        for as long as the sky model is used. Alternatively, pass an array as out
+        to reuse one buffer for many frames with the same shape.
+
     Args:
         path_or_pixels: Path to fits file or its pixels in a numpy array.
         run_label: Unique file label for this function call (useful when running in parallel).
         tmp_path: Temporary path for files created by SExtractor.
         sky_file_name: Name of BACKGROUND CHECKIMAGE file written by SExtractor. If None,
             a generic name (plus the optional run label) will be used.
+        memmap: If True, return a memory map of sky_file_name instead of a copy.
+        out: Optional array to read the sky model into.
+        report: Optional empty RunReport to fill (see sextractor.run). The time spent
+            reading the sky model is added to its "checkimage" stage.
         **sextractor_options: Any SExtractor configuration option passed as a keyword.
 
     Returns:
         The sky model as a numpy array.
     """
+    if memmap and sky_file_name is None:
+        raise errors.SEWError("a sky_file_name must be given to memory map the sky")
 
     if sky_file_name is not None:
         created_tmp = False
@@ -110,20 +356,264 @@ def create_sextractor_sky_model(
         run_label=run_label,
         **make_keys_uppercase(sextractor_options),
     )
-    sextractor.run(path_or_pixels, **cfg)
-    sky = fits.getdata(sky_file_name)
-
-    if created_tmp:
-        os.remove(sky_file_name)
+    report = RunReport() if report is None else report
+    with reported_run(report):
+        try:
+            sextractor.run(path_or_pixels, report=report, _emit_report=False, **cfg)
+            with report.stage("checkimage"):
+                sky = utils.read_checkimage(sky_file_name, memmap=memmap, out=out)
+        finally:
+            # remove the temporary check image (also when SExtractor failed)
+            if created_tmp and os.path.isfile(sky_file_name):
+                os.remove(sky_file_name)
 
     return sky
 
 
+def create_sextractor_products(
+    path_or_pixels: PathOrPixels,
+    products: Union[str, List[str]] = "catalog,BACKGROUND,OBJECTS",
+    tmp_path: PathLike = "/tmp",
+    run_label: Optional[str] = None,
+    checkimage_file_names: Optional[Dict[str, PathLike]] = None,
+    dilate_npix: int = 5,
+    dilate_method: DilationMethods = "square",
+    dilate_scale: Optional[float] = None,
+    size_column: str = "A_IMAGE",
+    extra_params: Optional[Union[str, List[str]]] = None,
+    memmap: bool = False,
+    report: Optional[RunReport] = None,
+    **sextractor_options,
+) -> Dict[str, Union[Table, np.ndarray]]:
+    """Create a catalog and several CHECKIMAGE products with a single SExtractor run.
+
+    Note:
+        This is equivalent to calling sextractor.run, create_sextractor_sky_model,
+        and create_sextractor_object_mask on the same image, but the image is
+        only detected and measured once. The OBJECTS product is returned as a
+        dilated boolean mask, exactly as create_sextractor_object_mask does,
+        and all other CHECKIMAGE products are returned as they were written
+        by SExtractor. With dilate_scale, the OBJECTS mask is made from the
+        SEGMENTATION check image, and the NUMBER and size_column parameters are
+        added to the catalog.
+
+    Args:
+        path_or_pixels: Path to fits file or its pixels in a numpy array.
+        products: Products to create. Use "catalog" for the SExtractor catalog and
+            the CHECKIMAGE_TYPE name for check images (e.g., BACKGROUND,
+            BACKGROUND_RMS, -BACKGROUND, OBJECTS, SEGMENTATION).
+        tmp_path: Temporary path for files created by SExtractor.
+        run_label: Unique file label for this function call (useful when running in parallel).
+        checkimage_file_names: Optional dictionary that maps CHECKIMAGE types to file
+            names. These check images are kept after the run. All other check images
+            are written to temporary files that are deleted.
+        dilate_npix: Apply grey dilation to the OBJECTS mask with structuring element
+            of dimension (dilate_npix, dilate_npix).
+        dilate_method: Shape of the structuring element ("square" or "disk").
+        dilate_scale: If not None, dilate each object by this factor times its size
+            (see create_sextractor_object_mask).
+        size_column: Catalog column with the size of each source in pixels.
+        extra_params: Extra measurement parameters to include in the catalog.
+        memmap: If True, the check images named in checkimage_file_names (except
+            OBJECTS) are returned as memory maps of those files instead of copies.
+        report: Optional empty RunReport to fill (see sextractor.run). The time spent
+            reading the check images is added to its "checkimage" stage.
+        **sextractor_options: Any SExtractor configuration option passed as a keyword.
+
+    Returns:
+        Dictionary with the requested products as keys and the catalog (as an
+        Astropy table) and check images (as numpy arrays) as values.
+
+    Example:
+        products = create_sextractor_products(image, "catalog,BACKGROUND,OBJECTS")
+        catalog = products["catalog"]
+        sky_model = products["BACKGROUND"]
+        object_mask = products["OBJECTS"]
+    """
+    products = [
+        p if p.lower() == "catalog" else p.upper() for p in list_of_strings(products)
+    ]
+    check_types = [p for p in products if p.lower() != "catalog"]
+    if checkimage_file_names is None:
+        checkimage_file_names = {}
+    checkimage_file_names = make_keys_uppercase(checkimage_file_names)
+
+    # with dilate_scale, the OBJECTS mask is made from the SEGMENTATION image
+    scaled_objects = dilate_scale is not None and "OBJECTS" in check_types
+    se_check_types = [
+        "SEGMENTATION" if scaled_objects and t == "OBJECTS" else t for t in check_types
+    ]
+    se_check_types = list(dict.fromkeys(se_check_types))
+    if scaled_objects:
+        extra_params = [] if extra_params is None else list_of_strings(extra_params)
+        extra_params += [
+            p
+            for p in ["NUMBER", size_column]
+            if p not in sextractor.DEFAULT_PARAMS and p not in extra_params
+        ]
+
+    label = "" if run_label is None else "_" + run_label
+    check_names: List[PathLike] = []
+    created_tmp: List[PathLike] = []
+    for check_type in se_check_types:
+        if check_type in checkimage_file_names:
+            check_names.append(checkimage_file_names[check_type])
+        else:
+            tmp_name = (
+                Path(tmp_path)
+                / f"check_{check_type.replace('-', 'm').lower()}{label}.fits"
+            )
+            check_names.append(tmp_name)
+            created_tmp.append(tmp_name)
+
+    cfg = dict(
+        tmp_path=tmp_path,
+        run_label=run_label,
+        extra_params=extra_params,
+        **make_keys_uppercase(sextractor_options),
+    )
+    if len(se_check_types) > 0:
+        cfg["CHECKIMAGE_TYPE"] = ",".join(se_check_types)
+        cfg["CHECKIMAGE_NAME"] = ",".join([str(fn) for fn in check_names])
+    report = RunReport() if report is None else report
+    results: Dict[str, Union[Table, np.ndarray]] = {}
+    with reported_run(report):
+        try:
+            catalog = sextractor.run(
+                path_or_pixels, report=report, _emit_report=False, **cfg
+            )
+            with report.stage("checkimage"):
+                for product in products:
+                    if product.lower() == "catalog":
+                        results[product] = catalog
+                    elif product == "OBJECTS" and scaled_objects:
+                        assert dilate_scale is not None
+                        fn = check_names[se_check_types.index("SEGMENTATION")]
+                        results[product] = dilate_segmentation_by_size(
+                            utils.read_checkimage(fn, memmap=True),
+                            catalog,
+                            scale=dilate_scale,
+                            size_column=size_column,
+                            min_npix=max((dilate_npix - 1) / 2, 0),
+                        )
+                    else:
+                        fn = check_names[se_check_types.index(product)]
+                        if product == "OBJECTS":
+                            data = dilate_object_mask(
+                                utils.read_checkimage(fn, memmap=True),
+                                dilate_npix,
+                                dilate_method,
+                            )
+                        else:
+                            data = utils.read_checkimage(
+                                fn, memmap=memmap and fn not in created_tmp
+                            )
+                        results[product] = data
+        finally:
+            # remove the temporary check images (also when SExtractor failed)
+            for fn in created_tmp:
+                if os.path.isfile(fn):
+                    os.remove(fn)
+
+    return results
+
+
+def select_brightest(flux: ListLike, max_num_sources: int) -> np.ndarray:
+    """Return the indices of the brightest sources, sorted by decreasing flux.
+
+    Note:
+        A partial selection (np.argpartition) is used, so only the selected
+        sources are sorted. This is much faster than sorting all fluxes when
+        max_num_sources is small compared to the number of sources.
+
+    Args:
+        flux: Fluxes of the sources.
+        max_num_sources: Maximum number of sources to select.
+
+    Returns:
+        Indices of the (up to) max_num_sources brightest sources.
+    """
+    neg_flux = -np.asarray(flux, dtype=float)
+    max_num_sources = int(max_num_sources)
+    if max_num_sources <= 0:
+        return np.array([], dtype=int)
+    if max_num_sources < len(neg_flux):
+        selected = np.argpartition(neg_flux, max_num_sources - 1)[:max_num_sources]
+    else:
+        selected = np.arange(len(neg_flux))
+    return selected[np.argsort(neg_flux[selected], kind="stable")]
+
+
+def rasterize_ellipses(
+    x: ListLike,
+    y: ListLike,
+    a: ListLike,
+    b: ListLike,
+    theta: ListLike,
+    image_shape: ListLike,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Find the pixels inside a set of ellipses without a per-ellipse Python loop.
+
+    Note:
+        A box of (2 ceil(a) + 1)^2 pixels is generated around every ellipse with
+        array arithmetic, and the pixels outside the ellipses or the image are
+        dropped. The pixel closest to each center is always included.
+
+    Args:
+        x: Zero-based x positions of the ellipse centers.
+        y: Zero-based y positions of the ellipse centers.
+        a: Semi-major axes in pixels.
+        b: Semi-minor axes in pixels.
+        theta: Position angles in degrees (counter-clockwise from the x-axis).
+        image_shape: Shape of the image.
+
+    Returns:
+        The y and x pixel indices inside the ellipses (pixels covered by more
+        than one ellipse are repeated).
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    a = np.maximum(np.asarray(a, dtype=float), 0.5)
+    b = np.clip(np.asarray(b, dtype=float), 0.5, a)
+    theta = np.deg2rad(np.asarray(theta, dtype=float))
+
+    half_size = np.ceil(a).astype(np.int64)
+    width = 2 * half_size + 1
+    num_pix = width * width
+    source = np.repeat(np.arange(len(x)), num_pix)
+    offset = np.arange(num_pix.sum()) - np.repeat(np.cumsum(num_pix) - num_pix, num_pix)
+    x_center = np.rint(x).astype(np.int64)
+    y_center = np.rint(y).astype(np.int64)
+    x_pix = x_center[source] + offset % width[source] - half_size[source]
+    y_pix = y_center[source] + offset // width[source] - half_size[source]
+
+    dx = x_pix - x[source]
+    dy = y_pix - y[source]
+    cos = np.cos(theta)[source]
+    sin = np.sin(theta)[source]
+    u = (dx * cos + dy * sin) / a[source]
+    v = (dy * cos - dx * sin) / b[source]
+    inside = (u**2 + v**2 <= 1) | (
+        (x_pix == x_center[source]) & (y_pix == y_center[source])
+    )
+    inside &= (
+        (x_pix >= 0)
+        & (x_pix < image_shape[1])
+        & (y_pix >= 0)
+        & (y_pix < image_shape[0])
+    )
+    return y_pix[inside], x_pix[inside]
+
+
 def create_source_map(
     catalog: Table,
     image_shape: ListLike,
     max_num_sources: int = 100_000,
     xy_flux_column_names: Optional[Dict[str, str]] = None,
+    output: SourceMapFormats = "float",
+    footprint: bool = False,
+    footprint_scale: float = 3.0,
+    shape_column_names: Optional[Dict[str, str]] = None,
 ):
     """Make source map image based on the input catalog.
 
@@ -131,7 +621,19 @@ def create_source_map(
     everywhere else.
 
     Note:
-        This function was written for double-star detection.
+        This function was written for double-star detection. To find close
+        pairs or groups of sources directly from the catalog, at a cost that
+        scales with the number of sources, use neighbors.find_close_pairs and
+        neighbors.find_groups.
+
+        The default float output uses 8 bytes per pixel. For large images, use
+        one of the compact output formats:
+            "bool" or "uint8": dense array with 1 byte per pixel.
+            "packed": 8 pixels per byte along each row, as returned by
+                np.packbits(source_map, axis=1). Unpack with
+                np.unpackbits(source_map, axis=1, count=image_shape[1]).
+            "coo": scipy.sparse.coo_matrix, whose size scales with the number
+                of source pixels rather than the image size.
 
     Args:
         catalog: Catalog of sources with their image positions and fluxes.
@@ -141,6 +643,13 @@ def create_source_map(
         xy_flux_column_names: Names of the columns in the catalog. Must be a dictionary
             with values for keys = 'x', 'y', and 'flux'. For example:
             {'x': 'x_col', 'y': y_col', 'flux': 'flux_col'}.
+        output: Format of the source map ("float", "bool", "uint8", "packed", or "coo").
+        footprint: If True, mark every pixel inside each source's ellipse (with semi-axes
+            footprint_scale times A_IMAGE and B_IMAGE, and angle THETA_IMAGE) instead of
+            the single pixel at each source position.
+        footprint_scale: Scale factor of the ellipse semi-axes when footprint is True.
+        shape_column_names: Names of the ellipse columns in the catalog. Must be a
+            dictionary with values for keys = 'a', 'b', and 'theta'.
 
     Returns:
         Source map with ones at the locations of sources from the input
@@ -148,11 +657,41 @@ def create_source_map(
     """
     if xy_flux_column_names is None:
         xy_flux_column_names = DEFAULT_XY_FLUX_NAMES
-    max_num_sources = int(max_num_sources)
-    source_map = np.zeros(image_shape)
-    flux = catalog[xy_flux_column_names["flux"]]
-    flux_sort = np.argsort(-flux)
-    x = np.array(catalog[xy_flux_column_names["x"]].astype(int))[flux_sort] - 1
-    y = np.array(catalog[xy_flux_column_names["y"]].astype(int))[flux_sort] - 1
-    source_map[y[:max_num_sources], x[:max_num_sources]] = 1
+    image_shape = (int(image_shape[0]), int(image_shape[1]))
+    selected = select_brightest(catalog[xy_flux_column_names["flux"]], max_num_sources)
+
+    if footprint:
+        if shape_column_names is None:
+            shape_column_names = DEFAULT_SHAPE_NAMES
+        y, x = rasterize_ellipses(
+            np.asarray(catalog[xy_flux_column_names["x"]])[selected] - 1,
+            np.asarray(catalog[xy_flux_column_names["y"]])[selected] - 1,
+            footprint_scale * np.asarray(catalog[shape_column_names["a"]])[selected],
+            footprint_scale * np.asarray(catalog[shape_column_names["b"]])[selected],
+            np.asarray(catalog[shape_column_names["theta"]])[selected],
+            image_shape,
+        )
+    else:
+        x = np.asarray(catalog[xy_flux_column_names["x"]]).astype(int)[selected] - 1
+        y = np.asarray(catalog[xy_flux_column_names["y"]]).astype(int)[selected] - 1
+
+    if output == "float":
+        source_map = np.zeros(image_shape)
+        source_map[y, x] = 1
+    elif output in ["bool", "uint8"]:
+        source_map = np.zeros(image_shape, dtype=output)
+        source_map[y, x] = 1
+    elif output == "packed":
+        source_map = np.zeros(
+            (image_shape[0], (image_shape[1] + 7) // 8), dtype=np.uint8
+        )
+        np.bitwise_or.at(source_map, (y, x >> 3), (128 >> (x & 7)).astype(np.uint8))
+    elif output == "coo":
+        index = np.unique(np.ravel_multi_index((y, x), image_shape, mode="wrap"))
+        y, x = np.unravel_index(index, image_shape)
+        source_map = sparse.coo_matrix(
+            (np.ones(len(index), dtype=np.uint8), (y, x)), shape=image_shape
+        )
+    else:
+        raise errors.SEWError(f"{output} is not a valid source map output format")
     return source_map
@@ -0,0 +1,200 @@
+import itertools
+import os
+import shutil
+import tempfile
+import weakref
+from pathlib import Path
+from typing import List, Optional, Union
+
+from astropy.io import fits
+from astropy.table import Table
+
+from . import errors, utils
+from .cache import ResultCache
+from .catalog import read_catalog
+from .log import load_logger
+from .report import RunReport, emit_report
+from .sextractor import (
+    DEFAULT_CONFIG_PATH,
+    DEFAULT_PARAMS,
+    _build_options,
+    _build_params,
+    _run_sextractor,
+)
+from .utils import PathLike, PathOrPixels, StagingModes
+
+__all__ = ["Session"]
+
+logger = load_logger()
+
+
+class Session:
+    """Reusable SExtractor setup for running on many images with the same options.
+
+    The config options are validated, the parameter file is written, and a scratch
+    directory is created once when the session starts. Every call of Session.run
+    then only stages the image, runs SExtractor, and reads the catalog. All files
+    are deleted when the session is closed. Session.run may be called from
+    several threads at once.
+
+    Args:
+        extra_params: Extra measurement parameters to include beyond the defaults.
+        config_file_path: Custom SExtractor config file.
+        tmp_path: Parent directory of the session's scratch directory.
+        staging: Where to write temporary fits files (see sextractor.run).
+        cache: Optional result cache (see sextractor.run).
+        timeout: Timeout of each SExtractor run in seconds (see sextractor.run).
+        retries: Number of times to rerun SExtractor if it fails (see sextractor.run).
+        **sextractor_options: Any SExtractor configuration option passed as a keyword.
+
+    Example:
+        with sew.Session(extra_params="MAG_AUTO", DETECT_THRESH=3) as session:
+            catalogs = [session.run(image) for image in images]
+    """
+
+    def __init__(
+        self,
+        extra_params: Optional[Union[str, List[str]]] = None,
+        config_file_path: Optional[PathLike] = DEFAULT_CONFIG_PATH,
+        tmp_path: PathLike = "/tmp",
+        staging: StagingModes = "disk",
+        cache: Optional[ResultCache] = None,
+        timeout: Optional[float] = None,
+        retries: int = 0,
+        **sextractor_options,
+    ):
+        self.config_file_path = config_file_path
+        self.timeout = timeout
+        self.retries = retries
+        self.staging = staging
+        self.cache = cache
+        self.options = _build_options(sextractor_options)
+        self.params = _build_params(extra_params)
+        self.scratch_path: Optional[Path] = Path(
+            tempfile.mkdtemp(prefix="sew_session_", dir=tmp_path)
+        )
+        self._counter = itertools.count()
+        self._finalizer = weakref.finalize(
+            self, shutil.rmtree, self.scratch_path, ignore_errors=True
+        )
+
+        if len(self.params) > len(DEFAULT_PARAMS):
+            param_file_name = self.scratch_path / "params.se"
+            with open(param_file_name, "w") as f:
+                logger.debug("writing parameter file to %s", param_file_name)
+                f.write("\n".join(self.params))
+            self.options["PARAMETERS_NAME"] = param_file_name
+
+    def __enter__(self) -> "Session":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def closed(self) -> bool:
+        return self.scratch_path is None
+
+    def close(self):
+        """Delete the session's scratch directory and all files in it."""
+        if self.scratch_path is not None:
+            logger.debug("deleting session scratch directory %s", self.scratch_path)
+            self._finalizer()
+            self.scratch_path = None
+
+    def run(
+        self,
+        path_or_pixels: PathOrPixels,
+        header: Optional[fits.Header] = None,
+        catalog_file_path: Optional[PathLike] = None,
+        report: Optional[RunReport] = None,
+        **sextractor_options,
+    ) -> Table:
+        """Run Source Extractor with the session's setup.
+
+        Args:
+            path_or_pixels: Path to fits file or its pixels in a numpy array.
+            header: Astropy fits header object. If not None, this header will take precedent.
+            catalog_file_path: Custom file name + location for the output SExtractor catalog.
+            report: Optional empty RunReport to fill (see sextractor.run).
+            **sextractor_options: SExtractor configuration options that override the
+                session's options for this call only (e.g., CHECKIMAGE_NAME).
+
+        Returns:
+            The SExtractor catalog in an Astropy table object.
+        """
+        if self.scratch_path is None:
+            raise errors.SEWError("cannot run SExtractor with a closed session")
+
+        if report is None:
+            report = RunReport()
+        with report.stage("setup"):
+            final_options = self.options
+            if len(sextractor_options) > 0:
+                final_options = _build_options(
+                    sextractor_options, defaults=self.options
+                )
+            catalog_type = final_options["CATALOG_TYPE"]
+
+        if self.cache is not None:
+            with report.stage("cache"):
+                cache_key = self.cache.make_key(
+                    path_or_pixels,
+                    header,
+                    final_options,
+                    self.params,
+                    self.config_file_path,
+                )
+                catalog = self.cache.get(cache_key, final_options, catalog_file_path)
+            if catalog is not None:
+                report.cache_hit = True
+                report.num_rows = len(catalog)
+                emit_report(report)
+                return catalog
+
+        run_label = str(next(self._counter))
+        report.run_label = run_label
+        with report.stage("stage"):
+            image_path, created_tmp = utils.create_temp_fits_file_if_necessary(
+                path_or_pixels,
+                tmp_path=self.scratch_path,
+                run_label=run_label,
+                header=header,
+                staging=self.staging,
+            )
+        if catalog_file_path is not None:
+            cat_name = Path(catalog_file_path)
+        else:
+            cat_name = self.scratch_path / f"se_{run_label}.cat"
+
+        try:
+            with report.stage("sextractor"):
+                _run_sextractor(
+                    image_path,
+                    cat_name,
+                    self.config_file_path,
+                    final_options,
+                    report,
+                    timeout=self.timeout,
+                    retries=self.retries,
+                )
+            report.record_written_files(
+                image_path if created_tmp else None,
+                cat_name,
+                *utils.checkimage_file_names(final_options),
+            )
+            with report.stage("parse"):
+                catalog = read_catalog(cat_name, catalog_type)
+            report.num_rows = len(catalog)
+            if self.cache is not None:
+                with report.stage("cache"):
+                    self.cache.put(cache_key, cat_name, final_options)
+        finally:
+            with report.stage("cleanup"):
+                if created_tmp and os.path.isfile(image_path):
+                    os.remove(image_path)
+                if catalog_file_path is None and os.path.isfile(cat_name):
+                    os.remove(cat_name)
+
+        emit_report(report)
+        return catalog
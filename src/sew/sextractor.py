@@ -1,16 +1,27 @@
 import os
+import shlex
 from pathlib import Path
-from subprocess import CalledProcessError, call, check_output
-from typing import List, Optional, Union
+from typing import Callable, List, Optional, Union
 
 import numpy as np
-from astropy.io import ascii, fits
+from astropy.io import fits
 from astropy.table import Table
 
 from . import errors, utils
-from .constants import PACKAGE_PATH, SE_EXECUTABLE
-from .log import load_logger
-from .utils import PathLike, PathOrPixels
+from .cache import ResultCache
+from .capabilities import LazyNameList, get_capabilities, get_se_executable
+from .catalog import (
+    CATALOG_TYPES,
+    DEFAULT_BATCH_ROWS,
+    CatalogStreamParser,
+    read_catalog,
+)
+from .constants import PACKAGE_PATH
+from .log import load_logger, log_context
+from .process import ProcessResult, run_process
+from .report import RunReport, reported_run
+from .store import IMAGE_OPTIONS, get_default_store
+from .utils import PathLike, PathOrPixels, StagingModes
 
 __all__ = [
     "run",
@@ -31,35 +42,140 @@ DEFAULT_CONFIG_PATH = SE_INPUT_FILE_PATH / "default.config"
 DEFAULT_PARAM_FILE = SE_INPUT_FILE_PATH / "default.param"
 DEFAULT_CONV = KERNEL_PATH / "default.conv"
 
-try:
-    lines_bytes = check_output(f"{SE_EXECUTABLE} -dd", shell=True)
-except CalledProcessError:
-    raise errors.SourceExtractorExecutableError(
-        "SE_EXECUTABLE is not working correctly -> verify this env variable runs SExtractor as expected"
-    )
-
-# get list of all config options
-lines = lines_bytes.decode("utf-8").split("\n")
-cleaned = filter(
-    lambda line: line.strip()[0] != "#", filter(lambda line: len(line) > 1, lines)
-)
-OPTION_NAMES = [line.split()[0] for line in cleaned]
-
-# get list of all SExtractor measurement parameters
-lines_bytes = check_output(f"{SE_EXECUTABLE} -dp", shell=True)
-lines = lines_bytes.decode("utf-8").split("\n")
-cleaned = filter(lambda line: len(line) > 1, lines)
-PARAM_NAMES = [line.split()[0][1:] for line in cleaned]
+# SExtractor config options and measurement parameters (probed on first use)
+OPTION_NAMES = LazyNameList(lambda: get_capabilities()["option_names"])
+PARAM_NAMES = LazyNameList(lambda: get_capabilities()["param_names"])
 DEFAULT_PARAMS = np.loadtxt(DEFAULT_PARAM_FILE, dtype=str).tolist()
 
 # default config options
 DEFAULT_OPTIONS = dict(
     VERBOSE_TYPE="QUIET",
+    CATALOG_TYPE="FITS_LDAC",
     PARAMETERS_NAME=DEFAULT_PARAM_FILE,
     FILTER_NAME=DEFAULT_CONV,
 )
 
 
+def _build_options(sextractor_options: dict, defaults: Optional[dict] = None) -> dict:
+    """Validate SExtractor config options and merge them with the defaults."""
+    final_options = (DEFAULT_OPTIONS if defaults is None else defaults).copy()
+    for k, v in sextractor_options.items():
+        k = k.upper()
+        if k not in OPTION_NAMES:
+            logger.warning(
+                "%s is not a valid SExtractor option -> we will ignore it!", k
+            )
+        else:
+            if k in IMAGE_OPTIONS:
+                # write arrays to the staging store once and pass their paths
+                v = get_default_store().stage_option_value(v)
+            logger.debug("SExtractor config update: %s = %s", k, v)
+            final_options[k] = v
+
+    catalog_type = str(final_options["CATALOG_TYPE"]).upper()
+    if catalog_type not in CATALOG_TYPES:
+        raise errors.SEWError(f"{catalog_type} is an invalid CATALOG_TYPE")
+    final_options["CATALOG_TYPE"] = catalog_type
+    return final_options
+
+
+def _build_params(extra_params: Optional[Union[str, List[str]]]) -> List[str]:
+    """Validate extra measurement parameters and append them to the defaults."""
+    params = DEFAULT_PARAMS.copy()
+    if extra_params is not None:
+        extra_params_list = utils.list_of_strings(extra_params)
+        for par in extra_params_list:
+            p = par.upper()
+            _p = p[: p.find("(")] if p.find("(") > 0 else p
+            if _p not in PARAM_NAMES:
+                logger.warning(
+                    "%s is not a valid SExtractor param -> we will ignore it!", p
+                )
+            elif _p in DEFAULT_PARAMS:
+                logger.warning("%s is a default parameter -> No need to add it!", p)
+            else:
+                params.append(p)
+    return params
+
+
+def _build_command(
+    image_path: PathLike,
+    cat_name: PathLike,
+    config_file_path: Optional[PathLike],
+    final_options: dict,
+) -> List[str]:
+    """Build the SExtractor command line as a list of arguments (no shell)."""
+    argv = shlex.split(get_se_executable())
+    if config_file_path is not None:
+        argv += ["-c", str(config_file_path)]
+    argv += [str(image_path), "-CATALOG_NAME", str(cat_name)]
+    for k, v in final_options.items():
+        if utils.is_list_like(v):
+            v = ",".join(str(_v) for _v in v)
+        argv += [f"-{k.upper()}", str(v)]
+    return argv
+
+
+def _run_sextractor(
+    image_path: PathLike,
+    cat_name: PathLike,
+    config_file_path: Optional[PathLike],
+    final_options: dict,
+    report: Optional[RunReport] = None,
+    timeout: Optional[float] = None,
+    retries: int = 0,
+    stdout_parser: Optional[CatalogStreamParser] = None,
+) -> ProcessResult:
+    """Run SExtractor, raising an error if it fails or times out.
+
+    Note:
+        Failed runs are retried up to retries times. The error of the last
+        attempt is raised if they all fail. If a stdout_parser is given, the
+        output is fed to it while SExtractor runs (it is reset before each attempt).
+    """
+    argv = _build_command(image_path, cat_name, config_file_path, final_options)
+    cmd = shlex.join(argv)
+    if report is not None:
+        report.command = cmd
+    with log_context(run_label=None if report is None else report.run_label):
+        logger.debug(">> %s", cmd)
+        for attempt in range(retries + 1):
+            if stdout_parser is not None:
+                stdout_parser.reset()
+            result = run_process(
+                argv,
+                timeout=timeout,
+                stdout_callback=None if stdout_parser is None else stdout_parser.feed,
+            )
+            if report is not None:
+                report.record_process(result)
+            if result.stdout.strip() != "":
+                logger.debug("SExtractor stdout: %s", result.stdout.strip())
+            if result.stderr.strip() != "":
+                logger.debug("SExtractor stderr: %s", result.stderr.strip())
+            if result.returncode == 0 and not result.timed_out:
+                return result
+
+            error: errors.SourceExtractorRunError
+            if result.timed_out:
+                error = errors.SourceExtractorTimeoutError(
+                    f"SExtractor timed out on {image_path} -> stderr: "
+                    f"{result.stderr.strip()}",
+                    result.returncode,
+                    result.stderr,
+                )
+            else:
+                error = errors.SourceExtractorRunError(
+                    f"SExtractor exited with code {result.returncode} on {image_path} "
+                    f"-> stderr: {result.stderr.strip()}",
+                    result.returncode,
+                    result.stderr,
+                )
+            if attempt < retries:
+                logger.warning("%s -> retrying (%s/%s)", error, attempt + 1, retries)
+        raise error
+
+
 def run(
     path_or_pixels: PathOrPixels,
     header: Optional[fits.Header] = None,
@@ -68,12 +184,26 @@ def run(
     config_file_path: Optional[PathLike] = DEFAULT_CONFIG_PATH,
     catalog_file_path: Optional[PathLike] = None,
     tmp_path: PathLike = "/tmp",
+    staging: StagingModes = "disk",
+    cache: Optional[ResultCache] = None,
+    report: Optional[RunReport] = None,
+    timeout: Optional[float] = None,
+    retries: int = 0,
+    pipe_catalog: bool = False,
+    on_batch: Optional[Callable[[Table], None]] = None,
+    batch_rows: int = DEFAULT_BATCH_ROWS,
+    _emit_report: bool = True,
     **sextractor_options,
 ) -> Table:
     """Run Source Extractor.
 
     Note:
-        You must have SExtractor installed to run this function.
+        You must have SExtractor installed to run this function. It is run
+        directly (not through a shell), in its own process group.
+
+        The catalog is written as a binary FITS_LDAC table by default, which is
+        much faster to read than an ASCII catalog. Set CATALOG_TYPE to FITS_1.0
+        or ASCII_HEAD to change the format; the returned table is the same.
 
         Default measured parameters (add extra parameters using the extra_params argument):
             X_IMAGE
@@ -95,11 +225,42 @@ def run(
         catalog_file_path: Custom file name + location for the output SExtractor catalog.
         config_file_path: Custom SExtractor config file.
         tmp_path: Temporary path for files created by SExtractor. Defaults to "/tmp".
+        staging: Where to write the temporary fits file when pixels are given. Use
+            "memory" to write it to a RAM-backed directory (e.g., /dev/shm) instead of
+            tmp_path. It falls back to tmp_path if the image does not fit in memory.
+        cache: Optional result cache. If this exact run (same pixels, options, params,
+            and config/filter files) is in the cache, the stored catalog and check
+            images are returned without running SExtractor.
+        report: Optional empty RunReport, which is filled with the wall time of each
+            stage, the resource usage of SExtractor, and more. The report is also
+            passed to the hooks registered with add_report_hook.
+        timeout: Kill SExtractor (and its process group) after this many seconds and
+            raise SourceExtractorTimeoutError. Defaults to the global default timeout
+            (see process.set_default_timeout), which is no timeout unless set.
+        retries: Number of times to rerun SExtractor if it fails or times out.
+        pipe_catalog: If True, SExtractor writes the catalog to its stdout, which is
+            parsed while it runs (see catalog.CatalogStreamParser), instead of to a
+            temporary file that is read when it is done. Cannot be combined with
+            catalog_file_path or cache.
+        on_batch: Optional function that is called with the catalog in batches of
+            batch_rows rows while SExtractor runs (implies pipe_catalog). The
+            batches are not kept, so an empty table with the catalog columns is
+            returned. If SExtractor fails and is retried, the batches of the
+            failed attempt have already been passed to on_batch.
+        batch_rows: Number of rows per batch passed to on_batch.
         **sextractor_options: Any SExtractor configuration option passed as a keyword.
+            Image-valued options (WEIGHT_IMAGE and FLAG_IMAGE) may be numpy arrays
+            (or lists of arrays), which are written once to the staging store (see
+            store.StagingStore) and reused by later runs.
 
     Returns:
         The SExtractor catalog in an Astropy table object.
 
+    Raises:
+        SourceExtractorRunError: If SExtractor exits with a non-zero code. The error
+            message and its stderr attribute contain SExtractor's stderr.
+        SourceExtractorTimeoutError: If SExtractor times out.
+
     Example:
         # run like this
         cat = sextractor.run(image_file_name, FILTER='N', DETECT_THRESH=10)
@@ -116,91 +277,115 @@ def run(
         extra_params = ['FLUX_RADIUS', 'ELLIPTICITY']
 
         cat = sextractor.run(image_file_name, extra_params=extra_params)
+
+        # process the catalog of a crowded field in batches as it is extracted
+        sextractor.run(image_file_name, on_batch=lambda batch: sink.write(batch))
     """
-    image_path, created_tmp = utils.create_temp_fits_file_if_necessary(
-        path_or_pixels,
-        tmp_path=tmp_path,
-        run_label=run_label,
-        header=header,
-    )
+    if report is None:
+        report = RunReport()
+    report.run_label = run_label
+    # the segmentation helpers pass _emit_report=False and emit the report
+    # themselves, once their "checkimage" stage is recorded
+    with log_context(run_label=run_label), reported_run(report, _emit_report):
+        with report.stage("setup"):
+            final_options = _build_options(sextractor_options)
+            catalog_type = final_options["CATALOG_TYPE"]
+            params = _build_params(extra_params)
+            stdout_parser = None
+            if pipe_catalog or on_batch is not None:
+                if catalog_file_path is not None or cache is not None:
+                    raise errors.SEWError(
+                        "a piped catalog cannot be saved to a file or cached"
+                    )
+                stdout_parser = CatalogStreamParser(catalog_type, on_batch, batch_rows)
 
-    logger.debug(f"Running SExtractor on {image_path}")
+        # return the cached results if this exact run has been done before
+        if cache is not None:
+            with report.stage("cache"):
+                cache_key = cache.make_key(
+                    path_or_pixels, header, final_options, params, config_file_path
+                )
+                catalog = cache.get(cache_key, final_options, catalog_file_path)
+            if catalog is not None:
+                report.cache_hit = True
+                report.num_rows = len(catalog)
+                return catalog
 
-    # update config options
-    final_options = DEFAULT_OPTIONS.copy()
-    for k, v in sextractor_options.items():
-        k = k.upper()
-        if k not in OPTION_NAMES:
-            logger.warning(
-                f"{k} is not a valid SExtractor option -> we will ignore it!"
+        with report.stage("stage"):
+            image_path, created_tmp = utils.create_temp_fits_file_if_necessary(
+                path_or_pixels,
+                tmp_path=tmp_path,
+                run_label=run_label,
+                header=header,
+                staging=staging,
             )
-        else:
-            logger.debug(f"SExtractor config update: {k} = {v}")
-            final_options[k] = v
 
-    # create catalog path if necessary
-    if catalog_file_path is not None:
-        cat_name = catalog_file_path
-        save_cat = True
-    else:
-        label = "" if run_label is None else "_" + run_label
-        cat_name = Path(tmp_path) / f"se{label}.cat"
-        save_cat = False
-
-    # create and write param file if extra params were given
-    param_file_name = None
-    if extra_params is not None:
-        extra_params_list = utils.list_of_strings(extra_params)
-        params = DEFAULT_PARAMS.copy()
-        for par in extra_params_list:
-            p = par.upper()
-            _p = p[: p.find("(")] if p.find("(") > 0 else p
-            if _p not in PARAM_NAMES:
-                logger.warning(
-                    f"{p} is not a valid SExtractor param -> we will ignore it!"
-                )
-            elif _p in DEFAULT_PARAMS:
-                logger.warning(f"{p} is a default parameter -> No need to add it!")
+            logger.debug("Running SExtractor on %s", image_path)
+
+            # create catalog path if necessary
+            cat_name: PathLike
+            if stdout_parser is not None:
+                cat_name = "STDOUT"
+                save_cat = True
+            elif catalog_file_path is not None:
+                cat_name = catalog_file_path
+                save_cat = True
             else:
-                params.append(p)
-        if len(params) > len(DEFAULT_PARAMS):
-            label = "" if run_label is None else "_" + run_label
-            param_file_name = Path(tmp_path) / f"params{label}.se"
-            with open(param_file_name, "w") as f:
-                logger.debug(f"writing parameter file to {param_file_name}")
-                f.write("\n".join(params))
-            final_options["PARAMETERS_NAME"] = param_file_name
-
-    # build shell command
-    cmd = f"{SE_EXECUTABLE} -c {config_file_path} {image_path} -CATALOG_NAME {cat_name}"
-    for k, v in final_options.items():
-        cmd += f" -{k.upper()} {v}"
-    if param_file_name is not None:
-        cmd += f" -PARAMETERS_NAME {param_file_name}"
-
-    # run it
-    logger.debug(f">> {cmd}")
-    call(cmd, shell=True)
-
-    # convert detection catalog into astropy table
-    if "CATALOG_TYPE" not in final_options.keys():
-        catalog = ascii.read(cat_name)
-    elif final_options["CATALOG_TYPE"] == "ASCII_HEAD":
-        catalog = ascii.read(cat_name)
-    else:
-        raise errors.SEWError(
-            f"{final_options['CATALOG_TYPE']} is an invalid CATALOG_TYPE"
-        )
-
-    # clean up the mess of temporary files
-    if created_tmp:
-        logger.debug(f"deleting temporary file {image_path}")
-        os.remove(image_path)
-    if param_file_name is not None:
-        logger.debug(f"deleting temporary file {param_file_name}")
-        os.remove(param_file_name)
-    if not save_cat:
-        logger.debug(f"deleting temporary file {cat_name}")
-        os.remove(cat_name)
-
-    return catalog
+                label = "" if run_label is None else "_" + run_label
+                cat_name = Path(tmp_path) / f"se{label}.cat"
+                save_cat = False
+
+            # write param file if extra params were given
+            param_file_name = None
+            if len(params) > len(DEFAULT_PARAMS):
+                label = "" if run_label is None else "_" + run_label
+                param_file_name = Path(tmp_path) / f"params{label}.se"
+                with open(param_file_name, "w") as f:
+                    logger.debug("writing parameter file to %s", param_file_name)
+                    f.write("\n".join(params))
+                final_options["PARAMETERS_NAME"] = param_file_name
+
+        try:
+            with report.stage("sextractor"):
+                _run_sextractor(
+                    image_path,
+                    cat_name,
+                    config_file_path,
+                    final_options,
+                    report,
+                    timeout=timeout,
+                    retries=retries,
+                    stdout_parser=stdout_parser,
+                )
+            report.record_written_files(
+                image_path if created_tmp else None,
+                param_file_name,
+                cat_name if stdout_parser is None else None,
+                *utils.checkimage_file_names(final_options),
+            )
+
+            # convert detection catalog into astropy table
+            with report.stage("parse"):
+                if stdout_parser is None:
+                    catalog = read_catalog(cat_name, catalog_type)
+                    report.num_rows = len(catalog)
+                else:
+                    catalog = stdout_parser.finish()
+                    report.num_rows = stdout_parser.num_rows
+            if cache is not None:
+                with report.stage("cache"):
+                    cache.put(cache_key, cat_name, final_options)
+        finally:
+            # clean up the mess of temporary files (also when SExtractor failed)
+            with report.stage("cleanup"):
+                if created_tmp and os.path.isfile(image_path):
+                    logger.debug("deleting temporary file %s", image_path)
+                    os.remove(image_path)
+                if param_file_name is not None:
+                    logger.debug("deleting temporary file %s", param_file_name)
+                    os.remove(param_file_name)
+                if not save_cat and os.path.isfile(cat_name):
+                    logger.debug("deleting temporary file %s", cat_name)
+                    os.remove(cat_name)
+
+        return catalog
@@ -0,0 +1,383 @@
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Literal, Optional, Sequence
+
+import numpy as np
+from astropy.table import Table, vstack
+
+from . import errors
+from .log import load_logger
+from .utils import PathLike
+
+__all__ = [
+    "CatalogSink",
+    "HDF5Sink",
+    "iter_sink",
+    "open_sink",
+    "ParquetSink",
+    "read_sink",
+    "SinkFormats",
+]
+
+logger = load_logger()
+SinkFormats = Literal["parquet", "hdf5"]
+
+# names of the columns that identify the image and run of each row
+SOURCE_COLUMN = "SOURCE_IMAGE"
+RUN_LABEL_COLUMN = "RUN_LABEL"
+
+# default number of rows per parquet row group / hdf5 chunk
+DEFAULT_CHUNK_ROWS = 65536
+
+_SUFFIX_FORMATS = {
+    ".parquet": "parquet",
+    ".pq": "parquet",
+    ".h5": "hdf5",
+    ".hdf5": "hdf5",
+}
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise errors.SEWError(
+            "pyarrow is required for parquet sinks -> pip install pyarrow"
+        )
+    return pyarrow
+
+
+def _import_h5py():
+    try:
+        import h5py
+    except ImportError:
+        raise errors.SEWError("h5py is required for hdf5 sinks -> pip install h5py")
+    return h5py
+
+
+def _sink_format(file_name: PathLike, format: Optional[SinkFormats]) -> str:
+    if format is None:
+        suffix = Path(file_name).suffix.lower()
+        if suffix not in _SUFFIX_FORMATS:
+            raise errors.SEWError(
+                f"cannot infer the sink format of {file_name} -> give the format "
+                f"or use one of the suffixes {list(_SUFFIX_FORMATS)}"
+            )
+        return _SUFFIX_FORMATS[suffix]
+    if format not in ["parquet", "hdf5"]:
+        raise errors.SEWError(f"{format} is not a valid sink format")
+    return format
+
+
+class CatalogSink(ABC):
+    """Append catalogs to a columnar file as they are produced.
+
+    Each catalog is written with two extra columns, SOURCE_IMAGE and RUN_LABEL,
+    so the rows of every image can be selected later. Only a chunk of rows is
+    kept in memory, so memory use does not grow with the number of catalogs.
+    All catalogs must have the same columns and dtypes as the first one. The
+    write method may be called from several threads at once.
+
+    Use ParquetSink or HDF5Sink (or open_sink to pick one by file suffix).
+
+    Args:
+        file_name: The output file. It is overwritten.
+        chunk_rows: Number of rows per parquet row group / hdf5 chunk.
+    """
+
+    def __init__(self, file_name: PathLike, chunk_rows: int = DEFAULT_CHUNK_ROWS):
+        self.file_name = Path(file_name)
+        self.chunk_rows = int(chunk_rows)
+        self.num_rows = 0
+        self.num_catalogs = 0
+        self._colnames: Optional[List[str]] = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def _columns(
+        self, catalog: Table, source: str, run_label: str
+    ) -> Dict[str, np.ndarray]:
+        """Return the columns to write, with the source image and run label added."""
+        columns = {name: np.asarray(catalog[name]) for name in catalog.colnames}
+        columns[SOURCE_COLUMN] = np.full(len(catalog), source, dtype=object)
+        columns[RUN_LABEL_COLUMN] = np.full(len(catalog), run_label, dtype=object)
+        if self._colnames is None:
+            self._colnames = list(columns)
+        elif list(columns) != self._colnames:
+            raise errors.SEWError(
+                f"catalog columns {catalog.colnames} do not match the sink columns "
+                f"{self._colnames[:-2]}"
+            )
+        return columns
+
+    def write(self, catalog: Table, source: PathLike = "", run_label: str = ""):
+        """Append a catalog to the file.
+
+        Args:
+            catalog: SExtractor catalog.
+            source: The image the catalog was measured on (e.g., its file name).
+            run_label: Label of the run that produced the catalog.
+        """
+        with self._lock:
+            if self._closed:
+                raise errors.SEWError(f"cannot write to closed sink {self.file_name}")
+            self._append(self._columns(catalog, str(source), str(run_label)), catalog)
+            self.num_rows += len(catalog)
+            self.num_catalogs += 1
+
+    def close(self):
+        """Write the remaining rows and close the file."""
+        with self._lock:
+            if not self._closed:
+                self._close()
+                self._closed = True
+                logger.debug(
+                    "Wrote %s rows of %s catalogs to %s",
+                    self.num_rows,
+                    self.num_catalogs,
+                    self.file_name,
+                )
+
+    @abstractmethod
+    def _append(self, columns: Dict[str, np.ndarray], catalog: Table):
+        """Append the columns of a catalog to the file."""
+
+    @abstractmethod
+    def _close(self):
+        """Write the remaining rows and close the file."""
+
+
+class ParquetSink(CatalogSink):
+    """Append catalogs to a parquet file (requires pyarrow).
+
+    Rows are buffered and written in row groups of chunk_rows rows. The units
+    of the catalog columns are stored in the field metadata.
+    """
+
+    def __init__(self, file_name: PathLike, chunk_rows: int = DEFAULT_CHUNK_ROWS):
+        super().__init__(file_name, chunk_rows)
+        self._pa = _import_pyarrow()
+        self._writer: Optional[Any] = None
+        self._buffer: list = []
+        self._buffer_rows = 0
+
+    def _append(self, columns: Dict[str, np.ndarray], catalog: Table):
+        pa = self._pa
+        if self._writer is None:
+            fields = []
+            for name, data in columns.items():
+                unit = catalog[name].unit if name in catalog.colnames else None
+                dtype = (
+                    pa.string()
+                    if data.dtype == object
+                    else pa.from_numpy_dtype(data.dtype)
+                )
+                if data.ndim > 1:
+                    dtype = pa.list_(dtype, data.shape[1])
+                metadata = None if unit is None else {"unit": str(unit)}
+                fields.append(pa.field(name, dtype, metadata=metadata))
+            self._writer = pa.parquet.ParquetWriter(self.file_name, pa.schema(fields))
+        schema = self._writer.schema
+        arrays = []
+        for field, data in zip(schema, columns.values()):
+            if data.ndim > 1:
+                values = pa.array(data.ravel(), type=field.type.value_type)
+                arrays.append(pa.FixedSizeListArray.from_arrays(values, data.shape[1]))
+            else:
+                arrays.append(pa.array(data, type=field.type))
+        self._buffer.append(pa.Table.from_arrays(arrays, schema=schema))
+        self._buffer_rows += len(catalog)
+        if self._buffer_rows >= self.chunk_rows:
+            self._flush()
+
+    def _flush(self):
+        if self._buffer_rows > 0:
+            table = self._pa.concat_tables(self._buffer)
+            self._writer.write_table(table, row_group_size=self.chunk_rows)
+        self._buffer = []
+        self._buffer_rows = 0
+
+    def _close(self):
+        if self._writer is not None:
+            self._flush()
+            self._writer.close()
+
+
+class HDF5Sink(CatalogSink):
+    """Append catalogs to an hdf5 file (requires h5py).
+
+    Every column is a resizable, chunked dataset of the group "catalog", which
+    grows as catalogs are appended. The units of the catalog columns are
+    stored in the "unit" attribute of the datasets.
+
+    Args:
+        file_name: The output file. It is overwritten.
+        chunk_rows: Number of rows per hdf5 chunk.
+        compression: Optional hdf5 compression filter (e.g., "gzip" or "lzf").
+    """
+
+    def __init__(
+        self,
+        file_name: PathLike,
+        chunk_rows: int = DEFAULT_CHUNK_ROWS,
+        compression: Optional[str] = None,
+    ):
+        super().__init__(file_name, chunk_rows)
+        self._h5py = _import_h5py()
+        self._file = self._h5py.File(self.file_name, "w")
+        self._group = self._file.create_group("catalog", track_order=True)
+        self._compression = compression
+
+    def _append(self, columns: Dict[str, np.ndarray], catalog: Table):
+        start = self.num_rows
+        for name, data in columns.items():
+            if name not in self._group:
+                dtype = (
+                    self._h5py.string_dtype() if data.dtype == object else data.dtype
+                )
+                dataset = self._group.create_dataset(
+                    name,
+                    shape=(0,) + data.shape[1:],
+                    maxshape=(None,) + data.shape[1:],
+                    chunks=(self.chunk_rows,) + data.shape[1:],
+                    dtype=dtype,
+                    compression=self._compression,
+                )
+                if name in catalog.colnames and catalog[name].unit is not None:
+                    dataset.attrs["unit"] = str(catalog[name].unit)
+            dataset = self._group[name]
+            dataset.resize(start + len(data), axis=0)
+            dataset[start:] = data
+
+    def _close(self):
+        self._file.close()
+
+
+def open_sink(
+    file_name: PathLike,
+    format: Optional[SinkFormats] = None,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+) -> CatalogSink:
+    """Open a catalog sink, choosing the format from the file suffix if not given.
+
+    Args:
+        file_name: The output file (.parquet/.pq or .h5/.hdf5). It is overwritten.
+        format: "parquet" or "hdf5". Inferred from the suffix if None.
+        chunk_rows: Number of rows per parquet row group / hdf5 chunk.
+
+    Returns:
+        The sink. Close it (or use it as a context manager) when done.
+
+    Example:
+        with sew.sink.open_sink("survey.parquet") as sink:
+            sew.run_many(file_names, sink=sink, DETECT_THRESH=3)
+    """
+    if _sink_format(file_name, format) == "parquet":
+        return ParquetSink(file_name, chunk_rows)
+    return HDF5Sink(file_name, chunk_rows)
+
+
+def _to_table(columns: Dict[str, np.ndarray], units: Dict[str, str]) -> Table:
+    catalog = Table()
+    for name, data in columns.items():
+        catalog[name] = data
+        if units.get(name):
+            catalog[name].unit = units[name]
+    return catalog
+
+
+def iter_sink(
+    file_name: PathLike,
+    columns: Optional[Sequence[str]] = None,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    format: Optional[SinkFormats] = None,
+) -> Iterator[Table]:
+    """Read a catalog sink file chunk by chunk.
+
+    Note:
+        Only the selected columns are read from the file, one chunk of rows at
+        a time, so files that do not fit in memory can be processed.
+
+    Args:
+        file_name: File written by a catalog sink.
+        columns: Names of the columns to read. All columns are read if None.
+        chunk_rows: Maximum number of rows per chunk.
+        format: "parquet" or "hdf5". Inferred from the suffix if None.
+
+    Yields:
+        Astropy tables with up to chunk_rows rows of the selected columns.
+    """
+    columns = None if columns is None else list(columns)
+    if _sink_format(file_name, format) == "parquet":
+        pa = _import_pyarrow()
+        parquet_file = pa.parquet.ParquetFile(file_name)
+        schema = parquet_file.schema_arrow
+        units = {
+            f.name: f.metadata[b"unit"].decode()
+            for f in schema
+            if f.metadata is not None and b"unit" in f.metadata
+        }
+        for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=columns):
+            data = {}
+            for name, array in zip(batch.schema.names, batch.columns):
+                if pa.types.is_fixed_size_list(array.type):
+                    values = array.flatten().to_numpy(zero_copy_only=False)
+                    data[name] = values.reshape(len(array), array.type.list_size)
+                else:
+                    data[name] = array.to_numpy(zero_copy_only=False)
+            yield _to_table(data, units)
+    else:
+        h5py = _import_h5py()
+        with h5py.File(file_name, "r") as f:
+            group = f["catalog"]
+            names = list(group) if columns is None else columns
+            missing = [name for name in names if name not in group]
+            if len(missing) > 0:
+                raise errors.SEWError(f"{missing} are not columns of {file_name}")
+            units = {name: group[name].attrs.get("unit") for name in names}
+            num_rows = len(group[names[0]]) if len(names) > 0 else 0
+            for start in range(0, num_rows, chunk_rows):
+                data = {}
+                for name in names:
+                    dataset = group[name]
+                    chunk = dataset[start : start + chunk_rows]
+                    if h5py.check_string_dtype(dataset.dtype) is not None:
+                        chunk = dataset.asstr()[start : start + chunk_rows]
+                    data[name] = chunk
+                yield _to_table(data, units)
+
+
+def read_sink(
+    file_name: PathLike,
+    columns: Optional[Sequence[str]] = None,
+    format: Optional[SinkFormats] = None,
+) -> Table:
+    """Read the selected columns of a catalog sink file into one table.
+
+    Args:
+        file_name: File written by a catalog sink.
+        columns: Names of the columns to read. All columns are read if None.
+        format: "parquet" or "hdf5". Inferred from the suffix if None.
+
+    Returns:
+        The selected columns of all catalogs in the file.
+
+    Example:
+        cat = sew.sink.read_sink("survey.parquet", ["X_IMAGE", "Y_IMAGE", "SOURCE_IMAGE"])
+    """
+    tables = list(iter_sink(file_name, columns, format=format))
+    if len(tables) == 0:
+        return Table()
+    return vstack(tables, metadata_conflicts="silent")
@@ -0,0 +1,181 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Union
+
+import numpy as np
+from astropy.io import fits
+
+from . import errors
+from .cache import evict_least_recently_used
+from .constants import STAGING_PATH
+from .log import load_logger
+from .utils import PathLike
+
+__all__ = [
+    "get_default_store",
+    "IMAGE_OPTIONS",
+    "set_default_store",
+    "StagingStore",
+]
+
+logger = load_logger()
+
+# SExtractor config options whose values are images
+IMAGE_OPTIONS = ["WEIGHT_IMAGE", "FLAG_IMAGE"]
+
+_default_store: Optional["StagingStore"] = None
+_default_store_lock = threading.Lock()
+
+
+class StagingStore:
+    """Content-addressed scratch store of fits files staged from numpy arrays.
+
+    Each unique array is written once, to a file named after the hash of its
+    dtype, shape, and pixels, so later calls and parallel workers (threads or
+    processes sharing the directory) reuse the same file. Files are written
+    atomically, so concurrent writers never see a partial file.
+
+    Every use of a file updates its access time. When the store grows beyond
+    max_bytes, the least recently used files are deleted, but never those used
+    in the last min_age seconds, so the files of running SExtractor processes
+    are kept.
+
+    Args:
+        path: Directory of the store. Defaults to STAGING_PATH (set the
+            SEW_STAGING_DIR env variable to change it).
+        max_bytes: Maximum total size of the store in bytes. Defaults to 2 GB.
+        min_age: Files used less than this many seconds ago are never deleted.
+
+    Example:
+        store = StagingStore()
+        weight_path = store.stage(weight_map)
+        cat = sew.run(image, WEIGHT_TYPE="MAP_WEIGHT", WEIGHT_IMAGE=weight_path)
+    """
+
+    def __init__(
+        self,
+        path: Optional[PathLike] = None,
+        max_bytes: float = 2e9,
+        min_age: float = 3600,
+    ):
+        self.path = Path(STAGING_PATH if path is None else path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(max_bytes)
+        self.min_age = float(min_age)
+
+    @staticmethod
+    def make_key(pixels: np.ndarray) -> str:
+        """Return the content hash of an array."""
+        pixels = np.ascontiguousarray(pixels)
+        sha = hashlib.sha256()
+        sha.update(f"{pixels.dtype.str}{pixels.shape}".encode())
+        sha.update(pixels.reshape(-1).view(np.uint8).data)
+        return sha.hexdigest()
+
+    def stage(self, pixels: np.ndarray) -> Path:
+        """Write an array to the store, unless it is already there.
+
+        Note:
+            Boolean arrays are written as uint8, because fits has no boolean
+            images (e.g., for FLAG_IMAGE).
+
+        Args:
+            pixels: The image pixels.
+
+        Returns:
+            Path of the fits file that contains the pixels.
+        """
+        if pixels.dtype == bool:
+            pixels = pixels.astype(np.uint8)
+        file_name = self.path / f"{self.make_key(pixels)}.fits"
+        if file_name.is_file():
+            # mark it as used without changing its modification time
+            stat = file_name.stat()
+            os.utime(file_name, ns=(time.time_ns(), stat.st_mtime_ns))
+            logger.debug("Reusing staged file %s", file_name)
+            return file_name
+
+        fd, tmp_name = tempfile.mkstemp(prefix=".", suffix=".fits", dir=self.path)
+        os.close(fd)
+        try:
+            fits.writeto(tmp_name, pixels, overwrite=True)
+            os.replace(tmp_name, file_name)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+        logger.debug("Staged %s array in %s", pixels.shape, file_name)
+        self.collect_garbage()
+        return file_name
+
+    def stage_option_value(
+        self, value: Union[np.ndarray, list, tuple, PathLike]
+    ) -> Union[list, tuple, PathLike]:
+        """Replace the arrays of an image-valued option value with staged files.
+
+        Args:
+            value: An array, a path, or a list of arrays and/or paths (e.g., one
+                weight map per image in dual-image mode).
+
+        Returns:
+            The staged file name(s) as a comma-separated string, or the value
+            unchanged if it contains no arrays.
+        """
+        if isinstance(value, np.ndarray):
+            return str(self.stage(value))
+        if isinstance(value, (list, tuple)):
+            return self._stage_sequence(value)
+        return value
+
+    def _stage_sequence(self, values: Union[list, tuple]) -> Union[list, tuple, str]:
+        """Stage the arrays of a list of option values (see stage_option_value)."""
+        if not any(isinstance(v, np.ndarray) for v in values):
+            return values
+        return ",".join(
+            str(self.stage(v)) if isinstance(v, np.ndarray) else str(v) for v in values
+        )
+
+    def collect_garbage(self) -> List[Path]:
+        """Delete the least recently used files beyond max_bytes.
+
+        Returns:
+            The paths of the deleted files.
+        """
+        return evict_least_recently_used(
+            self.path, self.max_bytes, min_age=self.min_age, use_atime=True
+        )
+
+    def clear(self):
+        """Delete all files in the store (including those that may be in use)."""
+        for file_name in self.path.glob("*.fits"):
+            file_name.unlink(missing_ok=True)
+
+    @property
+    def size(self) -> int:
+        """Total size of the store in bytes."""
+        return sum(f.stat().st_size for f in self.path.glob("*.fits"))
+
+
+def get_default_store() -> StagingStore:
+    """Return the store used to stage arrays given as image-valued options."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = StagingStore()
+        return _default_store
+
+
+def set_default_store(store: StagingStore):
+    """Set the store used to stage arrays given as image-valued options.
+
+    Args:
+        store: The staging store (e.g., one in a RAM-backed directory).
+    """
+    global _default_store
+    if not isinstance(store, StagingStore):
+        raise errors.SEWError(f"{store} is not a StagingStore")
+    with _default_store_lock:
+        _default_store = store
@@ -0,0 +1,266 @@
+import itertools
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from astropy.io import fits
+from astropy.table import Table, vstack
+
+from . import errors, utils
+from .catalog import read_catalog
+from .log import load_logger
+from .report import RunReport, emit_report
+from .sextractor import (
+    DEFAULT_CONFIG_PATH,
+    DEFAULT_PARAMS,
+    OPTION_NAMES,
+    _build_options,
+    _build_params,
+    _run_sextractor,
+)
+from .utils import PathLike, PathOrPixels, StagingModes, make_keys_uppercase
+
+__all__ = ["run_sweep", "SweepResult"]
+
+logger = load_logger()
+
+
+@dataclass
+class SweepResult:
+    """Catalogs of a parameter sweep, indexed by the swept option values.
+
+    Attributes:
+        option_names: Names of the swept options, in grid order.
+        catalogs: Catalog of each grid point, keyed by the tuple of its option
+            values (in the order of option_names).
+
+    Example:
+        result = sew.sweep.run_sweep(image, dict(DETECT_THRESH=[1.5, 3], DETECT_MINAREA=[5, 10]))
+        cat = result[3, 10]
+        result.summary()  # one row per grid point with the number of sources
+    """
+
+    option_names: List[str]
+    catalogs: Dict[Tuple, Table]
+
+    def __getitem__(self, values: Any) -> Table:
+        if not isinstance(values, tuple):
+            values = (values,)
+        return self.catalogs[values]
+
+    def __iter__(self) -> Iterator[Tuple]:
+        return iter(self.catalogs)
+
+    def __len__(self) -> int:
+        return len(self.catalogs)
+
+    def items(self):
+        return self.catalogs.items()
+
+    def summary(self) -> Table:
+        """Return a table with the option values and number of sources of each grid point."""
+        rows = [list(values) + [len(cat)] for values, cat in self.catalogs.items()]
+        return Table(rows=rows, names=self.option_names + ["NUM_SOURCES"])
+
+    def stack(self) -> Table:
+        """Return all catalogs in one table, with a column for each swept option."""
+        tables = []
+        for values, cat in self.catalogs.items():
+            cat = cat.copy(copy_data=False)
+            for name, value in zip(self.option_names, values):
+                cat[name] = [value] * len(cat)
+            tables.append(cat)
+        return vstack(tables, metadata_conflicts="silent")
+
+
+def _measure_background(
+    image_path: PathLike,
+    scratch_path: Path,
+    config_file_path: Optional[PathLike],
+    final_options: dict,
+    timeout: Optional[float],
+    retries: int,
+) -> np.ndarray:
+    """Run SExtractor once to get its background map."""
+    back_file_name = scratch_path / "background.fits"
+    options = dict(
+        final_options,
+        CATALOG_TYPE="NONE",
+        CHECKIMAGE_TYPE="BACKGROUND",
+        CHECKIMAGE_NAME=back_file_name,
+    )
+    report = RunReport(run_label="background")
+    with report.stage("sextractor"):
+        _run_sextractor(
+            image_path,
+            scratch_path / "background.cat",
+            config_file_path,
+            options,
+            report,
+            timeout=timeout,
+            retries=retries,
+        )
+    report.record_written_files(back_file_name)
+    with report.stage("checkimage"):
+        background = utils.read_checkimage(back_file_name)
+    with report.stage("cleanup"):
+        os.remove(back_file_name)
+    emit_report(report)
+    return background
+
+
+def run_sweep(
+    path_or_pixels: PathOrPixels,
+    grid: Dict[str, Sequence[Any]],
+    header: Optional[fits.Header] = None,
+    extra_params: Optional[Union[str, List[str]]] = None,
+    config_file_path: Optional[PathLike] = DEFAULT_CONFIG_PATH,
+    reuse_background: bool = True,
+    background: Optional[np.ndarray] = None,
+    max_workers: Optional[int] = None,
+    tmp_path: PathLike = "/tmp",
+    staging: StagingModes = "disk",
+    timeout: Optional[float] = None,
+    retries: int = 0,
+    **sextractor_options,
+) -> SweepResult:
+    """Run Source Extractor on one image for every point of a grid of option values.
+
+    Note:
+        This is much cheaper than calling sextractor.run once per grid point
+        when tuning the detection (e.g., DETECT_THRESH, DETECT_MINAREA, and the
+        DEBLEND options). The image and the parameter file are staged once, and
+        the grid points run concurrently.
+
+        With reuse_background=True, the background is computed only once (by one
+        SExtractor run, unless it is given), so every grid point is measured on
+        the same background-subtracted image, with BACK_TYPE MANUAL and
+        BACK_VALUE 0. This is an approximation of separate runs: SExtractor
+        still measures the background RMS mesh of the subtracted image at every
+        grid point (it is not reused), which is close to, but not exactly, the
+        RMS of the original image, and the BACKGROUND measurement parameter is
+        0 in these catalogs. Background options cannot be swept in this mode.
+
+        CHECKIMAGE files would be shared by all grid points, so do not request them.
+
+    Args:
+        path_or_pixels: Path to fits file or its pixels in a numpy array.
+        grid: Values of each swept option (e.g., dict(DETECT_THRESH=[1.5, 3, 5])).
+            Every combination of values is run. The values index the result, so
+            they must be hashable (e.g., file paths rather than arrays).
+        header: Astropy fits header object. If not None, this header will take precedent.
+        extra_params: Extra measurement parameters to include beyond the defaults.
+        config_file_path: Custom SExtractor config file.
+        reuse_background: If True, compute the background once and reuse it.
+        background: Optional precomputed background (e.g., from
+            background.create_sky_model). Requires reuse_background=True.
+        max_workers: Maximum number of concurrent SExtractor processes. Defaults
+            to the number of CPUs.
+        tmp_path: Parent directory of the scratch directory for temporary files.
+        staging: Where to write temporary fits files (see sextractor.run).
+        timeout: Timeout of each SExtractor run in seconds (see sextractor.run).
+        retries: Number of times to rerun SExtractor if it fails (see sextractor.run).
+        **sextractor_options: SExtractor configuration options shared by all grid points.
+
+    Returns:
+        The catalogs of all grid points, indexed by their option values.
+    """
+    grid = {k.upper(): list(v) for k, v in grid.items()}
+    invalid = [k for k in grid if k not in OPTION_NAMES]
+    if len(invalid) > 0:
+        raise errors.SEWError(f"{invalid} are not valid SExtractor options")
+    sextractor_options = make_keys_uppercase(sextractor_options)
+    if "CHECKIMAGE_TYPE" in {**sextractor_options, **grid}:
+        raise errors.SEWError("CHECKIMAGE files cannot be shared by a sweep")
+    if reuse_background and any(k.startswith("BACK") for k in grid):
+        raise errors.SEWError(
+            "background options cannot be swept with reuse_background=True"
+        )
+    if not reuse_background and background is not None:
+        raise errors.SEWError("a precomputed background requires reuse_background")
+
+    base_options = _build_options(sextractor_options)
+    params = _build_params(extra_params)
+    scratch_path = Path(tempfile.mkdtemp(prefix="sew_sweep_", dir=tmp_path))
+    created_tmp_files: List[Path] = []
+
+    def _stage(pixels: PathOrPixels, hdr: Optional[fits.Header], label: str) -> Path:
+        path, created_tmp = utils.create_temp_fits_file_if_necessary(
+            pixels, header=hdr, run_label=label, tmp_path=scratch_path, staging=staging
+        )
+        if created_tmp:
+            created_tmp_files.append(path)
+        return path
+
+    try:
+        if len(params) > len(DEFAULT_PARAMS):
+            param_file_name = scratch_path / "params.se"
+            param_file_name.write_text("\n".join(params))
+            base_options["PARAMETERS_NAME"] = param_file_name
+
+        if not reuse_background:
+            image_path = _stage(path_or_pixels, header, "image")
+        else:
+            if background is None:
+                background = _measure_background(
+                    _stage(path_or_pixels, header, "original"),
+                    scratch_path,
+                    config_file_path,
+                    base_options,
+                    timeout,
+                    retries,
+                )
+            if isinstance(path_or_pixels, np.ndarray):
+                pixels = path_or_pixels
+            else:
+                pixels, file_header = fits.getdata(path_or_pixels, header=True)
+                header = file_header if header is None else header
+            image_path = _stage(
+                (pixels - background).astype(np.float32), header, "image"
+            )
+            base_options.update(BACK_TYPE="MANUAL", BACK_VALUE=0.0)
+
+        def _run_point(i: int, values: Tuple) -> Table:
+            # validate (and stage the arrays of) the grid values as run does
+            final_options = _build_options(
+                dict(zip(grid, values)), defaults=base_options
+            )
+            report = RunReport(run_label=f"sweep_{i}")
+            cat_name = scratch_path / f"se_{i}.cat"
+            with report.stage("sextractor"):
+                _run_sextractor(
+                    image_path,
+                    cat_name,
+                    config_file_path,
+                    final_options,
+                    report,
+                    timeout=timeout,
+                    retries=retries,
+                )
+            report.record_written_files(cat_name)
+            with report.stage("parse"):
+                catalog = read_catalog(cat_name, final_options["CATALOG_TYPE"])
+            report.num_rows = len(catalog)
+            with report.stage("cleanup"):
+                os.remove(cat_name)
+            emit_report(report)
+            return catalog
+
+        points = list(itertools.product(*grid.values()))
+        logger.debug("Running sweep of %s grid points over %s", len(points), list(grid))
+        max_workers = max_workers or os.cpu_count() or 1
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            catalogs = list(executor.map(_run_point, range(len(points)), points))
+    finally:
+        # files staged with staging="memory" are outside the scratch directory
+        for fn in created_tmp_files:
+            if fn.is_file():
+                os.remove(fn)
+        shutil.rmtree(scratch_path, ignore_errors=True)
+
+    return SweepResult(list(grid), dict(zip(points, catalogs)))
@@ -0,0 +1,330 @@
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from astropy.io import fits
+from astropy.table import Table, vstack
+
+from . import errors, segmentation, sextractor
+from .batch import map_batch
+from .log import load_logger
+from .utils import ListLike, PathLike, PathOrPixels
+
+__all__ = [
+    "create_tiled_object_mask",
+    "create_tiled_sky_model",
+    "make_tiles",
+    "run_tiled",
+    "Tile",
+]
+
+logger = load_logger()
+
+# catalog columns that are shifted from the tile frame back to the mosaic frame
+X_POSITION_COLUMNS = [
+    "X_IMAGE",
+    "X_IMAGE_DBL",
+    "XWIN_IMAGE",
+    "XPEAK_IMAGE",
+    "XMIN_IMAGE",
+    "XMAX_IMAGE",
+    "XPSF_IMAGE",
+    "XMODEL_IMAGE",
+]
+Y_POSITION_COLUMNS = [c.replace("X", "Y", 1) for c in X_POSITION_COLUMNS]
+
+
+class Tile(NamedTuple):
+    """A tile of a mosaic image.
+
+    The core regions of all tiles partition the mosaic, and each tile is padded
+    by the overlap on every side (clipped at the mosaic edges). All bounds are
+    zero-based and the stop values are exclusive.
+    """
+
+    y_start: int
+    y_stop: int
+    x_start: int
+    x_stop: int
+    core_y_start: int
+    core_y_stop: int
+    core_x_start: int
+    core_x_stop: int
+
+    @property
+    def slices(self) -> Tuple[slice, slice]:
+        """Slices of the padded tile in the mosaic."""
+        return slice(self.y_start, self.y_stop), slice(self.x_start, self.x_stop)
+
+    @property
+    def core_slices(self) -> Tuple[slice, slice]:
+        """Slices of the tile's core region in the mosaic."""
+        return (
+            slice(self.core_y_start, self.core_y_stop),
+            slice(self.core_x_start, self.core_x_stop),
+        )
+
+    @property
+    def core_slices_in_tile(self) -> Tuple[slice, slice]:
+        """Slices of the tile's core region in the padded tile."""
+        return (
+            slice(self.core_y_start - self.y_start, self.core_y_stop - self.y_start),
+            slice(self.core_x_start - self.x_start, self.core_x_stop - self.x_start),
+        )
+
+
+def make_tiles(
+    image_shape: ListLike, tile_size: int = 2048, overlap: int = 128
+) -> List[Tile]:
+    """Split an image into overlapping tiles.
+
+    Args:
+        image_shape: Shape of the mosaic image.
+        tile_size: Size of the core region of each tile in pixels.
+        overlap: Number of pixels each tile is padded by on every side.
+
+    Returns:
+        List of tiles covering the image in row-major order.
+    """
+    ny, nx = int(image_shape[0]), int(image_shape[1])
+    tiles = []
+    for y0 in range(0, ny, tile_size):
+        y1 = min(y0 + tile_size, ny)
+        for x0 in range(0, nx, tile_size):
+            x1 = min(x0 + tile_size, nx)
+            tiles.append(
+                Tile(
+                    max(y0 - overlap, 0),
+                    min(y1 + overlap, ny),
+                    max(x0 - overlap, 0),
+                    min(x1 + overlap, nx),
+                    y0,
+                    y1,
+                    x0,
+                    x1,
+                )
+            )
+    return tiles
+
+
+def _load_image(
+    path_or_pixels: PathOrPixels, header: Optional[fits.Header]
+) -> Tuple[np.ndarray, Optional[fits.Header]]:
+    if isinstance(path_or_pixels, np.ndarray):
+        return path_or_pixels, header
+    # memory map the mosaic, so each tile is read from disk by its worker
+    pixels, file_header = fits.getdata(str(path_or_pixels), header=True, memmap=True)
+    return pixels, file_header if header is None else header
+
+
+def _tile_header(header: Optional[fits.Header], tile: Tile) -> Optional[fits.Header]:
+    """Shift the WCS reference pixel of a header to the tile frame."""
+    if header is None:
+        return None
+    header = header.copy()
+    if "CRPIX1" in header:
+        header["CRPIX1"] -= tile.x_start
+    if "CRPIX2" in header:
+        header["CRPIX2"] -= tile.y_start
+    return header
+
+
+def _call_on_tile(
+    item: Tuple[Tile, dict],
+    tmp_path: PathLike,
+    tile_func: Callable,
+    pixels: np.ndarray,
+    **kwargs,
+):
+    tile, tile_kwargs = item
+    # copy the tile in the worker, so only the tiles being processed are in memory
+    tile_pixels = np.ascontiguousarray(pixels[tile.slices])
+    return tile_func(tile_pixels, tmp_path=tmp_path, **tile_kwargs, **kwargs)
+
+
+def _map_tiles(
+    func: Callable,
+    pixels: np.ndarray,
+    tiles: List[Tile],
+    tile_kwargs: Optional[List[dict]],
+    max_workers: Optional[int],
+    tmp_path: PathLike,
+    **kwargs,
+) -> list:
+    if tile_kwargs is None:
+        tile_kwargs = [{} for _ in tiles]
+    items = list(zip(tiles, tile_kwargs))
+    logger.debug("Processing %s tiles", len(tiles))
+    results = map_batch(
+        _call_on_tile,
+        items,
+        max_workers=max_workers,
+        tmp_path=tmp_path,
+        tile_func=func,
+        pixels=pixels,
+        **kwargs,
+    )
+    for tile, result in zip(tiles, results):
+        if isinstance(result, Exception):
+            raise errors.SEWError(
+                f"Processing of tile {tile} failed -> {result}"
+            ) from result
+    return results
+
+
+def run_tiled(
+    path_or_pixels: PathOrPixels,
+    tile_size: int = 2048,
+    overlap: int = 128,
+    header: Optional[fits.Header] = None,
+    max_workers: Optional[int] = None,
+    tmp_path: PathLike = "/tmp",
+    **run_kwargs,
+) -> Table:
+    """Run Source Extractor on a large image by splitting it into overlapping tiles.
+
+    Note:
+        The tiles are processed in parallel. Each detection is kept only by the tile
+        whose core region contains its position (X_IMAGE, Y_IMAGE), which drops the
+        duplicate detections in the overlap zones. The overlap should therefore be
+        larger than the biggest source. Pixel positions are shifted back to the
+        mosaic frame and, if a header is given, the WCS reference pixel of each
+        tile is shifted so that world coordinates are correct. A fits file is
+        memory mapped, so only the tiles being processed are read into memory.
+
+    Args:
+        path_or_pixels: Path to fits file or its pixels in a numpy array.
+        tile_size: Size of the core region of each tile in pixels.
+        overlap: Number of pixels each tile is padded by on every side.
+        header: Astropy fits header object. If not None, this header will take precedent.
+        max_workers: Maximum number of concurrent SExtractor processes.
+        tmp_path: Parent directory of the per-tile scratch directories.
+        **run_kwargs: Arguments passed to sextractor.run (e.g., extra_params
+            or any SExtractor configuration option).
+
+    Returns:
+        The stitched SExtractor catalog in an Astropy table object.
+    """
+    if run_kwargs.get("catalog_file_path") is not None:
+        raise errors.SEWError("catalog_file_path cannot be shared by all tiles")
+    pixels, header = _load_image(path_or_pixels, header)
+    tiles = make_tiles(pixels.shape, tile_size, overlap)
+    tile_kwargs = [dict(header=_tile_header(header, t)) for t in tiles]
+    catalogs = _map_tiles(
+        sextractor.run, pixels, tiles, tile_kwargs, max_workers, tmp_path, **run_kwargs
+    )
+
+    stitched = []
+    for tile, cat in zip(tiles, catalogs):
+        for col in X_POSITION_COLUMNS:
+            if col in cat.colnames:
+                cat[col] += tile.x_start
+        for col in Y_POSITION_COLUMNS:
+            if col in cat.colnames:
+                cat[col] += tile.y_start
+        x = cat["X_IMAGE"] - 1
+        y = cat["Y_IMAGE"] - 1
+        in_core = (
+            (x >= tile.core_x_start - 0.5)
+            & (x < tile.core_x_stop - 0.5)
+            & (y >= tile.core_y_start - 0.5)
+            & (y < tile.core_y_stop - 0.5)
+        )
+        stitched.append(cat[in_core])
+
+    catalog = vstack(stitched, metadata_conflicts="silent")
+    if "NUMBER" in catalog.colnames:
+        catalog["NUMBER"] = np.arange(1, len(catalog) + 1)
+    return catalog
+
+
+def _stitch_images(
+    results: list, tiles: List[Tile], image_shape: Tuple[int, int]
+) -> np.ndarray:
+    stitched = np.zeros(image_shape, dtype=results[0].dtype)
+    for tile, result in zip(tiles, results):
+        stitched[tile.core_slices] = result[tile.core_slices_in_tile]
+    return stitched
+
+
+def create_tiled_object_mask(
+    path_or_pixels: PathOrPixels,
+    tile_size: int = 2048,
+    overlap: int = 128,
+    max_workers: Optional[int] = None,
+    tmp_path: PathLike = "/tmp",
+    dilate_npix: int = 5,
+    **sextractor_options,
+) -> np.ndarray:
+    """Create an object mask of a large image by splitting it into overlapping tiles.
+
+    Note:
+        Each tile is processed with segmentation.create_sextractor_object_mask and the
+        core regions of the tile masks are stitched together. The overlap should be
+        larger than the biggest source plus dilate_npix.
+
+    Args:
+        path_or_pixels: Path to fits file or its pixels in a numpy array.
+        tile_size: Size of the core region of each tile in pixels.
+        overlap: Number of pixels each tile is padded by on every side.
+        max_workers: Maximum number of concurrent SExtractor processes.
+        tmp_path: Parent directory of the per-tile scratch directories.
+        dilate_npix: Apply grey dilation with structuring element of dimension
+            (dilate_npix, dilate_npix).
+        **sextractor_options: Any SExtractor configuration option passed as a keyword.
+
+    Returns:
+        The stitched object mask as a numpy array.
+    """
+    pixels, _ = _load_image(path_or_pixels, None)
+    tiles = make_tiles(pixels.shape, tile_size, overlap)
+    masks = _map_tiles(
+        segmentation.create_sextractor_object_mask,
+        pixels,
+        tiles,
+        None,
+        max_workers,
+        tmp_path,
+        dilate_npix=dilate_npix,
+        **sextractor_options,
+    )
+    return _stitch_images(masks, tiles, pixels.shape)
+
+
+def create_tiled_sky_model(
+    path_or_pixels: PathOrPixels,
+    tile_size: int = 2048,
+    overlap: int = 128,
+    max_workers: Optional[int] = None,
+    tmp_path: PathLike = "/tmp",
+    **sextractor_options,
+) -> np.ndarray:
+    """Create a sky model of a large image by splitting it into overlapping tiles.
+
+    Note:
+        Each tile is processed with segmentation.create_sextractor_sky_model and the
+        core regions of the tile sky models are stitched together. Use an overlap
+        of at least BACK_SIZE to limit discontinuities at the tile boundaries.
+
+    Args:
+        path_or_pixels: Path to fits file or its pixels in a numpy array.
+        tile_size: Size of the core region of each tile in pixels.
+        overlap: Number of pixels each tile is padded by on every side.
+        max_workers: Maximum number of concurrent SExtractor processes.
+        tmp_path: Parent directory of the per-tile scratch directories.
+        **sextractor_options: Any SExtractor configuration option passed as a keyword.
+
+    Returns:
+        The stitched sky model as a numpy array.
+    """
+    pixels, _ = _load_image(path_or_pixels, None)
+    tiles = make_tiles(pixels.shape, tile_size, overlap)
+    sky_models = _map_tiles(
+        segmentation.create_sextractor_sky_model,
+        pixels,
+        tiles,
+        None,
+        max_workers,
+        tmp_path,
+        **sextractor_options,
+    )
+    return _stitch_images(sky_models, tiles, pixels.shape)
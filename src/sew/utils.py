@@ -1,26 +1,168 @@
+import os
+import shutil
+import tempfile
 from pathlib import Path
-from typing import Any, List, Optional, Tuple, Union
+from typing import Any, List, Literal, Optional, Sequence, Tuple, Union
 
 import numpy as np
 from astropy.io import fits
 
 from . import errors
+from .constants import RAM_STAGING_PATH
 from .log import load_logger
 
 __all__ = [
+    "checkimage_file_names",
     "create_temp_fits_file_if_necessary",
+    "create_temp_mef_file_if_necessary",
+    "get_ram_staging_path",
+    "image_extension_names",
     "is_list_like",
     "list_of_strings",
     "ListLike",
     "make_keys_uppercase",
+    "MEFPathOrPixels",
     "PathLike",
     "PathOrPixels",
+    "read_checkimage",
+    "StagingModes",
 ]
 
 logger = load_logger()
 ListLike = Union[list, tuple, np.ndarray]
 PathLike = Union[Path, str, np.str_]
 PathOrPixels = Union[PathLike, np.ndarray]
+MEFPathOrPixels = Union[PathLike, np.ndarray, Sequence[np.ndarray]]
+StagingModes = Literal["disk", "memory"]
+
+# fraction of free RAM that a staged image is allowed to use
+RAM_STAGING_MAX_FRACTION = 0.5
+
+
+def _available_memory() -> Optional[int]:
+    """Return the available system memory in bytes (None if unknown)."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def get_ram_staging_path(nbytes: int) -> Optional[Path]:
+    """Return a RAM-backed directory with room for a file of nbytes bytes.
+
+    Note:
+        The RAM-backed directory is RAM_STAGING_PATH (/dev/shm by default, set
+        the SEW_RAM_PATH env variable to change it). A file only fits if it uses
+        less than half of both the free space in that directory and the
+        available system memory.
+
+    Args:
+        nbytes: Size of the file that will be staged.
+
+    Returns:
+        The RAM-backed directory, or None if it does not exist or the file does not fit.
+    """
+    if not (RAM_STAGING_PATH.is_dir() and os.access(RAM_STAGING_PATH, os.W_OK)):
+        return None
+    limits = [shutil.disk_usage(RAM_STAGING_PATH).free]
+    mem_available = _available_memory()
+    if mem_available is not None:
+        limits.append(mem_available)
+    if nbytes > RAM_STAGING_MAX_FRACTION * min(limits):
+        return None
+    return RAM_STAGING_PATH
+
+
+def checkimage_file_names(sextractor_options: dict) -> List[Path]:
+    """Return the file names of the check images that SExtractor will write.
+
+    Args:
+        sextractor_options: SExtractor config options with uppercase keys.
+
+    Returns:
+        List of check image file names (empty if CHECKIMAGE_TYPE is NONE).
+    """
+    check_types = str(sextractor_options.get("CHECKIMAGE_TYPE", "NONE")).upper()
+    if check_types == "NONE" or "CHECKIMAGE_NAME" not in sextractor_options:
+        return []
+    return [
+        Path(n.strip()) for n in str(sextractor_options["CHECKIMAGE_NAME"]).split(",")
+    ]
+
+
+def read_checkimage(
+    file_name: PathLike, memmap: bool = False, out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """Read the pixels of a check image written by SExtractor.
+
+    Note:
+        With memmap=True, the returned array is a copy-on-write memory map of the
+        file, so the file must be kept for as long as the array is used. With
+        out, the pixels are converted and copied into the given array, which
+        lets pipelines that process many frames of the same shape reuse one
+        buffer instead of allocating a new array per frame.
+
+    Args:
+        file_name: Check image fits file.
+        memmap: If True, return a memory map of the file instead of a copy.
+        out: Optional array to read the pixels into. Must have the shape of
+            the check image.
+
+    Returns:
+        The check image pixels (out, if it was given).
+    """
+    with fits.open(file_name, memmap=memmap or out is not None) as hdul:
+        hdu = next((h for h in hdul if h.data is not None), hdul[0])
+        data = hdu.data
+        if out is not None:
+            if out.shape != data.shape:
+                raise errors.SEWError(
+                    f"out has shape {out.shape} but check image {file_name} "
+                    f"has shape {data.shape}"
+                )
+            np.copyto(out, data, casting="unsafe")
+            return out
+        if not memmap:
+            data = np.array(data)
+    return data
+
+
+def _write_staged_fits_file(
+    hdul: fits.HDUList,
+    label: str,
+    tmp_path: PathLike = "/tmp",
+    staging: StagingModes = "disk",
+) -> Path:
+    """Write a temporary fits file to tmp_path or to a RAM-backed directory."""
+    nbytes = sum(hdu.data.nbytes for hdu in hdul if hdu.data is not None)
+    fits_file_path = Path(tmp_path) / f"se_temp{label}.fits"
+    if staging == "memory":
+        ram_path = get_ram_staging_path(nbytes + 2880 * 10 * len(hdul))
+        if ram_path is None:
+            logger.debug("Image does not fit in memory -> staging it to disk")
+        else:
+            fd, name = tempfile.mkstemp(
+                prefix=f"se_temp{label}_", suffix=".fits", dir=ram_path
+            )
+            os.close(fd)
+            fits_file_path = Path(name)
+    elif staging != "disk":
+        raise errors.SEWError(f"{staging} is not a valid staging mode")
+    logger.debug("Writing temporary fits file %s", fits_file_path)
+    try:
+        hdul.writeto(fits_file_path, overwrite=True)
+    except OSError:
+        if fits_file_path.parent == Path(tmp_path):
+            raise
+        logger.debug("RAM-backed staging failed -> staging image to disk")
+        fits_file_path.unlink()
+        fits_file_path = Path(tmp_path) / f"se_temp{label}.fits"
+        hdul.writeto(fits_file_path, overwrite=True)
+    return fits_file_path
 
 
 def create_temp_fits_file_if_necessary(
@@ -28,6 +170,7 @@ def create_temp_fits_file_if_necessary(
     header: Optional[fits.Header] = None,
     run_label: Optional[str] = None,
     tmp_path: PathLike = "/tmp",
+    staging: StagingModes = "disk",
 ) -> Tuple[Path, bool]:
     """Helper function for optionally writing fits files for input to SExtractor.
 
@@ -42,6 +185,10 @@ def create_temp_fits_file_if_necessary(
         header: Astropy fits header object. If not None, this header will take precedent.
         run_label: Unique file label for this function call (useful when running in parallel).
         tmp_path: Temporary path for files created by SExtractor. Defaults to "/tmp".
+        staging: Where to write temporary fits files. If "disk", the file is written to
+            tmp_path. If "memory", the file is written to a uniquely named file in a
+            RAM-backed directory (see get_ram_staging_path), falling back to tmp_path
+            when the image does not fit in memory.
 
     Returns:
         Path object pointing to the fits file that contains the pixels and a boolean
@@ -49,24 +196,101 @@ def create_temp_fits_file_if_necessary(
     """
     is_path = isinstance(path_or_pixels, (Path, str, np.str_))
     if is_path and header is None:
-        created_temp_file = False
-        fits_file_path = Path(str(path_or_pixels))
+        return Path(str(path_or_pixels)), False
+
+    pixels: np.ndarray
+    if is_path:
+        pixels = fits.getdata(path_or_pixels)
+    elif isinstance(path_or_pixels, np.ndarray):
+        pixels = path_or_pixels
     else:
-        pixels: np.ndarray
-        created_temp_file = True
-        if is_path:
-            pixels = fits.getdata(path_or_pixels)
-        elif isinstance(path_or_pixels, np.ndarray):
-            pixels = path_or_pixels
-        else:
-            raise errors.InvalidPathOrPixels(
-                f"{type(path_or_pixels)} is not a valid path / numpy array"
-            )
-        label = "" if run_label is None else "_" + run_label
-        fits_file_path = Path(tmp_path) / f"se_temp{label}.fits"
-        logger.debug(f"Writing temporary fits file {fits_file_path}")
-        fits.writeto(fits_file_path, pixels, header=header, overwrite=True)
-    return fits_file_path, created_temp_file
+        raise errors.InvalidPathOrPixels(
+            f"{type(path_or_pixels)} is not a valid path / numpy array"
+        )
+    label = "" if run_label is None else "_" + run_label
+    hdul = fits.HDUList([fits.PrimaryHDU(pixels, header=header)])
+    return _write_staged_fits_file(hdul, label, tmp_path, staging), True
+
+
+def create_temp_mef_file_if_necessary(
+    path_or_pixels: MEFPathOrPixels,
+    headers: Optional[Sequence[Optional[fits.Header]]] = None,
+    run_label: Optional[str] = None,
+    tmp_path: PathLike = "/tmp",
+    staging: StagingModes = "disk",
+) -> Tuple[Path, bool]:
+    """Helper function for optionally writing multi-extension fits files.
+
+    Note:
+        A 3-D array or a list of 2-D arrays is written as a single multi-extension
+        fits file with an empty primary HDU and one image extension per plane, so
+        that SExtractor can process all of them in one run. A path is simply
+        returned and no temporary file is created.
+
+    Args:
+        path_or_pixels: Path to a multi-extension fits file, a 3-D numpy array, or
+            a list of 2-D numpy arrays.
+        headers: Astropy fits header objects, one per plane. Use the EXTNAME keyword
+            to name the extensions.
+        run_label: Unique file label for this function call (useful when running in parallel).
+        tmp_path: Temporary path for files created by SExtractor. Defaults to "/tmp".
+        staging: Where to write temporary fits files (see create_temp_fits_file_if_necessary).
+
+    Returns:
+        Path object pointing to the fits file that contains the pixels and a boolean
+        that is True if a temporary file was created.
+    """
+    if isinstance(path_or_pixels, (Path, str, np.str_)):
+        if headers is not None:
+            raise errors.SEWError("headers can only be given with pixels")
+        return Path(str(path_or_pixels)), False
+
+    if isinstance(path_or_pixels, np.ndarray) and path_or_pixels.ndim == 3:
+        planes = list(path_or_pixels)
+    elif isinstance(path_or_pixels, (list, tuple)) and all(
+        isinstance(p, np.ndarray) and p.ndim == 2 for p in path_or_pixels
+    ):
+        planes = list(path_or_pixels)
+    else:
+        raise errors.InvalidPathOrPixels(
+            "multi-extension input must be a path, a 3-D numpy array, "
+            "or a list of 2-D numpy arrays"
+        )
+    if headers is None:
+        headers = [None] * len(planes)
+    if len(headers) != len(planes):
+        raise errors.SEWError("there must be one header per image plane")
+
+    label = "" if run_label is None else "_" + run_label
+    hdul = fits.HDUList(
+        [fits.PrimaryHDU()]
+        + [fits.ImageHDU(p, header=h) for p, h in zip(planes, headers)]
+    )
+    return _write_staged_fits_file(hdul, label, tmp_path, staging), True
+
+
+def image_extension_names(file_name: PathLike) -> List[str]:
+    """Return the names of the image HDUs that SExtractor will process.
+
+    Note:
+        SExtractor processes every HDU with 2-D image data, in file order. Each
+        one is named after its EXTNAME keyword, or after its HDU index if it has
+        no EXTNAME (e.g., "0" for a primary image).
+
+    Args:
+        file_name: Fits file.
+
+    Returns:
+        The unique names of the image HDUs.
+    """
+    names = []
+    with fits.open(file_name) as hdul:
+        for i, hdu in enumerate(hdul):
+            if hdu.is_image and hdu.header.get("NAXIS", 0) == 2:
+                names.append(str(hdu.header.get("EXTNAME", i)).strip())
+    if len(set(names)) < len(names):
+        raise errors.SEWError(f"the image HDUs of {file_name} do not have unique names")
+    return names
 
 
 def is_list_like(check: Any) -> bool:
@@ -0,0 +1,108 @@
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+import pytest
+
+import sew
+from sew import aio
+
+
+def test_arun_matches_run(dwarf_path, dwarf_pixels):
+    """Test concurrent async runs give the same catalogs as sextractor.run."""
+
+    async def main():
+        return await asyncio.gather(sew.arun(dwarf_path), sew.arun(dwarf_pixels))
+
+    cats = asyncio.run(main())
+    assert len(cats[0]) == len(cats[1]) == len(sew.run(dwarf_pixels))
+
+
+def test_acreate_sextractor_object_mask(dwarf_path):
+    """Test the async object mask matches the synchronous helper."""
+    mask = asyncio.run(aio.acreate_sextractor_object_mask(dwarf_path, dilate_npix=3))
+    expected = sew.segmentation.create_sextractor_object_mask(dwarf_path, dilate_npix=3)
+    assert np.array_equal(mask, expected)
+
+
+def test_arun_cancel_kills_process(dwarf_pixels, monkeypatch, tmp_path):
+    """Test cancelling arun kills SExtractor and deletes the temporary files."""
+    monkeypatch.setattr(aio, "_build_command", lambda *args: ["sleep", "30"])
+
+    async def main():
+        task = asyncio.ensure_future(sew.arun(dwarf_pixels, tmp_path=tmp_path))
+        await asyncio.sleep(0.5)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            return True
+        return False
+
+    start = time.time()
+    assert asyncio.run(main())
+    assert time.time() - start < 10
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_arun_cancel_during_staging(dwarf_pixels, monkeypatch, tmp_path):
+    """Test a file staged after arun was cancelled is still deleted."""
+    staged_file = tmp_path / "staged.fits"
+
+    def _slow_staging(path_or_pixels, **kwargs):
+        time.sleep(0.5)
+        staged_file.write_bytes(b"")
+        return staged_file, True
+
+    monkeypatch.setattr(aio.utils, "create_temp_fits_file_if_necessary", _slow_staging)
+
+    async def main():
+        task = asyncio.ensure_future(sew.arun(dwarf_pixels, tmp_path=tmp_path))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            return True
+        return False
+
+    assert asyncio.run(main())
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_arun_timeout_keeps_stderr(dwarf_pixels, monkeypatch):
+    """Test the timeout error has the stderr of the killed run."""
+    code = "import sys, time; sys.stderr.write('stuck\\n'); sys.stderr.flush(); time.sleep(30)"
+    monkeypatch.setattr(
+        aio, "_build_command", lambda *args: [sys.executable, "-c", code]
+    )
+    with pytest.raises(sew.errors.SourceExtractorTimeoutError) as excinfo:
+        asyncio.run(sew.arun(dwarf_pixels, timeout=2))
+    assert "stuck" in excinfo.value.stderr
+
+
+def test_arun_limits_concurrent_staging(dwarf_path, monkeypatch):
+    """Test the images of waiting runs are not staged."""
+    active = []
+    max_active = []
+
+    def _slow_staging(path_or_pixels, **kwargs):
+        active.append(1)
+        max_active.append(len(active))
+        time.sleep(0.2)
+        active.pop()
+        return path_or_pixels, False
+
+    monkeypatch.setattr(aio.utils, "create_temp_fits_file_if_necessary", _slow_staging)
+    aio.set_max_concurrency(1)
+    try:
+
+        async def main():
+            return await asyncio.gather(*[sew.arun(dwarf_path) for _ in range(3)])
+
+        assert len(asyncio.run(main())) == 3
+    finally:
+        aio.set_max_concurrency(os.cpu_count() or 1)
+    assert max(max_active) == 1
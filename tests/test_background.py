@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from sew import background, capabilities, segmentation
+from sew.errors import SEWError
+
+
+def _has_real_sextractor() -> bool:
+    try:
+        return "fake" not in capabilities.get_capabilities()["version"]
+    except SEWError:
+        return False
+
+
+@pytest.fixture
+def sky_image():
+    """Noisy sky with a gradient and a few bright sources."""
+    rng = np.random.default_rng(42)
+    yy, xx = np.mgrid[:500, :430]
+    sky = 100 + 0.02 * xx + 0.01 * yy
+    image = sky + rng.normal(0, 5, sky.shape)
+    for x, y in rng.uniform(20, 410, (30, 2)):
+        image += 2000 * np.exp(-((xx - x) ** 2 + (yy - y) ** 2) / 8)
+    return image.astype(np.float32), sky
+
+
+def test_create_sky_model(sky_image):
+    image, sky = sky_image
+    sky_model = background.create_sky_model(image, back_size=64, back_filtersize=3)
+    assert sky_model.shape == image.shape
+    assert sky_model.dtype == np.float32
+    assert np.abs(sky_model - sky).max() < 1.5
+
+
+@pytest.mark.skipif(not _has_real_sextractor(), reason="needs the real SExtractor")
+def test_create_sky_model_matches_sextractor(sky_image, tmp_path):
+    """Test the sky model is within the documented tolerance of SExtractor's."""
+    image, _ = sky_image
+    sky_model = background.create_sky_model(image, back_size=64, back_filtersize=3)
+    se_sky_model = segmentation.create_sextractor_sky_model(
+        image,
+        tmp_path=tmp_path,
+        BACK_TYPE="AUTO",
+        BACK_SIZE=64,
+        BACK_FILTERSIZE=3,
+        BACK_FILTERTHRESH=0,
+    )
+    difference = (sky_model - se_sky_model) / 5
+    assert np.abs(difference).max() < 0.2
+    assert np.sqrt(np.mean(difference**2)) < 0.05
+
+
+def test_mesh_grid_and_mask(sky_image):
+    image, _ = sky_image
+    meshes = background.measure_background_meshes(image, back_size=(64, 32))
+    assert meshes.level.shape == meshes.rms.shape == (16, 7)
+    assert np.allclose(meshes.rms, 5, rtol=0.1)
+
+    # fully masked meshes are replaced by their neighbors
+    mask = np.zeros(image.shape, dtype=bool)
+    mask[:100, :100] = True
+    masked = background.measure_background_meshes(image, mask, back_filtersize=1)
+    assert np.isfinite(masked.level).all()
+
+    with pytest.raises(SEWError):
+        background.measure_background_meshes(image, np.ones(image.shape, dtype=bool))
+
+
+def test_sky_model_is_independent_of_threads(sky_image):
+    image, _ = sky_image
+    out = np.empty(image.shape, dtype=np.float32)
+    single = background.create_sky_model(image, max_workers=1)
+    multi = background.create_sky_model(image, max_workers=4, out=out)
+    assert multi is out
+    np.testing.assert_array_equal(single, multi)
@@ -0,0 +1,21 @@
+import numpy as np
+
+import sew
+
+
+def test_run_many_input_order(dwarf_path, dwarf_pixels):
+    """Test run_many returns one catalog per input in input order."""
+    inputs = [dwarf_path, dwarf_pixels, dwarf_pixels[:100, :100]]
+    cats = sew.run_many(inputs, max_workers=3)
+    assert len(cats) == len(inputs)
+    assert len(cats[0]) == len(cats[1]) == len(sew.run(dwarf_pixels))
+    assert len(cats[2]) < len(cats[1])
+
+
+def test_run_many_reports_failures(dwarf_pixels, tmp_path):
+    """Test a failed item does not stop the rest of the batch."""
+    inputs = [dwarf_pixels, np.ones((2, 2, 2, 2)).tolist(), dwarf_pixels]
+    cats = sew.run_many(inputs, max_workers=2, tmp_path=tmp_path)
+    assert isinstance(cats[1], sew.errors.SEWError)
+    assert len(cats[0]) == len(cats[2])
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,43 @@
+import numpy as np
+from astropy.io import fits
+
+import sew
+from sew.cache import ResultCache
+
+
+def test_cache_hit_skips_sextractor(dwarf_pixels, monkeypatch, tmp_path):
+    """Test a cache hit returns the catalog and check images without running SExtractor."""
+    cache = ResultCache(tmp_path / "cache")
+    bkg_file_name = tmp_path / "bkg.fits"
+    options = dict(CHECKIMAGE_TYPE="BACKGROUND", CHECKIMAGE_NAME=bkg_file_name)
+    cat = sew.run(dwarf_pixels, cache=cache, **options)
+    bkg = fits.getdata(bkg_file_name)
+    bkg_file_name.unlink()
+
+    def _run_process(*args, **kwargs):
+        raise AssertionError("SExtractor should not run on a cache hit")
+
+    monkeypatch.setattr(sew.sextractor, "run_process", _run_process)
+    cached_cat = sew.run(dwarf_pixels.copy(), cache=cache, **options)
+    assert len(cached_cat) == len(cat)
+    assert cached_cat.colnames == cat.colnames
+    assert np.allclose(fits.getdata(bkg_file_name), bkg)
+
+
+def test_cache_key_depends_on_inputs(dwarf_pixels, tmp_path):
+    """Test different pixels or options give different cache entries."""
+    cache = ResultCache(tmp_path)
+    sew.run(dwarf_pixels, cache=cache)
+    sew.run(dwarf_pixels, cache=cache, DETECT_THRESH=3)
+    sew.run(dwarf_pixels[:300], cache=cache)
+    assert len([p for p in tmp_path.iterdir() if p.is_dir()]) == 3
+    cache.clear()
+    assert cache.size == 0
+
+
+def test_cache_eviction(dwarf_pixels, tmp_path):
+    """Test the least recently used entries are evicted when the cache is full."""
+    cache = ResultCache(tmp_path, max_bytes=1)
+    sew.run(dwarf_pixels, cache=cache)
+    sew.run(dwarf_pixels, cache=cache, DETECT_THRESH=3)
+    assert len([p for p in tmp_path.iterdir() if p.is_dir()]) == 0
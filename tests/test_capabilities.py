@@ -0,0 +1,64 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import sew
+from sew import capabilities
+
+
+def test_import_without_se_executable():
+    """Test sew can be imported without the SE_EXECUTABLE env variable."""
+    env = {k: v for k, v in os.environ.items() if k != "SE_EXECUTABLE"}
+    code = "import sew; sew.segmentation.create_source_map"
+    subprocess.check_call([sys.executable, "-c", code], env=env)
+
+
+def test_import_is_lazy():
+    """Test importing sew does not import scipy or asyncio until they are used."""
+    code = (
+        "import sys, sew\n"
+        "assert 'scipy' not in sys.modules and 'asyncio' not in sys.modules\n"
+        "assert callable(sew.arun) and 'asyncio' in sys.modules\n"
+        "assert callable(sew.background.create_sky_model)\n"
+        "assert 'scipy' in sys.modules and 'jobs' in dir(sew)\n"
+    )
+    subprocess.check_call([sys.executable, "-c", code])
+
+
+def test_capabilities_cached_on_disk(monkeypatch, tmp_path):
+    """Test SExtractor is only probed once when the capabilities are cached on disk."""
+    monkeypatch.setattr(capabilities, "CACHE_PATH", tmp_path)
+    monkeypatch.setattr(capabilities, "_capabilities", {})
+    probe_calls = []
+
+    def _probe(executable):
+        probe_calls.append(executable)
+        return dict(
+            executable=executable, version="0", option_names=["A"], param_names=["B"]
+        )
+
+    monkeypatch.setattr(capabilities, "_probe", _probe)
+    assert capabilities.get_capabilities()["option_names"] == ["A"]
+    assert len(list(tmp_path.glob("capabilities-*.json"))) == 1
+
+    # a fresh process would only read the cache file
+    monkeypatch.setattr(capabilities, "_capabilities", {})
+    assert capabilities.get_capabilities()["param_names"] == ["B"]
+    assert len(probe_calls) == 1
+
+
+def test_option_names_are_lazy():
+    """Test the SExtractor option and parameter names behave like lists."""
+    assert "DETECT_THRESH" in sew.OPTION_NAMES
+    assert "X_IMAGE" in sew.PARAM_NAMES
+    assert len(sew.OPTION_NAMES) == len(list(sew.OPTION_NAMES))
+
+
+def test_probe_failure_raises_sew_error(tmp_path):
+    """Test a failing parameter probe raises SourceExtractorExecutableError."""
+    script = tmp_path / "broken_sextractor.py"
+    script.write_text("import sys\nsys.exit(1 if sys.argv[-1] == '-dp' else 0)\n")
+    with pytest.raises(sew.errors.SourceExtractorExecutableError):
+        capabilities._probe(f"{sys.executable} {script}")
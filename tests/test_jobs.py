@@ -0,0 +1,87 @@
+import io
+import json
+import logging
+import shutil
+
+import numpy as np
+
+import sew
+from sew.jobs import JobManifest, load_checkpoint, read_job_output, run_job
+
+
+def test_job_resumes_from_checkpoint(dwarf_path, tmp_path):
+    """Test a job skips done inputs and reprocesses changed or missing outputs."""
+    inputs = [tmp_path / f"frame_{i}.fits" for i in range(3)]
+    for fn in inputs:
+        shutil.copy(dwarf_path, fn)
+    manifest = JobManifest(inputs, products="catalog,OBJECTS")
+    output_path = tmp_path / "output"
+    result = run_job(manifest, output_path, max_workers=2)
+    assert len(result.outputs) == 3 and result.skipped == []
+    products = read_job_output(result.outputs[str(inputs[0])])
+    assert len(products["CATALOG"]) == len(sew.run(dwarf_path))
+    assert products["OBJECTS"].dtype == np.uint8
+    assert list(output_path.rglob("*.part")) == []
+
+    result.outputs[str(inputs[1])].unlink()
+    result = run_job(manifest, output_path, max_workers=2)
+    assert sorted(result.skipped) == [str(inputs[0]), str(inputs[2])]
+    assert result.outputs[str(inputs[1])].is_file()
+
+    manifest.options["DETECT_THRESH"] = 10
+    result = run_job(manifest, output_path, max_workers=2)
+    assert result.skipped == []
+    assert len(load_checkpoint(output_path / "checkpoint.jsonl")) == 3
+
+
+def test_job_records_failures(dwarf_path, tmp_path):
+    """Test failed inputs are recorded in the checkpoint and retried."""
+    bad_file = tmp_path / "bad.fits"
+    bad_file.write_text("not a fits file")
+    manifest_file = tmp_path / "manifest.txt"
+    manifest_file.write_text(f"# nightly\n{dwarf_path}\n\n{bad_file}\n")
+    result = run_job(manifest_file, tmp_path / "output", max_workers=2)
+    assert list(result.outputs) == [str(dwarf_path)]
+    assert list(result.failed) == [str(bad_file)]
+    checkpoint = load_checkpoint(tmp_path / "output" / "checkpoint.jsonl")
+    assert checkpoint[str(bad_file)]["status"] == "failed"
+    with open(tmp_path / "output" / "checkpoint.jsonl", "a") as f:
+        f.write('{"input": "crashed')
+
+    JobManifest.from_file(manifest_file).to_file(tmp_path / "manifest.json")
+    assert json.loads((tmp_path / "manifest.json").read_text())["products"] == [
+        "catalog"
+    ]
+    result = run_job(tmp_path / "manifest.json", tmp_path / "output")
+    assert result.skipped == [str(dwarf_path)]
+    assert list(result.failed) == [str(bad_file)]
+
+
+def test_job_forwards_worker_logs(dwarf_path, tmp_path):
+    """Test the records of the worker processes reach the production log handler."""
+    stream = io.StringIO()
+    sew.set_log_level("DEBUG")
+    sew.enable_production_logging(logging.StreamHandler(stream))
+    try:
+        result = run_job(JobManifest([dwarf_path]), tmp_path / "output", max_workers=1)
+    finally:
+        sew.disable_production_logging()
+        sew.set_log_level("INFO")
+    assert list(result.outputs) == [str(dwarf_path)]
+    entries = [json.loads(line) for line in stream.getvalue().splitlines()]
+    commands = [e for e in entries if e["message"].startswith(">> ")]
+    assert len(commands) == 1
+    assert commands[0]["run_label"] == "0"
+
+
+def test_job_reprocesses_inputs_when_a_filter_file_changes(dwarf_path, tmp_path):
+    """Test file-valued options are hashed by the contents of the files."""
+    filter_file = tmp_path / "filter.conv"
+    filter_file.write_text("CONV NORM\n1 2 1\n2 4 2\n1 2 1\n")
+    manifest = JobManifest([dwarf_path], options=dict(FILTER_NAME=str(filter_file)))
+    output_path = tmp_path / "output"
+    run_job(manifest, output_path, max_workers=1)
+    assert run_job(manifest, output_path, max_workers=1).skipped == [str(dwarf_path)]
+
+    filter_file.write_text("CONV NORM\n# flat\n1 1 1\n1 1 1\n1 1 1\n")
+    assert run_job(manifest, output_path, max_workers=1).skipped == []
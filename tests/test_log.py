@@ -0,0 +1,68 @@
+import io
+import json
+import logging
+
+import pytest
+
+import sew
+from sew.log import load_logger
+
+
+@pytest.fixture
+def debug_logger():
+    logger = sew.set_log_level("DEBUG")
+    yield logger
+    sew.disable_production_logging()
+    sew.set_log_level("INFO")
+
+
+def test_capture_logs_with_run_label(dwarf_pixels, debug_logger):
+    """Test the records of a run are captured and tagged with its run_label."""
+    with sew.capture_logs() as records:
+        sew.run(dwarf_pixels, run_label="dwarf")
+    commands = [r for r in records if r.getMessage().startswith(">> ")]
+    assert len(commands) == 1
+    assert all(r.run_label == "dwarf" for r in records)
+
+    with sew.capture_logs() as records:
+        sew.run_many([dwarf_pixels] * 2, max_workers=2)
+    commands = [r for r in records if r.getMessage().startswith(">> ")]
+    assert sorted(r.run_label for r in commands) == ["0", "1"]
+
+
+def test_production_logging_writes_json(debug_logger):
+    """Test records are written as json by the queue listener with their context."""
+    stream = io.StringIO()
+    listener = sew.enable_production_logging(logging.StreamHandler(stream))
+    assert listener is not None
+    with sew.log_context(run_label="frame_1", field="A"):
+        debug_logger.info("measured %s sources", 42)
+    sew.disable_production_logging()
+    entries = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert len(entries) == 1
+    assert entries[0]["message"] == "measured 42 sources"
+    assert entries[0]["run_label"] == "frame_1"
+    assert entries[0]["field"] == "A"
+    assert debug_logger.handlers == [debug_logger.sh]
+
+
+def test_production_logging_writes_exceptions(debug_logger):
+    """Test the traceback of a logged exception is written by the listener."""
+    stream = io.StringIO()
+    sew.enable_production_logging(logging.StreamHandler(stream))
+    try:
+        raise ValueError("bad pixel")
+    except ValueError:
+        debug_logger.exception("run failed")
+    sew.disable_production_logging()
+    entry = json.loads(stream.getvalue())
+    assert entry["message"] == "run failed"
+    assert "ValueError: bad pixel" in entry["exception"]
+
+
+def test_load_logger_keeps_handlers(debug_logger):
+    """Test loading the logger again keeps its handlers and level."""
+    handlers = list(debug_logger.handlers)
+    logger = load_logger()
+    assert logger.handlers == handlers
+    assert logger.level == logging.DEBUG
@@ -0,0 +1,30 @@
+import numpy as np
+from astropy.io import fits
+
+import sew
+
+
+def test_run_mef_from_pixels(dwarf_pixels):
+    """Test a list of arrays is staged as one MEF and split by EXTNAME."""
+    headers = [fits.Header(dict(EXTNAME=name)) for name in ["CCD1", "CCD2"]]
+    cats = sew.mef.run_mef([dwarf_pixels, dwarf_pixels * 0.5], headers=headers)
+    assert list(cats) == ["CCD1", "CCD2"]
+    assert len(cats["CCD1"]) == len(sew.run(dwarf_pixels))
+
+    cube_cats = sew.mef.run_mef(np.stack([dwarf_pixels, dwarf_pixels]))
+    assert list(cube_cats) == ["1", "2"]
+    assert len(cube_cats["1"]) == len(cube_cats["2"]) == len(cats["CCD1"])
+
+
+def test_run_mef_from_path(dwarf_pixels, tmp_path):
+    """Test a MEF file is passed through in a single SExtractor run."""
+    mef_path = tmp_path / "mef.fits"
+    hdus = [fits.PrimaryHDU()]
+    for name in ["A", "B", "C"]:
+        hdus.append(fits.ImageHDU(dwarf_pixels, name=name))
+    fits.HDUList(hdus).writeto(mef_path)
+    report = sew.RunReport()
+    cats = sew.mef.run_mef(mef_path, report=report, CATALOG_TYPE="FITS_1.0")
+    assert list(cats) == ["A", "B", "C"]
+    assert str(mef_path) in report.command
+    assert report.num_rows == 3 * len(cats["A"])
@@ -0,0 +1,15 @@
+import numpy as np
+
+import sew
+
+
+def test_run_dual_image_aligned(dwarf_pixels):
+    """Test dual-image catalogs are aligned row by row with the detection catalog."""
+    faint = dwarf_pixels * 0.5
+    cats = sew.multiband.run_dual_image(
+        dwarf_pixels, [dwarf_pixels, faint], max_workers=2
+    )
+    assert len(cats) == 2
+    assert len(cats[0]) == len(cats[1]) == len(sew.run(dwarf_pixels))
+    assert np.allclose(cats[0]["X_IMAGE"], cats[1]["X_IMAGE"])
+    assert np.all(cats[1]["FLUX_AUTO"] < cats[0]["FLUX_AUTO"])
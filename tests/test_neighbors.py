@@ -0,0 +1,46 @@
+import numpy as np
+from astropy.table import Table
+
+from sew.neighbors import find_close_pairs, find_groups
+
+
+def _catalog():
+    return Table(
+        dict(
+            X_IMAGE=[10.0, 13.0, 100.0, 200.0, 203.0, 206.0, 50.0],
+            Y_IMAGE=[10.0, 14.0, 100.0, 200.0, 200.0, 200.0, 50.0],
+            FLUX_AUTO=[100.0, 80.0, 500.0, 300.0, 30.0, 20.0, 1.0],
+        )
+    )
+
+
+def test_find_close_pairs():
+    """Test close pairs with flux-ratio cuts and brightest-source truncation."""
+    catalog = _catalog()
+    pairs = find_close_pairs(catalog, 5.5)
+    assert [tuple(p) for p in pairs["INDEX_1", "INDEX_2"]] == [
+        (3, 4),
+        (0, 1),
+        (4, 5),
+    ]
+    assert np.allclose(pairs["SEPARATION"], [3, 5, 3])
+    assert np.allclose(pairs["FLUX_RATIO"], [0.1, 0.8, 20 / 30])
+
+    pairs = find_close_pairs(catalog, 5.5, min_flux_ratio=0.5)
+    assert list(pairs["INDEX_1"]) == [0, 4]
+    pairs = find_close_pairs(catalog, 5.5, max_num_sources=4)
+    assert list(pairs["INDEX_1"]) == [0]
+
+
+def test_find_groups():
+    """Test friends-of-friends groups of linked sources."""
+    catalog = _catalog()
+    groups = find_groups(catalog, 5.5)
+    assert groups[0] == groups[1]
+    assert groups[3] == groups[4] == groups[5]
+    assert len(np.unique(groups)) == 4
+    groups = find_groups(catalog, 5.5, max_num_sources=5)
+    assert groups[5] == groups[6] == -1
+    assert groups[3] == groups[4]
+    groups = find_groups(catalog, 5.5, min_flux_ratio=0.5)
+    assert groups[3] != groups[4] == groups[5]
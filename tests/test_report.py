@@ -0,0 +1,90 @@
+import pytest
+
+import sew
+from sew.report import RunReport
+
+
+def test_run_report(dwarf_pixels, tmp_path):
+    """Test sextractor.run fills in the report."""
+    report = RunReport()
+    cat = sew.run(dwarf_pixels, run_label="report", tmp_path=tmp_path, report=report)
+    assert report.run_label == "report"
+    assert report.num_rows == len(cat)
+    assert report.returncode == 0
+    assert "-CATALOG_NAME" in report.command
+    assert report.scratch_bytes_written > dwarf_pixels.nbytes
+    assert set(report.stage_seconds) == {
+        "setup",
+        "stage",
+        "sextractor",
+        "parse",
+        "cleanup",
+    }
+    assert report.total_seconds >= report.stage_seconds["sextractor"] > 0
+    if report.child_max_rss_bytes is not None:
+        assert report.child_max_rss_bytes > 0
+        assert report.child_user_seconds + report.child_system_seconds > 0
+    assert report.to_dict()["num_rows"] == len(cat)
+
+
+def test_report_hook(dwarf_path):
+    """Test hooks receive the reports of runs and of the segmentation helpers."""
+    reports = []
+    stages = []
+
+    def _hook(report):
+        reports.append(report)
+        stages.append(set(report.stage_seconds))
+
+    sew.add_report_hook(_hook)
+    try:
+        sew.run(dwarf_path)
+        sew.segmentation.create_sextractor_sky_model(dwarf_path)
+        sew.segmentation.create_sextractor_object_mask(dwarf_path)
+        sew.segmentation.create_sextractor_products(dwarf_path)
+    finally:
+        sew.remove_report_hook(_hook)
+    sew.run(dwarf_path)
+    assert len(reports) == 4
+    assert all(r.num_rows > 0 for r in reports)
+    # the helpers emit their report once, after the check images are read
+    assert "checkimage" not in stages[0]
+    assert all("checkimage" in s for s in stages[1:])
+
+
+def test_failing_report_hook_is_ignored(dwarf_path):
+    """Test an exception in a hook does not break the run."""
+
+    def _hook(report):
+        raise RuntimeError("metrics system is down")
+
+    sew.add_report_hook(_hook)
+    try:
+        cat = sew.run(dwarf_path)
+    finally:
+        sew.remove_report_hook(_hook)
+    assert len(cat) > 0
+
+
+def test_report_hook_sees_failed_runs(tmp_path):
+    """Test hooks receive the reports of failed runs, marked as failed."""
+    reports = []
+    sew.add_report_hook(reports.append)
+    try:
+        with pytest.raises(sew.errors.SourceExtractorRunError):
+            sew.run(tmp_path / "missing.fits", tmp_path=tmp_path)
+        with pytest.raises(sew.errors.SourceExtractorRunError):
+            sew.segmentation.create_sextractor_sky_model(
+                tmp_path / "missing.fits", tmp_path=tmp_path
+            )
+    finally:
+        sew.remove_report_hook(reports.append)
+    assert len(reports) == 2
+    for report in reports:
+        assert report.failed
+        assert report.error.startswith("SourceExtractorRunError")
+        assert report.returncode != 0
+        assert "missing.fits" in report.stderr
+        assert report.num_rows is None
+        assert report.stage_seconds["sextractor"] > 0
+        assert report.to_dict()["error"] == report.error
@@ -1,5 +1,10 @@
+import mmap
+
 import numpy as np
+import pytest
 from astropy.io import fits
+from astropy.table import Table
+from scipy import ndimage
 
 import sew
 
@@ -19,3 +24,163 @@ def test_create_sextractor_object_mask_mask_file(dwarf_path, tmp_path):
     )
     assert mask_file_name.is_file()
     assert np.allclose(mask.astype(int), (fits.getdata(mask_file_name) > 0).astype(int))
+
+
+def test_create_sextractor_products(dwarf_path):
+    """Test a single SExtractor run returns the same products as the separate helpers."""
+    products = sew.segmentation.create_sextractor_products(
+        dwarf_path, ["catalog", "BACKGROUND", "OBJECTS"], dilate_npix=3
+    )
+    assert len(products["catalog"]) == len(sew.run(dwarf_path))
+    sky = sew.segmentation.create_sextractor_sky_model(dwarf_path)
+    assert np.allclose(products["BACKGROUND"], sky)
+    mask = sew.segmentation.create_sextractor_object_mask(dwarf_path, dilate_npix=3)
+    assert np.array_equal(products["OBJECTS"], mask)
+
+    options = [
+        dict(dilate_npix=5, dilate_method="disk"),
+        dict(dilate_npix=3, dilate_scale=3.0),
+    ]
+    for dilate_options in options:
+        products = sew.segmentation.create_sextractor_products(
+            dwarf_path, "catalog,OBJECTS", **dilate_options
+        )
+        mask = sew.segmentation.create_sextractor_object_mask(
+            dwarf_path, **dilate_options
+        )
+        assert np.array_equal(products["OBJECTS"], mask)
+
+
+def test_create_sextractor_products_cleans_up(dwarf_path, tmp_path):
+    """Test the temporary check images are removed when reading them fails."""
+    with pytest.raises(sew.errors.SEWError):
+        sew.segmentation.create_sextractor_products(
+            dwarf_path, "BACKGROUND,OBJECTS", tmp_path=tmp_path, dilate_method="cross"
+        )
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_helpers_clean_up_after_failed_runs(dwarf_path, tmp_path, monkeypatch):
+    """Test the temporary check images are removed when SExtractor fails."""
+    run = sew.sextractor.run
+
+    def _failing_run(*args, **kwargs):
+        run(*args, **kwargs)
+        raise sew.errors.SourceExtractorRunError("SExtractor failed", 1, "")
+
+    monkeypatch.setattr(sew.sextractor, "run", _failing_run)
+    helpers = [
+        sew.segmentation.create_sextractor_object_mask,
+        sew.segmentation.create_sextractor_sky_model,
+        sew.segmentation.create_sextractor_products,
+    ]
+    for helper in helpers:
+        with pytest.raises(sew.errors.SourceExtractorRunError):
+            helper(dwarf_path, tmp_path=tmp_path)
+        assert list(tmp_path.iterdir()) == []
+
+
+def test_create_source_map_formats():
+    catalog = Table(
+        dict(
+            X_IMAGE=[3.2, 10.7, 18.0, 10.9],
+            Y_IMAGE=[5.0, 2.5, 20.0, 2.1],
+            FLUX_AUTO=[10.0, 30.0, 1.0, 20.0],
+            A_IMAGE=[1.0, 2.0, 1.0, 1.0],
+            B_IMAGE=[1.0, 1.0, 1.0, 1.0],
+            THETA_IMAGE=[0.0, 45.0, 0.0, 0.0],
+        )
+    )
+    shape = (21, 19)
+    expected = sew.segmentation.create_source_map(catalog, shape, max_num_sources=3)
+    assert expected.dtype == float
+    assert expected.sum() == 2  # two of the three brightest share a pixel
+    assert expected[19, 17] == 0
+
+    for output in ["bool", "uint8"]:
+        source_map = sew.segmentation.create_source_map(
+            catalog, shape, 3, output=output
+        )
+        assert source_map.dtype == output
+        np.testing.assert_array_equal(source_map, expected)
+    packed = sew.segmentation.create_source_map(catalog, shape, 3, output="packed")
+    np.testing.assert_array_equal(
+        np.unpackbits(packed, axis=1, count=shape[1]), expected
+    )
+    coo = sew.segmentation.create_source_map(catalog, shape, 3, output="coo")
+    np.testing.assert_array_equal(coo.toarray(), expected)
+
+    footprint = sew.segmentation.create_source_map(
+        catalog, shape, output="bool", footprint=True, footprint_scale=2
+    )
+    assert footprint[expected.astype(bool)].all()
+    assert footprint.sum() > 4 * np.pi
+    assert footprint[19, 17] and footprint[19, 15] and not footprint[19, 14]
+
+
+def test_select_brightest():
+    flux = np.array([5.0, 1.0, 9.0, 3.0, 7.0])
+    np.testing.assert_array_equal(sew.segmentation.select_brightest(flux, 3), [2, 4, 0])
+    np.testing.assert_array_equal(
+        sew.segmentation.select_brightest(flux, 10), [2, 4, 0, 3, 1]
+    )
+
+
+def test_dilate_object_mask_matches_grey_dilation():
+    rng = np.random.default_rng(0)
+    image = rng.normal(size=(600, 300))
+    image[image < 2.5] = 0
+    for dilate_npix in [1, 4, 5]:
+        expected = ndimage.grey_dilation(image, (dilate_npix, dilate_npix)) > 0
+        mask = sew.segmentation.dilate_object_mask(image, dilate_npix, max_workers=2)
+        np.testing.assert_array_equal(mask, expected)
+    disk = sew.segmentation.dilate_object_mask(image, 5, "disk", max_workers=2)
+    assert (disk <= expected).all() and disk.sum() < expected.sum()
+
+
+def test_dilate_object_mask_small_disk():
+    """Test disks of 0 or 1 pixels leave the mask unchanged (like the square)."""
+    image = np.zeros((20, 20))
+    image[10, 10] = 1
+    for dilate_npix in [0, 1]:
+        for method in ["square", "disk"]:
+            mask = sew.segmentation.dilate_object_mask(image, dilate_npix, method)
+            np.testing.assert_array_equal(mask, image > 0)
+
+
+def test_create_sextractor_object_mask_dilate_scale(dwarf_path):
+    mask = sew.segmentation.create_sextractor_object_mask(dwarf_path, dilate_npix=0)
+    scaled = sew.segmentation.create_sextractor_object_mask(
+        dwarf_path, dilate_npix=3, dilate_scale=3.0
+    )
+    assert scaled.dtype == bool
+    assert scaled[mask].all()
+    assert scaled.sum() > mask.sum()
+
+
+def test_create_sextractor_sky_model_memmap_and_out(dwarf_path, tmp_path):
+    expected = sew.segmentation.create_sextractor_sky_model(dwarf_path)
+    sky_file_name = tmp_path / "sky.fits"
+    sky = sew.segmentation.create_sextractor_sky_model(
+        dwarf_path, sky_file_name=sky_file_name, memmap=True
+    )
+    base = sky
+    while isinstance(base, np.ndarray):
+        base = base.base
+    assert isinstance(base, mmap.mmap)
+    np.testing.assert_array_equal(sky, expected)
+
+    out = np.empty(expected.shape, dtype=np.float32)
+    sky = sew.segmentation.create_sextractor_sky_model(dwarf_path, out=out)
+    assert sky is out
+    np.testing.assert_array_equal(out, expected)
+
+    mask_out = np.empty(expected.shape, dtype=bool)
+    mask = sew.segmentation.create_sextractor_object_mask(
+        dwarf_path, dilate_npix=3, out=mask_out
+    )
+    assert mask is mask_out
+    expected_mask = sew.segmentation.create_sextractor_object_mask(
+        dwarf_path, dilate_npix=3
+    )
+    np.testing.assert_array_equal(mask, expected_mask)
@@ -0,0 +1,34 @@
+import pytest
+
+import sew
+
+
+def test_session_matches_run(dwarf_path, dwarf_pixels):
+    """Test a session gives the same catalogs as sextractor.run."""
+    extra_params = ["ISO0", "ISO1"]
+    with sew.Session(extra_params=extra_params, DETECT_THRESH=3) as session:
+        for path_or_pixels in [dwarf_path, dwarf_pixels]:
+            cat = session.run(path_or_pixels)
+            expected = sew.run(
+                path_or_pixels, extra_params=extra_params, DETECT_THRESH=3
+            )
+            assert cat.colnames == expected.colnames
+            assert len(cat) == len(expected)
+
+
+def test_session_per_call_options(dwarf_pixels):
+    """Test options given to Session.run only apply to that call."""
+    with sew.Session(DETECT_THRESH=1) as session:
+        n_sources = len(session.run(dwarf_pixels))
+        assert len(session.run(dwarf_pixels, DETECT_THRESH=1000)) < n_sources
+        assert len(session.run(dwarf_pixels)) == n_sources
+
+
+def test_session_cleanup(dwarf_pixels, tmp_path):
+    """Test the scratch directory is deleted when the session closes."""
+    with sew.Session(tmp_path=tmp_path, extra_params="ISO0") as session:
+        session.run(dwarf_pixels)
+        assert len(list(tmp_path.iterdir())) == 1
+    assert list(tmp_path.iterdir()) == []
+    with pytest.raises(sew.errors.SEWError):
+        session.run(dwarf_pixels)
@@ -1,4 +1,11 @@
+import time
+
+import numpy as np
+import pytest
+from astropy.table import vstack
+
 import sew
+from sew.process import ProcessResult, run_process
 
 
 def test_run_from_path(dwarf_path):
@@ -28,3 +35,92 @@ def test_run_add_extra_parameters(dwarf_pixels):
     assert len(cat.colnames) - n_params_initial == len(extra_params)
     for p in extra_params:
         assert p in cat.colnames
+
+
+def test_run_binary_catalog_matches_ascii(dwarf_pixels):
+    """Test binary FITS catalogs have the same columns and dtypes as ASCII catalogs."""
+    extra_params = ["FLUX_APER(3)"]
+    ascii_cat = sew.run(
+        dwarf_pixels, extra_params=extra_params, CATALOG_TYPE="ASCII_HEAD"
+    )
+    for catalog_type in ["FITS_LDAC", "FITS_1.0"]:
+        cat = sew.run(
+            dwarf_pixels, extra_params=extra_params, CATALOG_TYPE=catalog_type
+        )
+        assert cat.colnames == ascii_cat.colnames
+        assert len(cat) == len(ascii_cat)
+        for name in cat.colnames:
+            assert cat[name].dtype == ascii_cat[name].dtype
+
+
+def test_run_memory_staging(dwarf_pixels, monkeypatch, tmp_path):
+    """Test pixels staged in a RAM-backed directory give the same catalog."""
+    monkeypatch.setattr(sew.utils, "RAM_STAGING_PATH", tmp_path)
+    cat = sew.run(dwarf_pixels, staging="memory")
+    assert len(cat) == len(sew.run(dwarf_pixels))
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_run_failure_raises_with_stderr(tmp_path):
+    """Test a non-zero SExtractor exit raises an error that includes its stderr."""
+    with pytest.raises(sew.errors.SourceExtractorRunError) as excinfo:
+        sew.run(tmp_path / "missing.fits", tmp_path=tmp_path)
+    assert excinfo.value.returncode != 0
+    assert "missing.fits" in excinfo.value.stderr
+    assert "missing.fits" in str(excinfo.value)
+
+
+def test_run_timeout_kills_process(dwarf_pixels, monkeypatch, tmp_path):
+    """Test a timed-out run is killed and its temporary files are deleted."""
+    monkeypatch.setenv("FAKE_SEXTRACTOR_DELAY", "30")
+    start = time.time()
+    with pytest.raises(sew.errors.SourceExtractorTimeoutError):
+        sew.run(dwarf_pixels, tmp_path=tmp_path, timeout=1)
+    assert time.time() - start < 10
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_run_retries(dwarf_pixels, monkeypatch):
+    """Test failed runs are retried."""
+    calls = []
+
+    def _flaky_run_process(argv, timeout=None, stdout_callback=None):
+        calls.append(argv)
+        if len(calls) == 1:
+            return ProcessResult(1, "segmentation fault")
+        return run_process(argv, timeout, stdout_callback)
+
+    monkeypatch.setattr(sew.sextractor, "run_process", _flaky_run_process)
+    with pytest.raises(sew.errors.SourceExtractorRunError):
+        sew.run(dwarf_pixels)
+    calls.clear()
+    assert len(sew.run(dwarf_pixels, retries=1)) > 0
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize("catalog_type", ["FITS_LDAC", "FITS_1.0", "ASCII_HEAD"])
+def test_run_pipe_catalog(dwarf_pixels, catalog_type, tmp_path):
+    """Test the catalog read from SExtractor's stdout matches the catalog file."""
+    cat = sew.run(dwarf_pixels, CATALOG_TYPE=catalog_type)
+    piped = sew.run(
+        dwarf_pixels, CATALOG_TYPE=catalog_type, pipe_catalog=True, tmp_path=tmp_path
+    )
+    assert piped.colnames == cat.colnames
+    for name in cat.colnames:
+        assert piped[name].dtype == cat[name].dtype
+        assert np.allclose(piped[name], cat[name])
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_run_on_batch(dwarf_pixels):
+    """Test the catalog can be streamed to a callback in batches."""
+    cat = sew.run(dwarf_pixels)
+    batches = []
+    report = sew.RunReport()
+    empty = sew.run(dwarf_pixels, on_batch=batches.append, batch_rows=50, report=report)
+    assert len(empty) == 0 and empty.colnames == cat.colnames
+    assert [len(b) for b in batches[:-1]] == [50] * (len(batches) - 1)
+    assert np.allclose(vstack(batches)["X_IMAGE"], cat["X_IMAGE"])
+    assert report.num_rows == len(cat)
+    with pytest.raises(sew.errors.SEWError):
+        sew.run(dwarf_pixels, pipe_catalog=True, catalog_file_path="se.cat")
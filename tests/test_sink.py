@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+import sew
+from sew.sink import iter_sink, open_sink, read_sink
+
+
+@pytest.mark.parametrize("suffix, module", [(".parquet", "pyarrow"), (".h5", "h5py")])
+def test_sink_roundtrip(dwarf_pixels, tmp_path, suffix, module):
+    """Test catalogs streamed to a sink are read back with their source and label."""
+    pytest.importorskip(module)
+    cat = sew.run(dwarf_pixels, extra_params="FLUX_APER(2)")
+    file_name = tmp_path / f"catalogs{suffix}"
+    with open_sink(file_name, chunk_rows=100) as sink:
+        for i in range(3):
+            sink.write(cat, source=f"image_{i}.fits", run_label=str(i))
+    assert sink.num_rows == 3 * len(cat)
+
+    all_columns = read_sink(file_name)
+    assert all_columns.colnames == cat.colnames + ["SOURCE_IMAGE", "RUN_LABEL"]
+    assert np.allclose(all_columns["FLUX_APER_1"][: len(cat)], cat["FLUX_APER_1"])
+    assert all_columns["X_IMAGE"].unit == cat["X_IMAGE"].unit
+
+    selected = read_sink(file_name, columns=["FLUX_AUTO", "SOURCE_IMAGE"])
+    assert selected.colnames == ["FLUX_AUTO", "SOURCE_IMAGE"]
+    is_second = selected["SOURCE_IMAGE"] == "image_1.fits"
+    assert np.allclose(selected["FLUX_AUTO"][is_second], cat["FLUX_AUTO"])
+    assert all(len(chunk) <= 100 for chunk in iter_sink(file_name, ["X_IMAGE"], 100))
+
+
+def test_run_many_with_sink(dwarf_path, dwarf_pixels, tmp_path):
+    """Test run_many appends every catalog to the sink instead of returning it."""
+    pytest.importorskip("pyarrow")
+    file_name = tmp_path / "batch.parquet"
+    with open_sink(file_name) as sink:
+        num_rows = sew.run_many([dwarf_path, dwarf_pixels], max_workers=2, sink=sink)
+    assert num_rows == [len(sew.run(dwarf_path))] * 2
+    cat = read_sink(file_name, ["SOURCE_IMAGE", "RUN_LABEL"])
+    assert len(cat) == sum(num_rows)
+    assert set(cat["SOURCE_IMAGE"]) == {str(dwarf_path), "pixels[1]"}
+    assert set(cat["RUN_LABEL"]) == {"0", "1"}
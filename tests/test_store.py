@@ -0,0 +1,36 @@
+import os
+import time
+
+import numpy as np
+
+import sew
+from sew.store import StagingStore
+
+
+def test_weight_array_staged_once(dwarf_pixels, monkeypatch, tmp_path):
+    """Test array-valued WEIGHT_IMAGE options are written once and reused."""
+    store = StagingStore(tmp_path / "store")
+    monkeypatch.setattr(sew.store, "_default_store", store)
+    rms = np.full(dwarf_pixels.shape, 5.0, dtype=np.float32)
+    options = dict(WEIGHT_TYPE="MAP_RMS", WEIGHT_IMAGE=rms, THRESH_TYPE="ABSOLUTE")
+    cat = sew.run(dwarf_pixels, **options)
+    staged = list(store.path.glob("*.fits"))
+    assert len(staged) == 1
+    mtime = staged[0].stat().st_mtime_ns
+
+    cats = sew.run_many([dwarf_pixels] * 3, max_workers=3, **options)
+    assert all(len(c) == len(cat) for c in cats)
+    assert list(store.path.glob("*.fits")) == staged
+    assert staged[0].stat().st_mtime_ns == mtime
+
+
+def test_staging_store_garbage_collection(tmp_path):
+    """Test the least recently used files are deleted, but not recently used ones."""
+    store = StagingStore(tmp_path, max_bytes=0, min_age=60)
+    old = store.stage(np.zeros((10, 10)))
+    os.utime(old, (time.time() - 120, old.stat().st_mtime))
+    new = store.stage(np.ones((10, 10)))
+    assert not old.exists()
+    assert new.exists()
+    assert store.stage(np.ones((10, 10))) == new
+    assert store.stage_option_value([np.zeros(3) > 0, "b.fits"]).endswith(",b.fits")
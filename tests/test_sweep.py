@@ -0,0 +1,39 @@
+import pytest
+
+import sew
+
+
+def test_run_sweep_matches_run(dwarf_pixels):
+    """Test a sweep with a reused background approximates separate runs."""
+    grid = dict(DETECT_THRESH=[3, 10], DETECT_MINAREA=[5, 20])
+    result = sew.sweep.run_sweep(dwarf_pixels, grid, max_workers=2)
+    assert result.option_names == ["DETECT_THRESH", "DETECT_MINAREA"]
+    assert len(result) == 4
+    for thresh, minarea in result:
+        cat = sew.run(dwarf_pixels, DETECT_THRESH=thresh, DETECT_MINAREA=minarea)
+        # the background RMS of the subtracted image differs slightly
+        assert abs(len(result[thresh, minarea]) - len(cat)) <= 0.1 * len(cat) + 1
+    assert len(result[3, 5]) > len(result[10, 20])
+
+    summary = result.summary()
+    assert list(summary["NUM_SOURCES"]) == [
+        len(cat) for cat in result.catalogs.values()
+    ]
+    stacked = result.stack()
+    assert len(stacked) == sum(summary["NUM_SOURCES"])
+    assert "DETECT_THRESH" in stacked.colnames
+
+
+def test_run_sweep_without_background_reuse(dwarf_path):
+    """Test a sweep that recomputes the background for every grid point."""
+    result = sew.sweep.run_sweep(
+        dwarf_path, dict(BACK_SIZE=[32, 64]), reuse_background=False
+    )
+    assert len(result[32]) > 0
+    assert len(result[64]) == len(sew.run(dwarf_path, BACK_SIZE=64))
+
+
+def test_run_sweep_validates_grid_values(dwarf_pixels):
+    """Test the grid values go through the same option validation as run."""
+    with pytest.raises(sew.errors.SEWError):
+        sew.sweep.run_sweep(dwarf_pixels, dict(CATALOG_TYPE=["FITS_LDAC", "VOTABLE"]))
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from scipy.spatial import cKDTree
+
+import sew
+from sew import tiling
+
+
+def test_make_tiles_cover_image():
+    """Test the tile core regions partition the image."""
+    coverage = np.zeros((250, 310), dtype=int)
+    for tile in tiling.make_tiles(coverage.shape, tile_size=100, overlap=20):
+        coverage[tile.core_slices] += 1
+        assert tile.y_start >= 0 and tile.x_stop <= coverage.shape[1]
+    assert np.all(coverage == 1)
+
+
+def test_run_tiled_single_tile(dwarf_pixels):
+    """Test a tiled run with a single tile matches a normal run."""
+    cat = sew.run(dwarf_pixels)
+    tiled_cat = tiling.run_tiled(dwarf_pixels, tile_size=1000)
+    assert len(tiled_cat) == len(cat)
+    assert np.allclose(tiled_cat["X_IMAGE"], cat["X_IMAGE"])
+
+
+def test_run_tiled_from_path(dwarf_path, dwarf_pixels):
+    """Test a tiled run of a memory-mapped fits file matches a run of its pixels."""
+    cat = tiling.run_tiled(dwarf_path, tile_size=200, overlap=50)
+    pixels_cat = tiling.run_tiled(dwarf_pixels, tile_size=200, overlap=50)
+    assert len(cat) == len(pixels_cat)
+    assert np.allclose(cat["X_IMAGE"], pixels_cat["X_IMAGE"])
+
+
+def test_run_tiled_rejects_catalog_file_path(dwarf_pixels, tmp_path):
+    """Test the tiles cannot share a catalog file."""
+    with pytest.raises(sew.errors.SEWError):
+        tiling.run_tiled(dwarf_pixels, catalog_file_path=tmp_path / "tiles.cat")
+
+
+def test_run_tiled_drops_duplicates(dwarf_pixels):
+    """Test positions are in the mosaic frame and overlap duplicates are dropped."""
+    cat = tiling.run_tiled(dwarf_pixels, tile_size=200, overlap=50, max_workers=4)
+    xy = np.column_stack([cat["X_IMAGE"], cat["Y_IMAGE"]])
+    assert xy.min() >= 0.5 and xy.max() <= dwarf_pixels.shape[0] + 0.5
+    assert xy[:, 0].max() > 400 and xy[:, 1].max() > 400
+    assert len(cKDTree(xy).query_pairs(0.5)) == 0
+
+
+def test_create_tiled_object_mask(dwarf_pixels):
+    """Test the stitched object mask has the shape of the image."""
+    mask = tiling.create_tiled_object_mask(dwarf_pixels, tile_size=128, overlap=32)
+    assert mask.shape == dwarf_pixels.shape
+    assert mask.dtype == bool
+    assert mask.sum() > 0